@@ -0,0 +1,112 @@
+import argparse
+import fnmatch
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from decoder_8086 import disassemble_file
+
+
+class DisassemblyResult:
+    def __init__(self, file_name: str, output_file_name: Optional[str], seconds: float, error: Optional[str]):
+        self.file_name = file_name
+        self.output_file_name = output_file_name
+        self.seconds = seconds
+        self.error = error
+
+    def __str__(self):
+        if self.error is not None:
+            return f'FAILED  {self.seconds * 1000:8.2f}ms  {self.file_name}: {self.error}'
+        return f'ok      {self.seconds * 1000:8.2f}ms  {self.file_name} -> {self.output_file_name}'
+
+
+def disassemble_file_timed(file_name: str) -> DisassemblyResult:
+    start: float = time.perf_counter()
+    output_file_name: str = f'{file_name}_my.asm'
+    # written under a temporary name and moved into place once complete, so a failure neither leaves a partial disassembly behind
+    # nor removes the one from an earlier run
+    temporary_output_file_name: str = f'{output_file_name}.{os.getpid()}.tmp'
+    try:
+        disassemble_file(file_name, temporary_output_file_name)
+        os.replace(temporary_output_file_name, output_file_name)
+        return DisassemblyResult(file_name, output_file_name, time.perf_counter() - start, None)
+    except Exception as e:
+        if os.path.exists(temporary_output_file_name):
+            os.remove(temporary_output_file_name)
+        return DisassemblyResult(file_name, None, time.perf_counter() - start, f'{type(e).__name__}: {e}')
+
+
+def is_listing_binary(file_name: str) -> bool:
+    # listing binaries have no extension, which also skips the .asm sources and *_my.asm outputs next to them
+    return os.path.splitext(file_name)[1] == ''
+
+
+def collect_files_from_directory(directory: str, pattern: Optional[str]) -> list[str]:
+    file_names: list[str] = []
+    for entry in sorted(os.scandir(directory), key=lambda dir_entry: dir_entry.name):
+        if not entry.is_file():
+            continue
+        if pattern is not None and not fnmatch.fnmatch(entry.name, pattern):
+            continue
+        if pattern is None and not is_listing_binary(entry.name):
+            continue
+        file_names.append(entry.path)
+    return file_names
+
+
+def collect_files_from_manifest(manifest_file_name: str) -> list[str]:
+    # one path per line, relative paths are resolved against the manifest's directory
+    manifest_directory: str = os.path.dirname(manifest_file_name)
+    file_names: list[str] = []
+    with open(manifest_file_name, 'r') as manifest_file:
+        for line in manifest_file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            file_names.append(line if os.path.isabs(line) else os.path.join(manifest_directory, line))
+    return file_names
+
+
+def disassemble_files(file_names: list[str], max_workers: Optional[int] = None) -> list[DisassemblyResult]:
+    max_workers = max_workers if max_workers is not None else os.cpu_count() or 1
+    if max_workers == 1:
+        return [disassemble_file_timed(file_name) for file_name in file_names]
+
+    # batch several small files per task so the pool's IPC does not dominate
+    chunk_size: int = max(1, min(64, len(file_names) // (max_workers * 4)))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(disassemble_file_timed, file_names, chunksize=chunk_size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Disassemble many 8086 binaries in a worker pool, writing <file>_my.asm next to each one')
+    parser.add_argument('source', help='directory of binaries or a manifest file listing one binary per line')
+    parser.add_argument('--pattern', default=None, help='glob for files to pick from a directory, defaults to files without an extension')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--quiet', action='store_true', help='only report failures and the summary')
+    args = parser.parse_args()
+
+    if os.path.isdir(args.source):
+        file_names: list[str] = collect_files_from_directory(args.source, args.pattern)
+    else:
+        file_names: list[str] = collect_files_from_manifest(args.source)
+
+    start: float = time.perf_counter()
+    results: list[DisassemblyResult] = disassemble_files(file_names, args.workers)
+    wall_seconds: float = time.perf_counter() - start
+
+    failures: list[DisassemblyResult] = [result for result in results if result.error is not None]
+    for result in results:
+        if not args.quiet or result.error is not None:
+            print(result)
+
+    decode_seconds: float = sum(result.seconds for result in results)
+    print(f'{len(results)} files, {len(failures)} failed, {decode_seconds:.3f}s decoding, {wall_seconds:.3f}s wall')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
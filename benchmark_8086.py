@@ -0,0 +1,267 @@
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import tracemalloc
+from typing import Callable, Optional
+
+from benchmark_parallel_decode import time_call
+from byte_reader import ByteReader
+from decoded_program_8086 import DecodedProgram, decode_to_program
+from disassembly_formatter_8086 import write_disassembly
+from instruction_decoder_8086 import decode
+from processor_8086 import Processor8086
+
+BENCHMARK_FORMAT_VERSION: int = 1
+DEFAULT_IMAGE_NUM_BYTES: int = 64 * 1024
+DEFAULT_NUM_SIMULATED_INSTRUCTIONS: int = 500_000
+DEFAULT_REGRESSION_THRESHOLD: float = 0.10
+# simulated images are loops of this many random instructions, each run this many times
+LOOP_BODY_NUM_INSTRUCTIONS: int = 12
+LOOP_NUM_ITERATIONS: int = 500
+DEFAULT_NUM_LOOPS: int = 64
+
+# reg field values, cx and ch are left out of destinations because they hold the loop counter in simulated images
+WORD_DESTINATION_REGISTERS: tuple[int, ...] = (0, 2, 3, 4, 5, 6, 7)
+BYTE_DESTINATION_REGISTERS: tuple[int, ...] = (0, 2, 3, 4, 6, 7)
+# reg field of the 80/81/83 immediate group, and the base opcode of the reg/mem forms and the accumulator immediate forms
+ALU_IMMEDIATE_REG_FIELDS: tuple[int, ...] = (0b000, 0b101, 0b111)  # add, sub, cmp
+ALU_BASE_OPCODES: tuple[int, ...] = (0x00, 0x28, 0x38)
+LOOP_COUNTER_START_BYTES: bytes = bytes([0xb9]) + LOOP_NUM_ITERATIONS.to_bytes(2, 'little')  # mov cx, LOOP_NUM_ITERATIONS
+LOOP_COUNTER_DECREMENT_BYTES: bytes = bytes([0x83, 0xe9, 0x01])  # sub cx, 1
+JNE_OPCODE: int = 0x75
+
+
+def encode_memory_mod_r_m(random_generator: random.Random, reg: int) -> bytes:
+    # a random effective address with no, byte or word displacement, including the direct address form
+    mod: int = random_generator.randrange(3)
+    r_m: int = random_generator.randrange(8)
+    if mod == 0b00 and r_m == 0b110:
+        return bytes([reg << 3 | r_m]) + random_generator.randrange(0x10000).to_bytes(2, 'little')
+    mod_r_m: bytes = bytes([mod << 6 | reg << 3 | r_m])
+    if mod == 0b01:
+        return mod_r_m + random_generator.randrange(0x100).to_bytes(1, 'little')
+    if mod == 0b10:
+        return mod_r_m + random_generator.randrange(0x10000).to_bytes(2, 'little')
+    return mod_r_m
+
+
+def encode_destination_register(random_generator: random.Random, is_word: bool) -> int:
+    return random_generator.choice(WORD_DESTINATION_REGISTERS if is_word else BYTE_DESTINATION_REGISTERS)
+
+
+def encode_mov_register_or_memory(random_generator: random.Random) -> bytes:
+    is_word: bool = random_generator.random() < 0.5
+    if random_generator.random() < 0.5:
+        # register to register, d set so reg is the destination
+        return bytes([0x8a | is_word, 0b11 << 6 | encode_destination_register(random_generator, is_word) << 3 | random_generator.randrange(8)])
+    if random_generator.random() < 0.5:
+        return bytes([0x8a | is_word]) + encode_memory_mod_r_m(random_generator, encode_destination_register(random_generator, is_word))
+    return bytes([0x88 | is_word]) + encode_memory_mod_r_m(random_generator, random_generator.randrange(8))
+
+
+def encode_immediate_to_memory(random_generator: random.Random) -> bytes:
+    if random_generator.random() < 0.5:
+        is_word: bool = random_generator.random() < 0.5
+        immediate_bytes: bytes = random_generator.randrange(0x10000).to_bytes(2, 'little') if is_word else bytes([random_generator.randrange(0x100)])
+        return bytes([0xc6 | is_word]) + encode_memory_mod_r_m(random_generator, 0b000) + immediate_bytes
+    opcode: int = random_generator.choice((0x80, 0x81, 0x83))
+    immediate_bytes: bytes = random_generator.randrange(0x10000).to_bytes(2, 'little') if opcode == 0x81 else bytes([random_generator.randrange(0x100)])
+    return bytes([opcode]) + encode_memory_mod_r_m(random_generator, random_generator.choice(ALU_IMMEDIATE_REG_FIELDS)) + immediate_bytes
+
+
+def encode_add_sub_cmp(random_generator: random.Random) -> bytes:
+    is_word: bool = random_generator.random() < 0.5
+    form: float = random_generator.random()
+    if form < 0.4:
+        base_opcode: int = random_generator.choice(ALU_BASE_OPCODES)
+        return bytes([base_opcode | 0b10 | is_word, 0b11 << 6 | encode_destination_register(random_generator, is_word) << 3 | random_generator.randrange(8)])
+    if form < 0.7:
+        opcode: int = random_generator.choice((0x80, 0x81, 0x83))
+        is_word = opcode != 0x80
+        immediate_bytes: bytes = random_generator.randrange(0x10000).to_bytes(2, 'little') if opcode == 0x81 else bytes([random_generator.randrange(0x100)])
+        mod_r_m: int = 0b11 << 6 | random_generator.choice(ALU_IMMEDIATE_REG_FIELDS) << 3 | encode_destination_register(random_generator, is_word)
+        return bytes([opcode, mod_r_m]) + immediate_bytes
+    if form < 0.85:
+        # the accumulator immediate forms
+        immediate_bytes: bytes = random_generator.randrange(0x10000).to_bytes(2, 'little') if is_word else bytes([random_generator.randrange(0x100)])
+        return bytes([random_generator.choice(ALU_BASE_OPCODES) | 0b100 | is_word]) + immediate_bytes
+    return bytes([random_generator.choice(ALU_BASE_OPCODES) | 0b10 | is_word]) + encode_memory_mod_r_m(random_generator,
+                                                                                                       encode_destination_register(random_generator, is_word))
+
+
+def encode_jump_over_next_instruction(random_generator: random.Random) -> bytes:
+    # a conditional jump that either falls through to or skips the instruction after it, so any path stays on instruction boundaries
+    skipped_instruction: bytes = encode_add_sub_cmp(random_generator)
+    return bytes([random_generator.randrange(0x70, 0x80), len(skipped_instruction)]) + skipped_instruction
+
+
+instruction_encoders: dict[str, Callable[[random.Random], bytes]] = {
+    'mov': encode_mov_register_or_memory,
+    'immediate_to_memory': encode_immediate_to_memory,
+    'add_sub_cmp': encode_add_sub_cmp,
+    'jumps': encode_jump_over_next_instruction,
+}
+# instruction mixes as encoder weights, 'mixed' is roughly what compiled 8086 code looks like
+instruction_mixes: dict[str, dict[str, float]] = {
+    'mov': {'mov': 1.0},
+    'immediate_to_memory': {'immediate_to_memory': 1.0},
+    'add_sub_cmp': {'add_sub_cmp': 1.0},
+    'jumps': {'jumps': 0.6, 'add_sub_cmp': 0.4},
+    'mixed': {'mov': 0.45, 'add_sub_cmp': 0.25, 'immediate_to_memory': 0.1, 'jumps': 0.2},
+}
+
+
+def generate_instructions(random_generator: random.Random, mix_name: str) -> bytes:
+    mix: dict[str, float] = instruction_mixes[mix_name]
+    encoder_name: str = random_generator.choices(list(mix), weights=list(mix.values()))[0]
+    return instruction_encoders[encoder_name](random_generator)
+
+
+def generate_image(mix_name: str, num_bytes: int, seed: int = 0) -> bytes:
+    # a straight run of random instructions from the mix, at least num_bytes long
+    random_generator: random.Random = random.Random(seed)
+    image: bytearray = bytearray()
+    while len(image) < num_bytes:
+        image += generate_instructions(random_generator, mix_name)
+    return bytes(image)
+
+
+def generate_loop_image(mix_name: str, num_loops: int = DEFAULT_NUM_LOOPS, seed: int = 0) -> bytes:
+    # loops of random instructions from the mix that count cx down, for simulating without jumping out of the program
+    random_generator: random.Random = random.Random(seed)
+    image: bytearray = bytearray()
+    for _ in range(num_loops):
+        image += LOOP_COUNTER_START_BYTES
+        loop_start: int = len(image)
+        for _ in range(LOOP_BODY_NUM_INSTRUCTIONS):
+            image += generate_instructions(random_generator, mix_name)
+        image += LOOP_COUNTER_DECREMENT_BYTES
+        jump_offset: int = loop_start - (len(image) + 2)
+        if jump_offset < -128:
+            raise ValueError(f'The loop body of mix {mix_name} is too long for a short jump')
+        image += bytes([JNE_OPCODE, jump_offset & 0xff])
+    return bytes(image)
+
+
+class BenchmarkResult:
+    def __init__(self, name: str, value: float, unit: str, higher_is_better: bool):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def __str__(self):
+        return f'{self.name:<40} {self.value:>14.2f} {self.unit}'
+
+    def to_json_dict(self) -> dict:
+        return {'value': self.value, 'unit': self.unit, 'higher_is_better': self.higher_is_better}
+
+
+def measure_peak_memory(function: Callable[[], object]) -> int:
+    # run outside of the timed calls since tracing every allocation slows them down
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_decode_benchmarks(mix_name: str, image: bytes, repeat: int) -> list[BenchmarkResult]:
+    megabytes: float = len(image) / (1024 * 1024)
+    decode_seconds, _ = time_call(lambda: decode(ByteReader(image)), repeat)
+    decode_to_program_seconds, program = time_call(lambda: decode_to_program(ByteReader(image)), repeat)
+    format_seconds, _ = time_call(lambda: write_disassembly(program, io.StringIO()), repeat)
+    return [
+        BenchmarkResult(f'{mix_name}/decode', megabytes / decode_seconds, 'MB/s', True),
+        BenchmarkResult(f'{mix_name}/decode_to_program', megabytes / decode_to_program_seconds, 'MB/s', True),
+        BenchmarkResult(f'{mix_name}/format', len(program) / format_seconds, 'lines/s', True),
+        BenchmarkResult(f'{mix_name}/decode_peak_memory', measure_peak_memory(lambda: decode(ByteReader(image))) / (1024 * 1024), 'MB', False),
+        BenchmarkResult(f'{mix_name}/decode_to_program_peak_memory', measure_peak_memory(lambda: decode_to_program(ByteReader(image))) / (1024 * 1024), 'MB',
+                        False),
+    ]
+
+
+def run_simulate_benchmark(mix_name: str, loop_image: bytes, num_instructions: int, repeat: int) -> list[BenchmarkResult]:
+    program: DecodedProgram = decode_to_program(ByteReader(loop_image))
+
+    def simulate() -> int:
+        processor: Processor8086 = Processor8086()
+        processor.load_program_image(loop_image)
+        processor.load_operation_stream(program)
+        return processor.simulate(num_instructions)
+
+    seconds, num_simulated_instructions = time_call(simulate, repeat)
+    return [BenchmarkResult(f'{mix_name}/simulate', num_simulated_instructions / seconds, 'instructions/s', True)]
+
+
+def find_regressions(results: dict[str, dict], baseline: dict[str, dict], threshold: float) -> list[str]:
+    regressions: list[str] = []
+    for name, result in results.items():
+        baseline_result: Optional[dict] = baseline.get(name)
+        if baseline_result is None or not baseline_result['value']:
+            continue
+        ratio: float = result['value'] / baseline_result['value']
+        change: float = ratio - 1 if result['higher_is_better'] else 1 - ratio
+        if change < -threshold:
+            regressions.append(f'{name}: {baseline_result["value"]:.2f} -> {result["value"]:.2f} {result["unit"]} ({change * 100:+.1f}%)')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark decoding, formatting and simulating synthetic 8086 images')
+    parser.add_argument('--mix', action='append', choices=list(instruction_mixes), default=[], help='instruction mix to run, may be repeated, defaults to all')
+    parser.add_argument('--image-bytes', type=int, default=DEFAULT_IMAGE_NUM_BYTES, help='size of each generated image')
+    parser.add_argument('--simulate-instructions', type=int, default=DEFAULT_NUM_SIMULATED_INSTRUCTIONS)
+    parser.add_argument('--repeat', type=int, default=3, help='keep the best of this many runs')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None, help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD, help='fraction a result may get worse before it is a regression')
+    parser.add_argument('--write-image', default=None, help='write the generated image of the first mix to this file and exit')
+    args = parser.parse_args()
+    mix_names: list[str] = args.mix or list(instruction_mixes)
+
+    if args.write_image is not None:
+        with open(args.write_image, 'wb') as image_file:
+            image_file.write(generate_image(mix_names[0], args.image_bytes, args.seed))
+        return
+
+    results: list[BenchmarkResult] = []
+    for mix_name in mix_names:
+        mix_results: list[BenchmarkResult] = run_decode_benchmarks(mix_name, generate_image(mix_name, args.image_bytes, args.seed), args.repeat)
+        mix_results += run_simulate_benchmark(mix_name, generate_loop_image(mix_name, seed=args.seed), args.simulate_instructions, args.repeat)
+        for result in mix_results:
+            print(result)
+        results += mix_results
+
+    results_json: dict = {
+        'version': BENCHMARK_FORMAT_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'image_bytes': args.image_bytes,
+        'simulate_instructions': args.simulate_instructions,
+        'results': {result.name: result.to_json_dict() for result in results},
+    }
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            json.dump(results_json, output_file, indent=2)
+            output_file.write('\n')
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline_json: dict = json.load(baseline_file)
+        regressions: list[str] = find_regressions(results_json['results'], baseline_json['results'], args.threshold)
+        if regressions:
+            print(f'{len(regressions)} regressions beyond {args.threshold * 100:.0f}% against {args.baseline}:')
+            for regression in regressions:
+                print(f'\t{regression}')
+            sys.exit(1)
+        print(f'No regressions beyond {args.threshold * 100:.0f}% against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+import os
+import time
+
+from byte_reader import ByteReader, open_mapped_file
+from instruction_decoder_8086 import decode
+from parallel_decoder_8086 import decode_parallel
+
+
+def time_call(function, repeat: int):
+    best_seconds: float = float('inf')
+    result = None
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        result = function()
+        best_seconds = min(best_seconds, time.perf_counter() - start)
+    return best_seconds, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sequential decode() against decode_parallel()')
+    parser.add_argument('file_name')
+    parser.add_argument('--tile', type=int, default=1, help='repeat the file contents this many times to build a larger input')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-bytes', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with open_mapped_file(args.file_name) as file_bytes:
+        input_bytes: bytes = bytes(file_bytes) * args.tile
+
+    megabytes: float = len(input_bytes) / (1024 * 1024)
+    sequential_seconds, operations = time_call(lambda: decode(ByteReader(input_bytes)), args.repeat)
+    parallel_seconds, program = time_call(lambda: decode_parallel(input_bytes, args.workers, args.chunk_bytes), args.repeat)
+
+    identical: bool = len(operations) == len(program) and all(
+        str(operation) == str(program_operation) and operation.num_bytes == program_operation.num_bytes
+        for operation, program_operation in zip(operations, program)
+    )
+
+    print(f'input: {len(input_bytes)} bytes, {len(operations)} instructions, {args.workers} workers')
+    print(f'sequential decode(): {sequential_seconds:.3f}s  {megabytes / sequential_seconds:.2f} MB/s')
+    print(f'decode_parallel():   {parallel_seconds:.3f}s  {megabytes / parallel_seconds:.2f} MB/s')
+    print(f'speedup: {sequential_seconds / parallel_seconds:.2f}x')
+    print(f'output identical: {identical}')
+
+
+if __name__ == '__main__':
+    main()
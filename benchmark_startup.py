@@ -0,0 +1,62 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+# mov cx, bx
+TINY_PROGRAM_BYTES: bytes = bytes([0x89, 0xd9])
+SCRIPT_DIRECTORY: str = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_NAMES: tuple[str, ...] = ('decoder_8086.py', 'simulator_8086.py')
+
+
+def time_cold_starts(commands: list[list[str]], num_runs: int) -> list[list[float]]:
+    # each run is a fresh interpreter, so this is the latency of one command line invocation. The commands take turns
+    # so a machine that gets busier or quieter partway through affects all of them alike.
+    seconds: list[list[float]] = [[] for _ in commands]
+    for _ in range(num_runs):
+        for command, command_seconds in zip(commands, seconds):
+            start: float = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            command_seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def format_timing(name: str, seconds: list[float], interpreter_seconds: list[float]) -> str:
+    return f'{name:<40} min {min(seconds) * 1000:7.2f}ms  median {statistics.median(seconds) * 1000:7.2f}ms  ' \
+           f'over interpreter start {(statistics.median(seconds) - statistics.median(interpreter_seconds)) * 1000:7.2f}ms'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the cold start latency of the decoder and simulator command lines on a tiny binary')
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--script', action='append', choices=SCRIPT_NAMES, default=[], help='command line to time, may be repeated, defaults to both')
+    parser.add_argument('--file', default=None, help='binary to run on instead of a generated two byte program')
+    parser.add_argument('--baseline-dir', default=None, help='also time the scripts in this directory, such as an older checkout, taking turns with these')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_directory:
+        file_name: Optional[str] = args.file
+        if file_name is None:
+            file_name = os.path.join(temp_directory, 'tiny')
+            with open(file_name, 'wb') as tiny_file:
+                tiny_file.write(TINY_PROGRAM_BYTES)
+
+        names: list[str] = ['python -c pass']
+        commands: list[list[str]] = [[sys.executable, '-c', 'pass']]
+        for script_name in args.script or SCRIPT_NAMES:
+            directories: list[str] = [SCRIPT_DIRECTORY] if args.baseline_dir is None else [args.baseline_dir, SCRIPT_DIRECTORY]
+            for directory in directories:
+                names.append(script_name if args.baseline_dir is None else f'{script_name} ({"baseline" if directory == args.baseline_dir else "current"})')
+                commands.append([sys.executable, os.path.join(directory, script_name), file_name])
+
+        seconds: list[list[float]] = time_cold_starts(commands, args.runs)
+    for name, command_seconds in zip(names, seconds):
+        print(format_timing(name, command_seconds, seconds[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,43 +1,95 @@
-from bit_manipulation_helpers import convert_to_s8, convert_to_s16
+import contextlib
+import mmap
+import struct
+from typing import Iterator, Union
+
+from bit_manipulation_helpers import convert_to_s8
+
+ByteBuffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+byte_buffer_types: tuple[type, ...] = (bytes, bytearray, memoryview, mmap.mmap)
+
+
+class ByteReaderOutOfRangeError(IndexError):
+    pass
+
+
+u16_struct: struct.Struct = struct.Struct('<H')
+s16_struct: struct.Struct = struct.Struct('<h')
 
 
 class ByteReader:
-    def __init__(self, bytes_array: bytes):
-        self.bytes_array: bytes = bytes_array
+    def __init__(self, bytes_array: ByteBuffer):
+        if isinstance(bytes_array, memoryview) and (bytes_array.format != 'B' or bytes_array.ndim != 1):
+            bytes_array = bytes_array.cast('B')
+        self.bytes_array: ByteBuffer = bytes_array
+        self.num_bytes: int = len(bytes_array)
         self.index = 0
 
+    def remaining(self) -> int:
+        return self.num_bytes - self.index
+
+    def ensure_available(self, count: int) -> None:
+        if self.index + count > self.num_bytes:
+            raise ByteReaderOutOfRangeError(f'Attempting to read {count} bytes at index {self.index} with only {self.num_bytes - self.index} bytes left')
+
     def peek_as_u8(self, offset: int = 0) -> int:
-        assert 0 <= self.index + offset < len(self.bytes_array), 'Attempting to peek outside bytes'
+        if not 0 <= self.index + offset < self.num_bytes:
+            raise ByteReaderOutOfRangeError('Attempting to peek outside bytes')
         result: int = self.bytes_array[self.index + offset]
         return result
 
     def read_next_byte_as_u8(self) -> int:
-        assert self.index < len(self.bytes_array), 'Attempting to read past last byte'
+        self.ensure_available(1)
         result: int = self.bytes_array[self.index]
         self.index += 1
         return result
 
     def read_next_byte_as_s8(self) -> int:
-        assert self.index < len(self.bytes_array), 'Attempting to read past last byte'
+        self.ensure_available(1)
         result: int = self.bytes_array[self.index]
         self.index += 1
         return convert_to_s8(result)
 
     def read_next_two_byte_as_u16(self) -> int:
-        assert self.index < len(self.bytes_array) - 1, 'Attempting to read past last byte'
-        lo_byte: int = self.bytes_array[self.index]
-        hi_byte: int = self.bytes_array[self.index + 1]
-        result: int = hi_byte * 256 + lo_byte
+        self.ensure_available(2)
+        result: int = u16_struct.unpack_from(self.bytes_array, self.index)[0]
         self.index += 2
         return result
 
     def read_next_two_byte_as_s16(self) -> int:
-        assert self.index < len(self.bytes_array) - 1, 'Attempting to read past last byte'
-        lo_byte: int = self.bytes_array[self.index]
-        hi_byte: int = self.bytes_array[self.index + 1]
-        result: int = hi_byte * 256 + lo_byte
+        self.ensure_available(2)
+        result: int = s16_struct.unpack_from(self.bytes_array, self.index)[0]
         self.index += 2
-        return convert_to_s16(result)
+        return result
+
+    # The unchecked reads skip bounds checks, callers must call ensure_available for the whole run of reads first
+
+    def peek_as_u8_unchecked(self, offset: int = 0) -> int:
+        return self.bytes_array[self.index + offset]
+
+    def read_next_byte_as_u8_unchecked(self) -> int:
+        index: int = self.index
+        self.index = index + 1
+        return self.bytes_array[index]
+
+    def read_next_byte_as_s8_unchecked(self) -> int:
+        index: int = self.index
+        self.index = index + 1
+        result: int = self.bytes_array[index]
+        return result - 256 if result >= 128 else result
+
+    def read_next_two_byte_as_u16_unchecked(self) -> int:
+        index: int = self.index
+        self.index = index + 2
+        return u16_struct.unpack_from(self.bytes_array, index)[0]
+
+    def read_next_two_byte_as_s16_unchecked(self) -> int:
+        index: int = self.index
+        self.index = index + 2
+        return s16_struct.unpack_from(self.bytes_array, index)[0]
+
+    def read_one_or_two_bytes_as_u8_or_u16_unchecked(self, is_word) -> int:
+        return self.read_next_two_byte_as_u16_unchecked() if is_word else self.read_next_byte_as_u8_unchecked()
 
     def read_one_or_two_bytes_as_u8_or_u16(self, is_word) -> int:
         return self.read_next_two_byte_as_u16() if is_word else self.read_next_byte_as_u8()
@@ -49,4 +101,15 @@ class ByteReader:
         self.index = index
 
     def is_at_end(self) -> bool:
-        return self.index == len(self.bytes_array)
+        return self.index == self.num_bytes
+
+
+@contextlib.contextmanager
+def open_mapped_file(file_name: str) -> Iterator[ByteBuffer]:
+    with open(file_name, 'rb') as file:
+        file.seek(0, 2)
+        if file.tell() == 0:  # empty files cannot be mapped
+            yield b''
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            yield mapped_file
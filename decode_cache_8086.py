@@ -0,0 +1,177 @@
+import collections
+import os
+import struct
+from typing import Optional
+
+from byte_reader import ByteReader, ByteBuffer
+from decoded_program_8086 import DecodedProgram, decode_to_program
+from instruction_decoder_8086 import DECODER_VERSION
+
+DEFAULT_MAX_MEMORY_BYTES: int = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES: int = 1024 * 1024 * 1024
+CACHE_DIRECTORY_ENVIRONMENT_VARIABLE: str = 'DECODER_8086_CACHE_DIR'
+CACHE_FILE_EXTENSION: str = '.d86cache'
+
+cache_file_header_struct: struct.Struct = struct.Struct('<4sI')
+cache_file_magic: bytes = b'D86C'
+
+
+def get_cache_key(file_bytes: ByteBuffer) -> str:
+    import hashlib  # imported on first use so a run without a cache does not pay for it
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+class DecodeCache:
+    def __init__(self, cache_directory: Optional[str] = None, max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES, max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self.cache_directory: Optional[str] = cache_directory  # None keeps the cache in memory only
+        self.max_memory_bytes: int = max_memory_bytes
+        self.max_disk_bytes: int = max_disk_bytes
+        self.memory_entries: collections.OrderedDict[str, DecodedProgram] = collections.OrderedDict()
+        self.memory_bytes: int = 0
+        # running estimate of the bytes on disk, scanned on the first write and whenever it goes over max_disk_bytes. Other processes sharing
+        # the directory are only seen by the scans, so the directory can go over the limit until one of them scans.
+        self.disk_bytes: Optional[int] = None
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get_or_decode(self, file_bytes: ByteBuffer) -> DecodedProgram:
+        key: str = get_cache_key(file_bytes)
+        program: Optional[DecodedProgram] = self.get(key)
+        if program is None:
+            program = decode_to_program(ByteReader(file_bytes))
+            self.put(key, program)
+        return program
+
+    def get(self, key: str) -> Optional[DecodedProgram]:
+        program: Optional[DecodedProgram] = self.memory_entries.get(key)
+        if program is not None:
+            self.memory_entries.move_to_end(key)
+            self.hits += 1
+            return program
+
+        program = self._read_from_disk(key)
+        if program is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._put_in_memory(key, program)
+        return program
+
+    def put(self, key: str, program: DecodedProgram) -> None:
+        self._put_in_memory(key, program)
+        self._write_to_disk(key, program)
+
+    def clear_memory(self) -> None:
+        self.memory_entries.clear()
+        self.memory_bytes = 0
+
+    def _put_in_memory(self, key: str, program: DecodedProgram) -> None:
+        num_bytes: int = program.get_num_bytes_in_memory()
+        if num_bytes > self.max_memory_bytes:
+            return
+
+        previous_program: Optional[DecodedProgram] = self.memory_entries.pop(key, None)
+        if previous_program is not None:
+            self.memory_bytes -= previous_program.get_num_bytes_in_memory()
+
+        self.memory_entries[key] = program
+        self.memory_bytes += num_bytes
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted_program = self.memory_entries.popitem(last=False)
+            self.memory_bytes -= evicted_program.get_num_bytes_in_memory()
+
+    def _get_cache_file_name(self, key: str) -> str:
+        return os.path.join(self.cache_directory, key[:2], f'{key}{CACHE_FILE_EXTENSION}')
+
+    def _read_from_disk(self, key: str) -> Optional[DecodedProgram]:
+        if self.cache_directory is None:
+            return None
+
+        cache_file_name: str = self._get_cache_file_name(key)
+        try:
+            with open(cache_file_name, 'rb') as cache_file:
+                cache_file_bytes: bytes = cache_file.read()
+        except OSError:
+            return None  # not cached, or not readable by this process
+
+        try:
+            magic, decoder_version = cache_file_header_struct.unpack_from(cache_file_bytes, 0)
+            if magic != cache_file_magic or decoder_version != DECODER_VERSION:
+                raise ValueError('Stale cache entry')
+            program: DecodedProgram = DecodedProgram.from_bytes(cache_file_bytes[cache_file_header_struct.size:])
+        except (ValueError, struct.error):
+            remove_cache_file(cache_file_name)
+            return None
+
+        try:
+            os.utime(cache_file_name)  # the modification time doubles as the last use time for eviction
+        except OSError:
+            pass  # evicted by another process since the read, or a read only cache directory
+        return program
+
+    def _write_to_disk(self, key: str, program: DecodedProgram) -> None:
+        if self.cache_directory is None:
+            return
+
+        cache_file_bytes: bytes = cache_file_header_struct.pack(cache_file_magic, DECODER_VERSION) + program.to_bytes()
+        if len(cache_file_bytes) > self.max_disk_bytes:
+            return
+
+        cache_file_name: str = self._get_cache_file_name(key)
+        import tempfile  # imported on first write, it pulls in shutil and random
+        try:
+            os.makedirs(os.path.dirname(cache_file_name), exist_ok=True)
+            # write then rename so a concurrent reader never sees a partial entry
+            file_descriptor, temp_file_name = tempfile.mkstemp(dir=os.path.dirname(cache_file_name))
+            try:
+                with os.fdopen(file_descriptor, 'wb') as temp_file:
+                    temp_file.write(cache_file_bytes)
+                os.replace(temp_file_name, cache_file_name)
+            except OSError:
+                remove_cache_file(temp_file_name)
+                raise
+        except OSError:
+            return  # a read only or full cache directory only loses the disk copy
+
+        if self.disk_bytes is not None:
+            self.disk_bytes += len(cache_file_bytes)
+        if self.disk_bytes is None or self.disk_bytes > self.max_disk_bytes:
+            self._evict_from_disk()
+
+    def _evict_from_disk(self) -> None:
+        cache_files: list[tuple[float, int, str]] = []
+        for directory_path, _, file_names in os.walk(self.cache_directory):
+            for file_name in file_names:
+                if not file_name.endswith(CACHE_FILE_EXTENSION):
+                    continue
+                path: str = os.path.join(directory_path, file_name)
+                try:
+                    stat_result: os.stat_result = os.stat(path)
+                except OSError:
+                    continue  # evicted by another process during the walk
+                cache_files.append((stat_result.st_mtime, stat_result.st_size, path))
+
+        total_bytes: int = sum(size for _, size, _ in cache_files)
+        for _, size, path in sorted(cache_files):
+            if total_bytes <= self.max_disk_bytes:
+                break
+            if remove_cache_file(path):
+                total_bytes -= size
+        self.disk_bytes = total_bytes
+
+
+def remove_cache_file(path: str) -> bool:
+    # false when the file is still there, such as in a read only directory, a file another process removed first counts as removed
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+def create_decode_cache(cache_directory: Optional[str] = None) -> Optional[DecodeCache]:
+    cache_directory = cache_directory if cache_directory is not None else os.environ.get(CACHE_DIRECTORY_ENVIRONMENT_VARIABLE)
+    return DecodeCache(cache_directory) if cache_directory else None
@@ -0,0 +1,154 @@
+from __future__ import annotations
+import struct
+from array import array
+from typing import Iterable, Iterator, Optional
+
+from byte_reader import ByteReader
+from instruction_decoder_8086 import decode_operation, Operation, Operand, OperandType, InstructionType, RegisterMnemonic, EffectiveAddress, EffectiveAddressCalculation, \
+    r_m_to_effective_address_calculation_mod_00_map, r_m_to_effective_address_calculation_mod_01_map, r_m_to_effective_address_calculation_mod_10_map
+
+effective_address_calculations: tuple[EffectiveAddressCalculation, ...] = tuple(
+    [EffectiveAddressCalculation.direct_address]
+    + [calculation for calculation in r_m_to_effective_address_calculation_mod_00_map.values() if not calculation.is_direct_address]
+    + list(r_m_to_effective_address_calculation_mod_01_map.values())
+    + list(r_m_to_effective_address_calculation_mod_10_map.values())
+)
+
+effective_address_calculation_to_index_map: dict[EffectiveAddressCalculation, int] = {
+    calculation: index for index, calculation in enumerate(effective_address_calculations)
+}
+
+instruction_types: tuple[InstructionType, ...] = tuple(InstructionType)
+operand_types: tuple[OperandType, ...] = tuple(OperandType)
+register_mnemonics: tuple[RegisterMnemonic, ...] = tuple(RegisterMnemonic)
+
+
+serialized_program_magic: bytes = b'D86P'
+serialized_program_header_struct: struct.Struct = struct.Struct('<4sI')
+serialized_column_header_struct: struct.Struct = struct.Struct('<cBQ')
+
+
+# Decoded instructions stored column-wise, Operation objects are only built when an instruction is accessed
+class DecodedProgram:
+    column_names: tuple[str, ...] = (
+        'instruction_types', 'operand_one_types', 'operand_two_types', 'operand_one_values', 'operand_two_values', 'displacements', 'has_displacements', 'num_bytes',
+        'base_clocks',
+    )
+
+    def __init__(self):
+        self.instruction_types: array = array('B')
+        self.operand_one_types: array = array('B')
+        self.operand_two_types: array = array('B')
+        # register id, effective address calculation index or literal value depending on the operand type
+        self.operand_one_values: array = array('i')
+        self.operand_two_values: array = array('i')
+        # an instruction has at most one effective address operand so both operands share these columns
+        self.displacements: array = array('i')
+        self.has_displacements: array = array('B')
+        self.num_bytes: array = array('B')
+        self.base_clocks: array = array('B')
+
+    @classmethod
+    def from_operations(cls, operations: Iterable[Operation]) -> DecodedProgram:
+        program: DecodedProgram = cls()
+        for operation in operations:
+            program.append(operation)
+        return program
+
+    def __len__(self) -> int:
+        return len(self.instruction_types)
+
+    def __getitem__(self, index: int) -> Operation:
+        operation: Operation = Operation()
+        operation.instruction_type = instruction_types[self.instruction_types[index]]
+        operation.operand_one = self._create_operand(self.operand_one_types[index], self.operand_one_values[index], index)
+        operation.operand_two = self._create_operand(self.operand_two_types[index], self.operand_two_values[index], index)
+        operation.num_bytes = self.num_bytes[index]
+        operation.base_clocks = self.base_clocks[index]
+        return operation
+
+    def __iter__(self) -> Iterator[Operation]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def append(self, operation: Operation) -> None:
+        self.instruction_types.append(operation.instruction_type.value)
+
+        operand_one_value, operand_one_displacement = self._pack_operand(operation.operand_one)
+        self.operand_one_types.append(operation.operand_one.operand_type.value)
+        self.operand_one_values.append(operand_one_value)
+
+        operand_two_value, operand_two_displacement = self._pack_operand(operation.operand_two)
+        self.operand_two_types.append(operation.operand_two.operand_type.value)
+        self.operand_two_values.append(operand_two_value)
+
+        displacement: Optional[int] = operand_one_displacement if operand_one_displacement is not None else operand_two_displacement
+        self.displacements.append(displacement if displacement is not None else 0)
+        self.has_displacements.append(displacement is not None)
+        self.num_bytes.append(operation.num_bytes)
+        self.base_clocks.append(operation.base_clocks)
+
+    def extend(self, other: DecodedProgram, start: int = 0) -> None:
+        for column_name in DecodedProgram.column_names:
+            getattr(self, column_name).extend(getattr(other, column_name)[start:])
+
+    def get_num_bytes_in_memory(self) -> int:
+        return sum(len(column) * column.itemsize for column in (getattr(self, column_name) for column_name in DecodedProgram.column_names))
+
+    def to_bytes(self) -> bytes:
+        parts: list[bytes] = [serialized_program_header_struct.pack(serialized_program_magic, len(self))]
+        for column_name in DecodedProgram.column_names:
+            column: array = getattr(self, column_name)
+            column_bytes: bytes = column.tobytes()
+            parts.append(serialized_column_header_struct.pack(column.typecode.encode(), column.itemsize, len(column_bytes)))
+            parts.append(column_bytes)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, serialized_bytes: bytes) -> DecodedProgram:
+        program: DecodedProgram = cls()
+        magic, num_operations = serialized_program_header_struct.unpack_from(serialized_bytes, 0)
+        if magic != serialized_program_magic:
+            raise ValueError('Not a serialized decoded program')
+
+        offset: int = serialized_program_header_struct.size
+        for column_name in DecodedProgram.column_names:
+            column: array = getattr(program, column_name)
+            typecode, itemsize, num_column_bytes = serialized_column_header_struct.unpack_from(serialized_bytes, offset)
+            offset += serialized_column_header_struct.size
+            if typecode.decode() != column.typecode or itemsize != column.itemsize:
+                raise ValueError(f'Serialized column {column_name} does not match this platform\'s layout')
+            column.frombytes(serialized_bytes[offset:offset + num_column_bytes])
+            offset += num_column_bytes
+            if len(column) != num_operations:
+                raise ValueError(f'Serialized column {column_name} is truncated')
+        return program
+
+    @staticmethod
+    def _pack_operand(operand: Operand) -> (int, Optional[int]):
+        if operand.operand_type is OperandType.NONE:
+            return 0, None
+        if operand.operand_type is OperandType.REGISTER:
+            return operand.value.value, None
+        if operand.operand_type is OperandType.EFFECTIVE_ADDRESS:
+            effective_address: EffectiveAddress = operand.value
+            return effective_address_calculation_to_index_map[effective_address.effective_address_calculation], effective_address.displacement
+        return operand.value, None
+
+    def _create_operand(self, operand_type_value: int, value: int, index: int) -> Operand:
+        operand_type: OperandType = operand_types[operand_type_value]
+        if operand_type is OperandType.NONE:
+            return Operand()
+        if operand_type is OperandType.REGISTER:
+            return Operand(operand_type, register_mnemonics[value])
+        if operand_type is OperandType.EFFECTIVE_ADDRESS:
+            displacement: Optional[int] = self.displacements[index] if self.has_displacements[index] else None
+            return Operand(operand_type, EffectiveAddress(effective_address_calculations[value], displacement))
+        return Operand(operand_type, value)
+
+
+def decode_to_program(byte_reader: ByteReader) -> DecodedProgram:
+    program: DecodedProgram = DecodedProgram()
+    while not byte_reader.is_at_end():
+        program.append(decode_operation(byte_reader))
+    return program
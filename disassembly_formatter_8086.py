@@ -0,0 +1,111 @@
+import itertools
+from typing import Iterable, Iterator, Optional, TextIO
+
+from decoded_program_8086 import DecodedProgram, effective_address_calculations, effective_address_calculation_to_index_map
+from instruction_decoder_8086 import Operation, Operand, OperandType, InstructionType, RegisterMnemonic, EffectiveAddress, EffectiveAddressCalculation
+
+DEFAULT_WRITE_BATCH_NUM_LINES: int = 4096
+MAX_MEMOIZED_EFFECTIVE_ADDRESS_STRS: int = 1 << 16
+
+REGISTER_OPERAND_TYPE_VALUE: int = OperandType.REGISTER.value
+EFFECTIVE_ADDRESS_OPERAND_TYPE_VALUE: int = OperandType.EFFECTIVE_ADDRESS.value
+LITERAL_VALUE_OFFSET_OPERAND_TYPE_VALUE: int = OperandType.LITERAL_VALUE_OFFSET.value
+LITERAL_VALUE_BYTE_OPERAND_TYPE_VALUE: int = OperandType.LITERAL_VALUE_BYTE.value
+LITERAL_VALUE_WORD_OPERAND_TYPE_VALUE: int = OperandType.LITERAL_VALUE_WORD.value
+
+instruction_type_strs: tuple[str, ...] = tuple(str(instruction_type) for instruction_type in InstructionType)
+register_mnemonic_strs: tuple[str, ...] = tuple(str(register_mnemonic) for register_mnemonic in RegisterMnemonic)
+
+
+def create_effective_address_str(effective_address_calculation: EffectiveAddressCalculation, displacement: Optional[int]) -> str:
+    return str(EffectiveAddress(effective_address_calculation, displacement))
+
+
+def create_jmp_offset_str(value: int) -> str:
+    relative_adjusted_value = value + 2  # have to adjust encode value because nasm automatically subtracts 2 in its $ synstax
+    sign: str = '+' if relative_adjusted_value >= 0 else '-'
+    return f'${sign}{abs(relative_adjusted_value)}'
+
+
+class DisassemblyFormatter:
+    # Produces the same text as Operation.get_decode_str but memoizes effective address strings and skips building
+    # Operation objects when formatting straight from a DecodedProgram
+    def __init__(self):
+        self.effective_address_strs: dict[tuple[EffectiveAddressCalculation, Optional[int]], str] = {}
+
+    def get_effective_address_str(self, effective_address_calculation: EffectiveAddressCalculation, displacement: Optional[int]) -> str:
+        key: tuple[EffectiveAddressCalculation, Optional[int]] = (effective_address_calculation, displacement)
+        result: Optional[str] = self.effective_address_strs.get(key)
+        if result is None:
+            if len(self.effective_address_strs) >= MAX_MEMOIZED_EFFECTIVE_ADDRESS_STRS:
+                self.effective_address_strs.clear()
+            result = create_effective_address_str(effective_address_calculation, displacement)
+            self.effective_address_strs[key] = result
+        return result
+
+    def get_operand_str(self, operand_type_value: int, value: int, displacement: Optional[int]) -> str:
+        if operand_type_value == REGISTER_OPERAND_TYPE_VALUE:
+            return register_mnemonic_strs[value]
+        if operand_type_value == EFFECTIVE_ADDRESS_OPERAND_TYPE_VALUE:
+            return self.get_effective_address_str(effective_address_calculations[value], displacement)
+        if operand_type_value == LITERAL_VALUE_OFFSET_OPERAND_TYPE_VALUE:
+            return create_jmp_offset_str(value)
+        return str(value)
+
+    def format_line(self, instruction_type_value: int, operand_one_type_value: int, operand_one_value: int, operand_two_type_value: int, operand_two_value: int,
+                    displacement: Optional[int]) -> str:
+        operand_one_str: str = self.get_operand_str(operand_one_type_value, operand_one_value, displacement)
+
+        if operand_two_type_value == LITERAL_VALUE_BYTE_OPERAND_TYPE_VALUE or operand_two_type_value == LITERAL_VALUE_WORD_OPERAND_TYPE_VALUE:
+            #  check for whether an explicit immediate value is required
+            if operand_one_type_value == EFFECTIVE_ADDRESS_OPERAND_TYPE_VALUE:
+                size_str: str = 'word' if operand_two_type_value == LITERAL_VALUE_WORD_OPERAND_TYPE_VALUE else 'byte'
+                return f'{instruction_type_strs[instruction_type_value]} {operand_one_str}, {size_str}  {operand_two_value}'
+            return f'{instruction_type_strs[instruction_type_value]} {operand_one_str}, {operand_two_value}'
+        if operand_two_type_value == REGISTER_OPERAND_TYPE_VALUE or operand_two_type_value == EFFECTIVE_ADDRESS_OPERAND_TYPE_VALUE:
+            operand_two_str: str = self.get_operand_str(operand_two_type_value, operand_two_value, displacement)
+            return f'{instruction_type_strs[instruction_type_value]} {operand_one_str}, {operand_two_str}'
+        return f'{instruction_type_strs[instruction_type_value]} {operand_one_str}'
+
+    def format_program(self, program: DecodedProgram) -> Iterator[str]:
+        format_line = self.format_line
+        for instruction_type_value, operand_one_type_value, operand_one_value, operand_two_type_value, operand_two_value, displacement, has_displacement in zip(
+                program.instruction_types, program.operand_one_types, program.operand_one_values, program.operand_two_types, program.operand_two_values,
+                program.displacements, program.has_displacements):
+            yield format_line(instruction_type_value, operand_one_type_value, operand_one_value, operand_two_type_value, operand_two_value,
+                              displacement if has_displacement else None)
+
+    def format_operation(self, operation: Operation) -> str:
+        displacement: Optional[int] = None
+        operand_one_value: int = self._get_operand_value(operation.operand_one)
+        operand_two_value: int = self._get_operand_value(operation.operand_two)
+        if operation.operand_one.operand_type is OperandType.EFFECTIVE_ADDRESS:
+            displacement = operation.operand_one.value.displacement
+        elif operation.operand_two.operand_type is OperandType.EFFECTIVE_ADDRESS:
+            displacement = operation.operand_two.value.displacement
+        return self.format_line(operation.instruction_type.value, operation.operand_one.operand_type.value, operand_one_value,
+                                operation.operand_two.operand_type.value, operand_two_value, displacement)
+
+    def format_operations(self, operations: Iterable[Operation]) -> Iterator[str]:
+        if isinstance(operations, DecodedProgram):
+            return self.format_program(operations)
+        return (self.format_operation(operation) for operation in operations)
+
+    @staticmethod
+    def _get_operand_value(operand: Operand) -> int:
+        if operand.operand_type is OperandType.REGISTER:
+            return operand.value.value
+        if operand.operand_type is OperandType.EFFECTIVE_ADDRESS:
+            return effective_address_calculation_to_index_map[operand.value.effective_address_calculation]
+        return operand.value
+
+
+def write_disassembly(operations: Iterable[Operation], output_file: TextIO, batch_num_lines: int = DEFAULT_WRITE_BATCH_NUM_LINES) -> None:
+    output_file.write('bits 16\n')
+    lines: Iterator[str] = DisassemblyFormatter().format_operations(operations)
+    # join a batch of lines per write instead of building the whole listing in memory
+    batch: list[str] = list(itertools.islice(lines, batch_num_lines))
+    while batch:
+        batch.append('')
+        output_file.write('\n'.join(batch))
+        batch = list(itertools.islice(lines, batch_num_lines))
@@ -0,0 +1,152 @@
+import gzip
+import struct
+from array import array
+from typing import BinaryIO, Iterator, Optional, Union
+
+from decoded_program_8086 import DecodedProgram
+from disassembly_formatter_8086 import DisassemblyFormatter
+from instruction_decoder_8086 import Operation
+from processor_8086 import Processor8086, TraceSink, get_changed_register_mask, register_file_register_types
+
+TRACE_FORMAT_VERSION: int = 3
+TRACE_BUFFER_NUM_BYTES: int = 1024 * 1024
+NUM_REGISTERS: int = len(register_file_register_types)
+
+trace_file_magic: bytes = b'D86T'
+gzip_magic: bytes = b'\x1f\x8b'
+
+# magic, format version, register count, instruction count
+trace_header_struct: struct.Struct = struct.Struct('<4sHHI')
+# initial register values and flags before the first step
+trace_initial_state_struct: struct.Struct = struct.Struct(f'<{NUM_REGISTERS}HH')
+instruction_text_num_bytes_struct: struct.Struct = struct.Struct('<H')
+# 16 bit IP before and after, operation index, changed register mask and flags, followed by the new value of each register in the mask in register order
+trace_record_header_struct: struct.Struct = struct.Struct('<HHIHH')
+# by the number of changed registers
+changed_register_values_structs: tuple[struct.Struct, ...] = tuple(struct.Struct(f'<{num_registers}H') for num_registers in range(NUM_REGISTERS + 1))
+# register indices of each changed register mask, filled in as masks are seen
+changed_register_indices_by_mask: dict[int, tuple[int, ...]] = {}
+
+
+def get_changed_register_indices(changed_register_mask: int) -> tuple[int, ...]:
+    changed_register_indices: Optional[tuple[int, ...]] = changed_register_indices_by_mask.get(changed_register_mask)
+    if changed_register_indices is None:
+        if changed_register_mask >> NUM_REGISTERS:
+            raise ValueError(f'Changed register mask {changed_register_mask:#x} names registers past the {NUM_REGISTERS} in the trace')
+        changed_register_indices = tuple(index for index in range(NUM_REGISTERS) if changed_register_mask >> index & 1)
+        changed_register_indices_by_mask[changed_register_mask] = changed_register_indices
+    return changed_register_indices
+
+
+class TraceRecord:
+    __slots__ = ('instruction_ptr_before', 'instruction_ptr_after', 'operation_index', 'changed_register_mask', 'flags_value', 'registers')
+
+    def __init__(self, instruction_ptr_before: int, instruction_ptr_after: int, operation_index: int, changed_register_mask: int, flags_value: int,
+                 registers: tuple[int, ...]):
+        self.instruction_ptr_before = instruction_ptr_before
+        self.instruction_ptr_after = instruction_ptr_after
+        self.operation_index = operation_index
+        self.changed_register_mask = changed_register_mask
+        self.flags_value = flags_value
+        self.registers = registers
+
+
+def open_trace_file_for_writing(file_name: str, compress: bool) -> BinaryIO:
+    return gzip.open(file_name, 'wb', compresslevel=6) if compress else open(file_name, 'wb')
+
+
+def open_trace_file_for_reading(file_name: str) -> BinaryIO:
+    with open(file_name, 'rb') as trace_file:
+        is_compressed: bool = trace_file.read(len(gzip_magic)) == gzip_magic
+    return gzip.open(file_name, 'rb') if is_compressed else open(file_name, 'rb')
+
+
+def write_trace_header(output_file: BinaryIO, operation_stream: Union[list[Operation], DecodedProgram], processor: Processor8086) -> None:
+    # the instruction text is stored once up front so records only carry an operation index
+    header: bytearray = bytearray(trace_header_struct.pack(trace_file_magic, TRACE_FORMAT_VERSION, NUM_REGISTERS, len(operation_stream)))
+    header += trace_initial_state_struct.pack(*processor.registers, processor.get_flags_value())
+    for line in DisassemblyFormatter().format_operations(operation_stream):
+        line_bytes: bytes = line.encode('ascii')
+        header += instruction_text_num_bytes_struct.pack(len(line_bytes))
+        header += line_bytes
+    output_file.write(header)
+
+
+class BinaryTraceSink(TraceSink):
+    def __init__(self, output_file: BinaryIO, processor: Processor8086, buffer_num_bytes: int = TRACE_BUFFER_NUM_BYTES):
+        self.output_file: BinaryIO = output_file
+        self.buffer_num_bytes: int = buffer_num_bytes
+        self.buffer: bytearray = bytearray()
+        self.previous_registers: array = processor.get_register_snapshot()
+        write_trace_header(output_file, processor.operation_stream, processor)
+
+    def on_step(self, processor: Processor8086, operation_index: int, instruction_ptr_before: int) -> None:
+        registers: array = processor.registers
+        changed_register_mask: int = get_changed_register_mask(self.previous_registers, registers) if registers != self.previous_registers else 0
+        self.buffer += trace_record_header_struct.pack(instruction_ptr_before, processor.instruction_ptr, operation_index, changed_register_mask,
+                                                       processor.get_flags_value())
+        if changed_register_mask:
+            self.previous_registers = processor.get_register_snapshot()
+            changed_register_indices: tuple[int, ...] = get_changed_register_indices(changed_register_mask)
+            self.buffer += changed_register_values_structs[len(changed_register_indices)].pack(*(registers[index] for index in changed_register_indices))
+        if len(self.buffer) >= self.buffer_num_bytes:
+            self.flush()
+
+    def flush(self) -> None:
+        self.output_file.write(self.buffer)
+        self.buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.output_file.close()
+
+
+class TraceReader:
+    def __init__(self, input_file: BinaryIO):
+        self.input_file: BinaryIO = input_file
+        magic, version, num_registers, num_instructions = trace_header_struct.unpack(self._read_exactly(trace_header_struct.size))
+        if magic != trace_file_magic:
+            raise ValueError('Not an 8086 execution trace')
+        if version != TRACE_FORMAT_VERSION or num_registers != NUM_REGISTERS:
+            raise ValueError(f'Unsupported trace format version {version} with {num_registers} registers')
+
+        *initial_registers, initial_flags_value = trace_initial_state_struct.unpack(self._read_exactly(trace_initial_state_struct.size))
+        self.initial_registers: tuple[int, ...] = tuple(initial_registers)
+        self.initial_flags_value: int = initial_flags_value
+        self.instruction_texts: list[str] = []
+        for _ in range(num_instructions):
+            line_num_bytes, = instruction_text_num_bytes_struct.unpack(self._read_exactly(instruction_text_num_bytes_struct.size))
+            self.instruction_texts.append(self._read_exactly(line_num_bytes).decode('ascii'))
+
+    def _read_exactly(self, num_bytes: int) -> bytes:
+        data: bytes = self.input_file.read(num_bytes)
+        if len(data) != num_bytes:
+            raise ValueError('Trace file is truncated')
+        return data
+
+    def iter_records(self) -> Iterator[TraceRecord]:
+        # records only carry the registers that changed, the full register state is rebuilt from the initial one
+        registers: list[int] = list(self.initial_registers)
+        header_num_bytes: int = trace_record_header_struct.size
+        data: bytes = b''
+        offset: int = 0
+        while True:
+            chunk: bytes = self.input_file.read(TRACE_BUFFER_NUM_BYTES)
+            if not chunk:
+                break
+            data = data[offset:] + chunk
+            offset = 0
+            while len(data) - offset >= header_num_bytes:
+                instruction_ptr_before, instruction_ptr_after, operation_index, changed_register_mask, flags_value = \
+                    trace_record_header_struct.unpack_from(data, offset)
+                changed_register_indices: tuple[int, ...] = get_changed_register_indices(changed_register_mask)
+                changed_register_values_struct: struct.Struct = changed_register_values_structs[len(changed_register_indices)]
+                if len(data) - offset < header_num_bytes + changed_register_values_struct.size:
+                    break
+                for index, value in zip(changed_register_indices, changed_register_values_struct.unpack_from(data, offset + header_num_bytes)):
+                    registers[index] = value
+                offset += header_num_bytes + changed_register_values_struct.size
+                yield TraceRecord(instruction_ptr_before, instruction_ptr_after, operation_index, changed_register_mask, flags_value, tuple(registers))
+        if offset < len(data):
+            raise ValueError('Trace file ends with a partial record')
+
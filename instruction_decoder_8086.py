@@ -0,0 +1,820 @@
+from __future__ import annotations
+
+import enum
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, Optional, Union
+from byte_reader import ByteReader, ByteBuffer, byte_buffer_types
+
+
+DECODER_VERSION: int = 6  # bump whenever decoded output changes so cached decodes are invalidated
+
+
+class DecodeError(ValueError):
+    pass
+
+
+class RegisterMnemonic(enum.Enum):
+    NONE = 0
+    AL = enum.auto()
+    AH = enum.auto()
+    AX = enum.auto()
+    BL = enum.auto()
+    BH = enum.auto()
+    BX = enum.auto()
+    CL = enum.auto()
+    CH = enum.auto()
+    CX = enum.auto()
+    DL = enum.auto()
+    DH = enum.auto()
+    DX = enum.auto()
+    SP = enum.auto()
+    BP = enum.auto()
+    SI = enum.auto()
+    DI = enum.auto()
+    CS = enum.auto()
+    DS = enum.auto()
+    SS = enum.auto()
+    ES = enum.auto()
+
+    def __str__(self):
+        return self.name.lower()
+
+
+reg_to_register_type_w0_map: Dict[int, RegisterMnemonic] = {
+    0b000: RegisterMnemonic.AL,
+    0b001: RegisterMnemonic.CL,
+    0b010: RegisterMnemonic.DL,
+    0b011: RegisterMnemonic.BL,
+    0b100: RegisterMnemonic.AH,
+    0b101: RegisterMnemonic.CH,
+    0b110: RegisterMnemonic.DH,
+    0b111: RegisterMnemonic.BH,
+}
+
+reg_to_register_type_w1_map: Dict[int, RegisterMnemonic] = {
+    0b000: RegisterMnemonic.AX,
+    0b001: RegisterMnemonic.CX,
+    0b010: RegisterMnemonic.DX,
+    0b011: RegisterMnemonic.BX,
+    0b100: RegisterMnemonic.SP,
+    0b101: RegisterMnemonic.BP,
+    0b110: RegisterMnemonic.SI,
+    0b111: RegisterMnemonic.DI,
+}
+
+sr_to_register_type_map: Dict[int, RegisterMnemonic] = {
+    0b000: RegisterMnemonic.ES,
+    0b001: RegisterMnemonic.CS,
+    0b010: RegisterMnemonic.SS,
+    0b011: RegisterMnemonic.DS,
+}
+
+
+def get_register_from_reg(reg: int, word_bit_set: bool) -> RegisterMnemonic:
+    if word_bit_set:
+        return reg_to_register_type_w1_map[reg]
+    else:
+        return reg_to_register_type_w0_map[reg]
+
+
+class DisplacementType(enum.Enum):
+    NONE = 0
+    EIGHT_BIT = enum.auto()
+    SIXTEEN_BIT = enum.auto()
+
+
+def get_effective_address_clocks(is_direct_address: bool, register_one: RegisterMnemonic, register_two: RegisterMnemonic, displacement_type: DisplacementType) -> int:
+    # 8086 effective address calculation clocks, added to the base clocks of every instruction with a memory operand
+    if is_direct_address:
+        return 6
+    has_displacement: bool = displacement_type is not DisplacementType.NONE
+    if register_two is RegisterMnemonic.NONE:
+        return 9 if has_displacement else 5
+    # BP + DI and BX + SI are one clock faster than BP + SI and BX + DI
+    is_fast_pair: bool = (register_one, register_two) in ((RegisterMnemonic.BP, RegisterMnemonic.DI), (RegisterMnemonic.BX, RegisterMnemonic.SI))
+    if has_displacement:
+        return 11 if is_fast_pair else 12
+    return 7 if is_fast_pair else 8
+
+
+class EffectiveAddressCalculation:
+    direct_address: EffectiveAddressCalculation = None
+
+    def __init__(self, is_direct_address: bool, register_one: RegisterMnemonic, register_two: RegisterMnemonic, displacement_type: DisplacementType):
+        self.is_direct_address = is_direct_address
+        self.register_one = register_one
+        self.register_two = register_two
+        self.displacement_type = displacement_type
+        self.clocks: int = get_effective_address_clocks(is_direct_address, register_one, register_two, displacement_type)
+
+    def has_displacement(self):
+        return self.displacement_type is not DisplacementType.NONE
+
+
+EffectiveAddressCalculation.direct_address = EffectiveAddressCalculation(True, RegisterMnemonic.NONE, RegisterMnemonic.NONE, DisplacementType.NONE)
+
+r_m_to_effective_address_calculation_mod_00_map: Dict[int, EffectiveAddressCalculation] = {
+    0b000: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.SI, DisplacementType.NONE),
+    0b001: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.DI, DisplacementType.NONE),
+    0b010: EffectiveAddressCalculation(False, RegisterMnemonic.BP, RegisterMnemonic.SI, DisplacementType.NONE),
+    0b011: EffectiveAddressCalculation(False, RegisterMnemonic.BP, RegisterMnemonic.DI, DisplacementType.NONE),
+    0b100: EffectiveAddressCalculation(False, RegisterMnemonic.SI, RegisterMnemonic.NONE, DisplacementType.NONE),
+    0b101: EffectiveAddressCalculation(False, RegisterMnemonic.DI, RegisterMnemonic.NONE, DisplacementType.NONE),
+    0b110: EffectiveAddressCalculation.direct_address,
+    0b111: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.NONE, DisplacementType.NONE),
+}
+
+r_m_to_effective_address_calculation_mod_01_map: Dict[int, EffectiveAddressCalculation] = {
+    0b000: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.SI, DisplacementType.EIGHT_BIT),
+    0b001: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.DI, DisplacementType.EIGHT_BIT),
+    0b010: EffectiveAddressCalculation(False, RegisterMnemonic.BP, RegisterMnemonic.SI, DisplacementType.EIGHT_BIT),
+    0b011: EffectiveAddressCalculation(False, RegisterMnemonic.BP, RegisterMnemonic.DI, DisplacementType.EIGHT_BIT),
+    0b100: EffectiveAddressCalculation(False, RegisterMnemonic.SI, RegisterMnemonic.NONE, DisplacementType.EIGHT_BIT),
+    0b101: EffectiveAddressCalculation(False, RegisterMnemonic.DI, RegisterMnemonic.NONE, DisplacementType.EIGHT_BIT),
+    0b110: EffectiveAddressCalculation(False, RegisterMnemonic.BP, RegisterMnemonic.NONE, DisplacementType.EIGHT_BIT),
+    0b111: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.NONE, DisplacementType.EIGHT_BIT),
+}
+
+r_m_to_effective_address_calculation_mod_10_map: Dict[int, EffectiveAddressCalculation] = {
+    0b000: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.SI, DisplacementType.SIXTEEN_BIT),
+    0b001: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.DI, DisplacementType.SIXTEEN_BIT),
+    0b010: EffectiveAddressCalculation(False, RegisterMnemonic.BP, RegisterMnemonic.SI, DisplacementType.SIXTEEN_BIT),
+    0b011: EffectiveAddressCalculation(False, RegisterMnemonic.BP, RegisterMnemonic.DI, DisplacementType.SIXTEEN_BIT),
+    0b100: EffectiveAddressCalculation(False, RegisterMnemonic.SI, RegisterMnemonic.NONE, DisplacementType.SIXTEEN_BIT),
+    0b101: EffectiveAddressCalculation(False, RegisterMnemonic.DI, RegisterMnemonic.NONE, DisplacementType.SIXTEEN_BIT),
+    0b110: EffectiveAddressCalculation(False, RegisterMnemonic.BP, RegisterMnemonic.NONE, DisplacementType.SIXTEEN_BIT),
+    0b111: EffectiveAddressCalculation(False, RegisterMnemonic.BX, RegisterMnemonic.NONE, DisplacementType.SIXTEEN_BIT),
+}
+
+
+class EffectiveAddress:
+    __slots__ = ('effective_address_calculation', 'displacement')
+
+    def __init__(self, effective_address_calculation: EffectiveAddressCalculation, displacement: Optional[int]):
+        self.effective_address_calculation = effective_address_calculation
+        self.displacement = displacement
+
+    def __str__(self) -> str:
+        return self._get_decode_str_with_displacement()
+
+    def _get_decode_str_with_displacement(self):
+        if self.effective_address_calculation.is_direct_address:
+            assert self.displacement is not None, 'Need a displacement for direct address'
+            return f'[{self.displacement}]'
+
+        if self.displacement is not None:
+            displacement_str_part: str = f'+ {self.displacement}' if self.displacement >= 0 else f'- {abs(self.displacement)}'
+            if self.effective_address_calculation.register_two is not RegisterMnemonic.NONE:
+                return f'[{self.effective_address_calculation.register_one} + {self.effective_address_calculation.register_two} {displacement_str_part}]'
+            else:
+                return f'[{self.effective_address_calculation.register_one} {displacement_str_part}]'
+
+        if self.effective_address_calculation.register_two is not RegisterMnemonic.NONE:
+            return f'[{self.effective_address_calculation.register_one} + {self.effective_address_calculation.register_two}]'
+        else:
+            return f'[{self.effective_address_calculation.register_one}]'
+
+
+def get_effective_address_calculation_from_r_m_mod(r_m: int, mod: int) -> EffectiveAddressCalculation:
+    assert mod != 0b11, 'Register to Register mode does not use effective address'
+    if mod == 0b00:  # no displacement
+        return r_m_to_effective_address_calculation_mod_00_map[r_m]
+    elif mod == 0b01:  # 8 bit offset
+        return r_m_to_effective_address_calculation_mod_01_map[r_m]
+    return r_m_to_effective_address_calculation_mod_10_map[r_m]  # 16 bit offset
+
+
+def explicit_applied_immediate_value_str(value: int, is_word: bool) -> str:
+    return f'word  {value}' if is_word else f'byte  {value}'
+
+
+class InstructionType(enum.Enum):
+    NONE = 0
+    MOV = enum.auto()
+    ADD = enum.auto()
+    SUB = enum.auto()
+    CMP = enum.auto()
+    JO = enum.auto()
+    JNO = enum.auto()
+    JB = enum.auto()
+    JAE = enum.auto()
+    JE = enum.auto()
+    JNE = enum.auto()
+    JBE = enum.auto()
+    JA = enum.auto()
+    JS = enum.auto()
+    JNS = enum.auto()
+    JP = enum.auto()
+    JNP = enum.auto()
+    JL = enum.auto()
+    JGE = enum.auto()
+    JLE = enum.auto()
+    JG = enum.auto()
+    LOOPNE = enum.auto()
+    LOOPE = enum.auto()
+    LOOP = enum.auto()
+    JCXZ = enum.auto()
+
+    def __str__(self):
+        return self.name.lower()
+
+    def is_jmp(self):
+        return self in [InstructionType.JO, InstructionType.JNO, InstructionType.JB, InstructionType.JAE, InstructionType.JE, InstructionType.JNE,
+                        InstructionType.JBE, InstructionType.JA, InstructionType.JS, InstructionType.JNS, InstructionType.JP, InstructionType.JNP,
+                        InstructionType.JL, InstructionType.JGE, InstructionType.JLE, InstructionType.JG]
+
+
+opcodes_to_jmp_instructions_map: Dict[int, InstructionType] = {
+    112: InstructionType.JO,
+    113: InstructionType.JNO,
+    114: InstructionType.JB,
+    115: InstructionType.JAE,
+    116: InstructionType.JE,
+    117: InstructionType.JNE,
+    118: InstructionType.JBE,
+    119: InstructionType.JA,
+    120: InstructionType.JS,
+    121: InstructionType.JNS,
+    122: InstructionType.JP,
+    123: InstructionType.JNP,
+    124: InstructionType.JL,
+    125: InstructionType.JGE,
+    126: InstructionType.JLE,
+    127: InstructionType.JG,
+    224: InstructionType.LOOPNE,
+    225: InstructionType.LOOPE,
+    226: InstructionType.LOOP,
+    227: InstructionType.JCXZ,
+}
+
+
+class OperandType(enum.Enum):
+    NONE = 0
+    REGISTER = enum.auto()
+    EFFECTIVE_ADDRESS = enum.auto()
+    LITERAL_VALUE_OFFSET = enum.auto()
+    LITERAL_VALUE_BYTE = enum.auto()
+    LITERAL_VALUE_WORD = enum.auto()
+
+    def is_immediate_value(self):
+        return self in [OperandType.LITERAL_VALUE_BYTE, OperandType.LITERAL_VALUE_WORD]
+
+    def is_reg_or_effective_address(self):
+        return self in [OperandType.REGISTER, OperandType.EFFECTIVE_ADDRESS]
+
+
+class Operand:
+    __slots__ = ('operand_type', 'value')
+
+    def __init__(self, operand_type: OperandType = OperandType.NONE, value: Union[RegisterMnemonic, EffectiveAddress, int, None] = None):
+        self.operand_type: OperandType = operand_type
+        self.value: Union[RegisterMnemonic, EffectiveAddressCalculation, int, None] = value
+
+    def __str__(self):
+        if self.operand_type is not OperandType.LITERAL_VALUE_OFFSET:
+            return str(self.value)
+        relative_adjusted_value = self.value + 2  # have to adjust encode value because nasm automatically subtracts 2 in its $ synstax
+        sign: str = '+' if relative_adjusted_value >= 0 else '-'
+        return f'${sign}{abs(relative_adjusted_value)}'
+
+
+class Operation:
+    __slots__ = ('instruction_type', 'operand_one', 'operand_two', 'num_bytes', 'base_clocks')
+
+    def __init__(self):
+        self.instruction_type: InstructionType = InstructionType.NONE
+        self.operand_one: Operand = Operand()
+        self.operand_two: Operand = Operand()
+        self.num_bytes: int = 0
+        self.base_clocks: int = 0  # 8086 clocks for the instruction form without effective address clocks, jumps count as not taken
+
+    def __str__(self):
+        return self.get_decode_str()
+
+    def __repr__(self):
+        return f'op({self.get_decode_str()})'
+
+    def get_decode_str(self):
+        operand_two_str: str = ''
+        if self.operand_two.operand_type.is_immediate_value():
+            immediate_value: int = self.operand_two.value
+            #  check for whether an explicit immediate value is required
+            if self.operand_one.operand_type == OperandType.EFFECTIVE_ADDRESS:
+                is_word: bool = self.operand_two.operand_type == OperandType.LITERAL_VALUE_WORD
+                operand_two_str = f', word  {immediate_value}' if is_word else f', byte  {immediate_value}'
+            else:
+                operand_two_str = f', {immediate_value}'
+        elif self.operand_two.operand_type.is_reg_or_effective_address():
+            operand_two_str = f', {self.operand_two.value}'
+
+        return f'{self.instruction_type} {self.operand_one}{operand_two_str}'
+
+
+def create_literal_value_operand(value: int, is_word: bool):
+    result: Operand = Operand()
+    result.operand_type = OperandType.LITERAL_VALUE_WORD if is_word else OperandType.LITERAL_VALUE_BYTE
+    result.value = value
+    return result
+
+
+def create_literal_value_offset_operand(value: int):
+    result: Operand = Operand()
+    result.operand_type = OperandType.LITERAL_VALUE_OFFSET
+    result.value = value
+    return result
+
+
+def create_register_operand(register_type: RegisterMnemonic):
+    result: Operand = Operand()
+    result.operand_type = OperandType.REGISTER
+    result.value = register_type
+    return result
+
+
+def create_effective_address_operand(effective_address_calculation: EffectiveAddressCalculation, displacement: Optional[int]):
+    result: Operand = Operand()
+    result.operand_type = OperandType.EFFECTIVE_ADDRESS
+    result.value = EffectiveAddress(effective_address_calculation, displacement)
+    return result
+
+
+class OpcodeForm(enum.Enum):
+    NONE = 0
+    IMM_TO_REG = enum.auto()
+    MEM_TO_ACC = enum.auto()
+    ACC_TO_MEM = enum.auto()
+    IMM_TO_ACC = enum.auto()
+    IMM_TO_REG_MEM = enum.auto()
+    REG_MEM_TO_FROM_REG = enum.auto()
+    JMP = enum.auto()
+
+
+class InstructionClocks:
+    # base clocks for the register only, memory source and memory destination variants of one instruction form
+    __slots__ = ('register', 'memory_source', 'memory_destination')
+
+    def __init__(self, register: int, memory_source: int, memory_destination: int):
+        self.register = register
+        self.memory_source = memory_source
+        self.memory_destination = memory_destination
+
+
+def create_fixed_instruction_clocks(clocks: int) -> InstructionClocks:
+    return InstructionClocks(clocks, clocks, clocks)
+
+
+instruction_form_clocks: Dict[tuple[InstructionType, OpcodeForm], InstructionClocks] = {
+    (InstructionType.MOV, OpcodeForm.REG_MEM_TO_FROM_REG): InstructionClocks(2, 8, 9),
+    (InstructionType.MOV, OpcodeForm.IMM_TO_REG_MEM): InstructionClocks(4, 10, 10),
+    (InstructionType.MOV, OpcodeForm.IMM_TO_REG): create_fixed_instruction_clocks(4),
+    # the accumulator forms take 10 clocks for either width with no ea, the direct address ea clocks added for the memory operand are taken back out here
+    (InstructionType.MOV, OpcodeForm.MEM_TO_ACC): create_fixed_instruction_clocks(10 - EffectiveAddressCalculation.direct_address.clocks),
+    (InstructionType.MOV, OpcodeForm.ACC_TO_MEM): create_fixed_instruction_clocks(10 - EffectiveAddressCalculation.direct_address.clocks),
+    (InstructionType.ADD, OpcodeForm.REG_MEM_TO_FROM_REG): InstructionClocks(3, 9, 16),
+    (InstructionType.ADD, OpcodeForm.IMM_TO_REG_MEM): InstructionClocks(4, 17, 17),
+    (InstructionType.ADD, OpcodeForm.IMM_TO_ACC): create_fixed_instruction_clocks(4),
+    (InstructionType.SUB, OpcodeForm.REG_MEM_TO_FROM_REG): InstructionClocks(3, 9, 16),
+    (InstructionType.SUB, OpcodeForm.IMM_TO_REG_MEM): InstructionClocks(4, 17, 17),
+    (InstructionType.SUB, OpcodeForm.IMM_TO_ACC): create_fixed_instruction_clocks(4),
+    (InstructionType.CMP, OpcodeForm.REG_MEM_TO_FROM_REG): InstructionClocks(3, 9, 9),
+    (InstructionType.CMP, OpcodeForm.IMM_TO_REG_MEM): InstructionClocks(4, 10, 10),
+    (InstructionType.CMP, OpcodeForm.IMM_TO_ACC): create_fixed_instruction_clocks(4),
+}
+for jmp_instruction_type in opcodes_to_jmp_instructions_map.values():
+    instruction_form_clocks[(jmp_instruction_type, OpcodeForm.JMP)] = create_fixed_instruction_clocks(4)
+instruction_form_clocks[(InstructionType.LOOP, OpcodeForm.JMP)] = create_fixed_instruction_clocks(5)
+instruction_form_clocks[(InstructionType.LOOPE, OpcodeForm.JMP)] = create_fixed_instruction_clocks(6)
+instruction_form_clocks[(InstructionType.LOOPNE, OpcodeForm.JMP)] = create_fixed_instruction_clocks(5)
+instruction_form_clocks[(InstructionType.JCXZ, OpcodeForm.JMP)] = create_fixed_instruction_clocks(6)
+
+# clocks for a jump that is taken, the base clocks above are the not taken ones
+jmp_taken_clocks: Dict[InstructionType, int] = {jmp_instruction_type: 16 for jmp_instruction_type in opcodes_to_jmp_instructions_map.values()}
+jmp_taken_clocks[InstructionType.LOOP] = 17
+jmp_taken_clocks[InstructionType.LOOPE] = 18
+jmp_taken_clocks[InstructionType.LOOPNE] = 19
+jmp_taken_clocks[InstructionType.JCXZ] = 18
+
+
+class OpcodeDecodeEntry:
+    def __init__(self, opcode: int, handler: Callable[[ByteReader, OpcodeDecodeEntry], Operation], instruction_type: InstructionType, opcode_form: OpcodeForm,
+                 dst_bit_set: bool, word_bit_set: bool, sign_extension_bit_set: bool, reg: int, immediate_num_bytes: int):
+        self.opcode = opcode
+        self.handler = handler
+        self.instruction_type = instruction_type  # NONE when the instruction type is encoded in the reg field of the following byte
+        self.opcode_form = opcode_form
+        self.dst_bit_set = dst_bit_set
+        self.word_bit_set = word_bit_set
+        self.sign_extension_bit_set = sign_extension_bit_set
+        self.reg = reg
+        self.has_mod_reg_r_m: bool = opcode_form in (OpcodeForm.IMM_TO_REG_MEM, OpcodeForm.REG_MEM_TO_FROM_REG)
+        self.immediate_num_bytes = immediate_num_bytes  # immediate, address or jump offset bytes that follow any displacement
+        # None when the instruction type comes from the reg field, the clocks are then looked up per decoded instruction
+        self.instruction_clocks: Optional[InstructionClocks] = instruction_form_clocks.get((instruction_type, opcode_form))
+
+
+def decode(byte_reader: ByteReader) -> list[Operation]:
+    operations: list[Operation] = []
+    while not byte_reader.is_at_end():
+        operations.append(decode_operation(byte_reader))
+    return operations
+
+
+MAX_INSTRUCTION_NUM_BYTES: int = 6  # opcode, mod reg r/m, 16 bit displacement and 16 bit immediate
+DEFAULT_DECODE_CHUNK_NUM_BYTES: int = 64 * 1024
+
+ByteSource = Union[ByteBuffer, BinaryIO, Iterable[bytes]]
+
+
+def iter_byte_chunks(source: ByteSource, chunk_num_bytes: int = DEFAULT_DECODE_CHUNK_NUM_BYTES) -> Iterator[bytes]:
+    if isinstance(source, byte_buffer_types):
+        yield source
+    elif hasattr(source, 'read'):
+        chunk: bytes = source.read(chunk_num_bytes)
+        while chunk:
+            yield chunk
+            chunk = source.read(chunk_num_bytes)
+    else:
+        yield from source
+
+
+def iter_decode(source: ByteSource, chunk_num_bytes: int = DEFAULT_DECODE_CHUNK_NUM_BYTES) -> Iterator[Operation]:
+    if isinstance(source, byte_buffer_types):
+        byte_reader: ByteReader = ByteReader(source)
+        while not byte_reader.is_at_end():
+            yield decode_operation(byte_reader)
+        return
+
+    pending_bytes: bytes = b''
+    byte_reader: ByteReader = ByteReader(pending_bytes)
+    for chunk in iter_byte_chunks(source, chunk_num_bytes):
+        pending_bytes = pending_bytes[byte_reader.index:] + chunk
+        byte_reader = ByteReader(pending_bytes)
+        # hold back a possibly partial instruction at the end of the chunk until the next chunk arrives
+        while len(pending_bytes) - byte_reader.index >= MAX_INSTRUCTION_NUM_BYTES:
+            yield decode_operation(byte_reader)
+
+    while not byte_reader.is_at_end():
+        yield decode_operation(byte_reader)
+
+
+def get_instruction_num_bytes(byte_reader: ByteReader) -> int:
+    opcode_decode_entry: Optional[OpcodeDecodeEntry] = opcode_decode_table[byte_reader.peek_as_u8()]
+    if opcode_decode_entry is None:
+        return 1
+    if not opcode_decode_entry.has_mod_reg_r_m:
+        return 1 + opcode_decode_entry.immediate_num_bytes
+    return 2 + mod_reg_r_m_table[byte_reader.peek_as_u8(1)].displacement_num_bytes + opcode_decode_entry.immediate_num_bytes
+
+
+def decode_operation(byte_reader: ByteReader) -> Operation:
+    byte_reader_start_index = byte_reader.index
+
+    # bounds are checked once per instruction so the handlers can use the unchecked reads
+    if byte_reader.num_bytes - byte_reader_start_index < MAX_INSTRUCTION_NUM_BYTES:
+        byte_reader.ensure_available(get_instruction_num_bytes(byte_reader))
+
+    current_byte: int = byte_reader.peek_as_u8_unchecked()
+    opcode_decode_entry: Optional[OpcodeDecodeEntry] = opcode_decode_table[current_byte]
+    if opcode_decode_entry is None:
+        raise DecodeError(f'Unknown opcode {current_byte} at index {byte_reader_start_index}')
+
+    operation: Operation = opcode_decode_entry.handler(byte_reader, opcode_decode_entry)
+
+    byte_reader_end_index: int = byte_reader.index
+    operation.num_bytes = byte_reader_end_index - byte_reader_start_index
+
+    instruction_clocks: Optional[InstructionClocks] = opcode_decode_entry.instruction_clocks
+    if instruction_clocks is None:
+        instruction_clocks = instruction_form_clocks[(operation.instruction_type, opcode_decode_entry.opcode_form)]
+    if operation.operand_one.operand_type is OperandType.EFFECTIVE_ADDRESS:
+        operation.base_clocks = instruction_clocks.memory_destination
+    elif operation.operand_two.operand_type is OperandType.EFFECTIVE_ADDRESS:
+        operation.base_clocks = instruction_clocks.memory_source
+    else:
+        operation.base_clocks = instruction_clocks.register
+    return operation
+
+
+def read_displacement(byte_reader: ByteReader, displacement_type: DisplacementType) -> Optional[int]:
+    if displacement_type is DisplacementType.NONE:
+        return None
+    if displacement_type is DisplacementType.EIGHT_BIT:
+        return byte_reader.read_next_byte_as_s8_unchecked()
+    return byte_reader.read_next_two_byte_as_s16_unchecked()
+
+
+def get_mod_reg_r_m_from_byte(current_byte: int) -> (int, int, int):
+    return current_byte >> 6, (current_byte >> 3) & 0b111, current_byte & 0b111
+
+
+displacement_type_to_num_bytes_map: Dict[DisplacementType, int] = {
+    DisplacementType.NONE: 0,
+    DisplacementType.EIGHT_BIT: 1,
+    DisplacementType.SIXTEEN_BIT: 2,
+}
+
+
+class ModRegRMEntry:
+    def __init__(self, mod: int, reg: int, r_m: int, displacement_type: DisplacementType, effective_address_calculation: Optional[EffectiveAddressCalculation]):
+        self.mod = mod
+        self.reg = reg
+        self.r_m = r_m
+        self.displacement_type = displacement_type  # width of the displacement that follows, including the direct address
+        self.displacement_num_bytes: int = displacement_type_to_num_bytes_map[displacement_type]
+        self.effective_address_calculation = effective_address_calculation  # None in register to register mode
+
+
+def create_mod_reg_r_m_entry(mod_reg_r_m_byte: int) -> ModRegRMEntry:
+    mod, reg, r_m = get_mod_reg_r_m_from_byte(mod_reg_r_m_byte)
+    if mod == 0b11:
+        return ModRegRMEntry(mod, reg, r_m, DisplacementType.NONE, None)
+
+    effective_address_calculation: EffectiveAddressCalculation = get_effective_address_calculation_from_r_m_mod(r_m, mod)
+    displacement_type: DisplacementType = DisplacementType.SIXTEEN_BIT if effective_address_calculation.is_direct_address else effective_address_calculation.displacement_type
+    return ModRegRMEntry(mod, reg, r_m, displacement_type, effective_address_calculation)
+
+
+mod_reg_r_m_table: tuple[ModRegRMEntry, ...] = tuple(create_mod_reg_r_m_entry(mod_reg_r_m_byte) for mod_reg_r_m_byte in range(256))
+
+
+class ImmToMemRegType(enum.Enum):
+    NONE = 0
+    BYTE = enum.auto()
+    WORD = enum.auto()
+
+
+def handle_operands_for_imm_to_reg_mem(byte_reader: ByteReader, opcode_decode_entry: OpcodeDecodeEntry, possible_sign_extension: bool) -> (Operand, Operand):
+    mod_reg_r_m_entry: ModRegRMEntry = mod_reg_r_m_table[byte_reader.read_next_byte_as_u8_unchecked()]
+
+    operand_one: Operand
+    operand_two: Operand
+
+    if possible_sign_extension:
+        immediate_value_is_word: bool = opcode_decode_entry.word_bit_set and not opcode_decode_entry.sign_extension_bit_set
+        extended_value_present: bool = opcode_decode_entry.word_bit_set
+    else:
+        immediate_value_is_word: bool = opcode_decode_entry.word_bit_set
+        extended_value_present: bool = False
+    # with s and w set a single byte is sign extended to the word, so it is read signed to keep 'add word [bx], -1' negative
+    sign_extended_byte: bool = extended_value_present and not immediate_value_is_word
+
+    if mod_reg_r_m_entry.mod == 0b11:  # immediate to register
+        dst_register: RegisterMnemonic = get_register_from_reg(mod_reg_r_m_entry.r_m, opcode_decode_entry.word_bit_set)
+        immediate_value: int = byte_reader.read_next_byte_as_s8_unchecked() if sign_extended_byte else \
+            byte_reader.read_one_or_two_bytes_as_u8_or_u16_unchecked(immediate_value_is_word)
+
+        operand_one = create_register_operand(dst_register)
+        operand_two = create_literal_value_operand(immediate_value, immediate_value_is_word)
+    else:  # immediate to memory
+        displacement: Optional[int] = read_displacement(byte_reader, mod_reg_r_m_entry.displacement_type)
+        effective_address_calculation: EffectiveAddressCalculation = mod_reg_r_m_entry.effective_address_calculation
+        immediate_value: int = byte_reader.read_next_byte_as_s8_unchecked() if sign_extended_byte else \
+            byte_reader.read_one_or_two_bytes_as_u8_or_u16_unchecked(immediate_value_is_word)
+
+        operand_one = create_effective_address_operand(effective_address_calculation, displacement)
+        operand_two = create_literal_value_operand(immediate_value, immediate_value_is_word or extended_value_present)
+    return operand_one, operand_two
+
+
+def handle_operands_for_reg_mem_to_from_reg_mem(byte_reader: ByteReader, opcode_decode_entry: OpcodeDecodeEntry) -> (Operand, Operand):
+    opcode: int = opcode_decode_entry.opcode
+    dst_bit_set: bool = opcode_decode_entry.dst_bit_set
+    word_bit_set: bool = opcode_decode_entry.word_bit_set
+
+    mod_reg_r_m_entry: ModRegRMEntry = mod_reg_r_m_table[byte_reader.read_next_byte_as_u8_unchecked()]
+    mod: int = mod_reg_r_m_entry.mod
+    reg: int = mod_reg_r_m_entry.reg
+    r_m: int = mod_reg_r_m_entry.r_m
+
+    # the segment register movs name a segment register in reg and are always 16 bit even though their w bit is clear
+    is_segment_register_mov: bool = opcode == 0b10001110 or opcode == 0b10001100
+    register: RegisterMnemonic
+    if is_segment_register_mov:
+        if reg not in sr_to_register_type_map:
+            raise DecodeError(f'Unknown segment register {reg} at index {byte_reader.index - 2}')
+        register = sr_to_register_type_map[reg]
+    else:
+        register = get_register_from_reg(reg, word_bit_set)
+
+    operand_one: Operand
+    operand_two: Operand
+    if mod == 0b11:  # register to register
+        r_m_register: RegisterMnemonic = get_register_from_reg(r_m, word_bit_set or is_segment_register_mov)
+        if not dst_bit_set:
+            src_register: RegisterMnemonic = register
+            dst_register: RegisterMnemonic = r_m_register
+        else:
+            src_register: RegisterMnemonic = r_m_register
+            dst_register: RegisterMnemonic = register
+
+        operand_one = create_register_operand(dst_register)
+        operand_two = create_register_operand(src_register)
+    elif mod_reg_r_m_entry.effective_address_calculation.is_direct_address:  # direct address mode
+        effective_address_calculation: EffectiveAddressCalculation = mod_reg_r_m_entry.effective_address_calculation
+        memory_address: int = byte_reader.read_next_two_byte_as_u16_unchecked()
+        if dst_bit_set:  # memory to register
+            operand_one = create_register_operand(register)
+            operand_two = create_effective_address_operand(effective_address_calculation, memory_address)
+        else:  # register to memory
+            operand_one = create_effective_address_operand(effective_address_calculation, memory_address)
+            operand_two = create_register_operand(register)
+    else:  # memory mode
+        displacement: Optional[int] = read_displacement(byte_reader, mod_reg_r_m_entry.displacement_type)
+        effective_address_calculation: EffectiveAddressCalculation = mod_reg_r_m_entry.effective_address_calculation
+        if dst_bit_set:  # memory to register
+            operand_one = create_register_operand(register)
+            operand_two = create_effective_address_operand(effective_address_calculation, displacement)
+        else:  # register to memory
+            operand_one = create_effective_address_operand(effective_address_calculation, displacement)
+            operand_two = create_register_operand(register)
+    return operand_one, operand_two
+
+
+# def handle_operands_for_reg_mem_to_from_reg_mem(byte_reader: ByteReader) -> (Operand, Operand):
+#     current_byte: int = byte_reader.peek_as_u8(-1)
+#     dst_bit_set: bool = is_bit_set(current_byte, 1, BitIndexDirection.FROM_RIGHT)
+#     word_bit_set: bool = is_bit_set(current_byte, 0, BitIndexDirection.FROM_RIGHT)
+#     current_byte = byte_reader.read_next_byte_as_u8()
+#     mod, reg, r_m = get_mod_reg_r_m_from_byte(current_byte)
+#
+#     operand_one: Operand
+#     operand_two: Operand
+#     if mod == 0b11:  # register to register
+#         if not dst_bit_set:
+#             src_register: RegisterType = get_register_from_reg(reg, word_bit_set)
+#             dst_register: RegisterType = get_register_from_reg(r_m, word_bit_set)
+#         else:
+#             src_register: RegisterType = get_register_from_reg(r_m, word_bit_set)
+#             dst_register: RegisterType = get_register_from_reg(reg, word_bit_set)
+#
+#         operand_one = create_register_operand(dst_register)
+#         operand_two = create_register_operand(src_register)
+#     elif mod == 0b00 and r_m == 0b110:  # direct address mode
+#         effective_address_calculation: EffectiveAddressCalculation = get_effective_address_calculation_from_r_m_mod(r_m, mod)
+#         dst_register: RegisterType = get_register_from_reg(reg, word_bit_set)
+#         memory_address: int = byte_reader.read_next_two_byte_as_u16()
+#
+#         operand_one = create_register_operand(dst_register)
+#         operand_two = create_effective_address_operand(effective_address_calculation, memory_address)
+#     else:  # memory mode
+#         displacement: Optional[int] = read_displacement_if_has_any(byte_reader, mod, r_m)
+#         effective_address_calculation: EffectiveAddressCalculation = get_effective_address_calculation_from_r_m_mod(r_m, mod)
+#         register: RegisterType = get_register_from_reg(reg, word_bit_set)
+#         if dst_bit_set:  # memory to register
+#             operand_one = create_register_operand(register)
+#             operand_two = create_effective_address_operand(effective_address_calculation, displacement)
+#         else:  # register to memory
+#             operand_one = create_effective_address_operand(effective_address_calculation, displacement)
+#             operand_two = create_register_operand(register)
+#     return operand_one, operand_two
+
+
+def handle_mov_instruction(byte_reader: ByteReader, opcode_decode_entry: OpcodeDecodeEntry) -> Operation:
+    byte_reader.read_next_byte_as_u8_unchecked()  # opcode was already classified by the dispatch table
+    opcode_form: OpcodeForm = opcode_decode_entry.opcode_form
+
+    operation: Operation = Operation()
+    operation.instruction_type = InstructionType.MOV
+
+    if opcode_form is OpcodeForm.IMM_TO_REG:  # move immediate to register
+        word_bit_set: bool = opcode_decode_entry.word_bit_set
+        immediate_value: int = byte_reader.read_one_or_two_bytes_as_u8_or_u16_unchecked(word_bit_set)
+        dst_register: RegisterMnemonic = get_register_from_reg(opcode_decode_entry.reg, word_bit_set)
+
+        operation.operand_one = create_register_operand(dst_register)
+        operation.operand_two = create_literal_value_operand(immediate_value, word_bit_set)
+    elif opcode_form is OpcodeForm.MEM_TO_ACC or opcode_form is OpcodeForm.ACC_TO_MEM:  # mov memory/accumulator to accumulator/memory
+        # the address is always 16 bits, the w bit only picks al or ax
+        memory_address: int = byte_reader.read_next_two_byte_as_u16_unchecked()
+        effective_address_calculation: EffectiveAddressCalculation = EffectiveAddressCalculation.direct_address
+        accumulator: RegisterMnemonic = RegisterMnemonic.AX if opcode_decode_entry.word_bit_set else RegisterMnemonic.AL
+
+        if opcode_form is OpcodeForm.MEM_TO_ACC:
+            operation.operand_one = create_register_operand(accumulator)
+            operation.operand_two = create_effective_address_operand(effective_address_calculation, memory_address)
+        else:
+            operation.operand_one = create_effective_address_operand(effective_address_calculation, memory_address)
+            operation.operand_two = create_register_operand(accumulator)
+    elif opcode_form is OpcodeForm.IMM_TO_REG_MEM:  # mov immediate to register/memory
+        operation.operand_one, operation.operand_two = handle_operands_for_imm_to_reg_mem(byte_reader, opcode_decode_entry, False)
+    else:  # mov register/memory to/from register
+        operation.operand_one, operation.operand_two = handle_operands_for_reg_mem_to_from_reg_mem(byte_reader, opcode_decode_entry)
+    return operation
+
+
+def handle_add_sub_cmp_instruction(byte_reader: ByteReader, opcode_decode_entry: OpcodeDecodeEntry) -> Operation:
+    byte_reader.read_next_byte_as_u8_unchecked()  # opcode was already classified by the dispatch table
+    opcode_form: OpcodeForm = opcode_decode_entry.opcode_form
+
+    operation: Operation = Operation()
+    operation.instruction_type = opcode_decode_entry.instruction_type
+
+    if operation.instruction_type is InstructionType.NONE:
+        reg: int = mod_reg_r_m_table[byte_reader.peek_as_u8_unchecked()].reg
+        if reg == 0b000:
+            operation.instruction_type = InstructionType.ADD
+        elif reg == 0b101:
+            operation.instruction_type = InstructionType.SUB
+        elif reg == 0b111:
+            operation.instruction_type = InstructionType.CMP
+        else:
+            raise DecodeError(f'Invalid reg value {reg}')
+
+    if opcode_form is OpcodeForm.REG_MEM_TO_FROM_REG:  # reg/mem to from reg/mem
+        operation.operand_one, operation.operand_two = handle_operands_for_reg_mem_to_from_reg_mem(byte_reader, opcode_decode_entry)
+    elif opcode_form is OpcodeForm.IMM_TO_REG_MEM:  # imm to mem/reg
+        operation.operand_one, operation.operand_two = handle_operands_for_imm_to_reg_mem(byte_reader, opcode_decode_entry, True)
+    else:  # immediate to accumulator
+        word_bit_set: bool = opcode_decode_entry.word_bit_set
+        register_to_use: RegisterMnemonic = RegisterMnemonic.AX if word_bit_set else RegisterMnemonic.AL
+        operation.operand_one = create_register_operand(register_to_use)
+        immediate_value: int = byte_reader.read_one_or_two_bytes_as_u8_or_u16_unchecked(word_bit_set)
+        operation.operand_two = create_literal_value_operand(immediate_value, word_bit_set)
+
+    return operation
+
+
+def handle_jmp_instruction(byte_reader: ByteReader, opcode_decode_entry: OpcodeDecodeEntry) -> Operation:
+    byte_reader.read_next_byte_as_u8_unchecked()  # opcode was already classified by the dispatch table
+
+    operation: Operation = Operation()
+    operation.instruction_type = opcode_decode_entry.instruction_type
+
+    current_byte = byte_reader.read_next_byte_as_s8_unchecked()
+    operation.operand_one = create_literal_value_offset_operand(current_byte)
+
+    return operation
+
+
+# handler, instruction type, opcode form and immediate byte count of every supported opcode apart from the jumps, precomputed from the opcode bit
+# patterns so the dispatch table is cheap to build at import time. The 80-83 group has its instruction type in the reg field of the next byte.
+opcode_decode_rows: dict[int, tuple[Callable[[ByteReader, OpcodeDecodeEntry], Operation], InstructionType, OpcodeForm, int]] = {
+    0x00: (handle_add_sub_cmp_instruction, InstructionType.ADD, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x01: (handle_add_sub_cmp_instruction, InstructionType.ADD, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x02: (handle_add_sub_cmp_instruction, InstructionType.ADD, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x03: (handle_add_sub_cmp_instruction, InstructionType.ADD, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x04: (handle_add_sub_cmp_instruction, InstructionType.ADD, OpcodeForm.IMM_TO_ACC, 1),
+    0x05: (handle_add_sub_cmp_instruction, InstructionType.ADD, OpcodeForm.IMM_TO_ACC, 2),
+    0x28: (handle_add_sub_cmp_instruction, InstructionType.SUB, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x29: (handle_add_sub_cmp_instruction, InstructionType.SUB, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x2a: (handle_add_sub_cmp_instruction, InstructionType.SUB, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x2b: (handle_add_sub_cmp_instruction, InstructionType.SUB, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x2c: (handle_add_sub_cmp_instruction, InstructionType.SUB, OpcodeForm.IMM_TO_ACC, 1),
+    0x2d: (handle_add_sub_cmp_instruction, InstructionType.SUB, OpcodeForm.IMM_TO_ACC, 2),
+    0x38: (handle_add_sub_cmp_instruction, InstructionType.CMP, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x39: (handle_add_sub_cmp_instruction, InstructionType.CMP, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x3a: (handle_add_sub_cmp_instruction, InstructionType.CMP, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x3b: (handle_add_sub_cmp_instruction, InstructionType.CMP, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x3c: (handle_add_sub_cmp_instruction, InstructionType.CMP, OpcodeForm.IMM_TO_ACC, 1),
+    0x3d: (handle_add_sub_cmp_instruction, InstructionType.CMP, OpcodeForm.IMM_TO_ACC, 2),
+    0x80: (handle_add_sub_cmp_instruction, InstructionType.NONE, OpcodeForm.IMM_TO_REG_MEM, 1),
+    0x81: (handle_add_sub_cmp_instruction, InstructionType.NONE, OpcodeForm.IMM_TO_REG_MEM, 2),
+    0x82: (handle_add_sub_cmp_instruction, InstructionType.NONE, OpcodeForm.IMM_TO_REG_MEM, 1),
+    0x83: (handle_add_sub_cmp_instruction, InstructionType.NONE, OpcodeForm.IMM_TO_REG_MEM, 1),
+    0x88: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x89: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x8a: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x8b: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x8c: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0x8e: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.REG_MEM_TO_FROM_REG, 0),
+    0xa0: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.MEM_TO_ACC, 2),
+    0xa1: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.MEM_TO_ACC, 2),
+    0xa2: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.ACC_TO_MEM, 2),
+    0xa3: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.ACC_TO_MEM, 2),
+    0xb0: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 1),
+    0xb1: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 1),
+    0xb2: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 1),
+    0xb3: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 1),
+    0xb4: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 1),
+    0xb5: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 1),
+    0xb6: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 1),
+    0xb7: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 1),
+    0xb8: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 2),
+    0xb9: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 2),
+    0xba: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 2),
+    0xbb: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 2),
+    0xbc: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 2),
+    0xbd: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 2),
+    0xbe: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 2),
+    0xbf: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG, 2),
+    0xc6: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG_MEM, 1),
+    0xc7: (handle_mov_instruction, InstructionType.MOV, OpcodeForm.IMM_TO_REG_MEM, 2),
+}
+
+
+def create_opcode_decode_entry(opcode: int) -> Optional[OpcodeDecodeEntry]:
+    if opcode in opcodes_to_jmp_instructions_map:
+        return OpcodeDecodeEntry(opcode, handle_jmp_instruction, opcodes_to_jmp_instructions_map[opcode], OpcodeForm.JMP, False, False, False, 0, 1)
+    if opcode not in opcode_decode_rows:
+        return None
+
+    handler, instruction_type, opcode_form, immediate_num_bytes = opcode_decode_rows[opcode]
+    dst_bit_set: bool = (opcode & 0b10) != 0
+    # immediate to register movs keep w in bit 3, every other form in bit 0
+    word_bit_set: bool = (opcode & (0b1000 if opcode_form is OpcodeForm.IMM_TO_REG else 0b1)) != 0
+    sign_extension_bit_set: bool = dst_bit_set  # s shares its position with d
+    return OpcodeDecodeEntry(opcode, handler, instruction_type, opcode_form, dst_bit_set, word_bit_set, sign_extension_bit_set, opcode & 0b111,
+                             immediate_num_bytes)
+
+
+opcode_decode_table: tuple[Optional[OpcodeDecodeEntry], ...] = tuple(create_opcode_decode_entry(opcode) for opcode in range(256))
+
@@ -0,0 +1,71 @@
+import bisect
+import itertools
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from byte_reader import ByteReader, ByteBuffer, ByteReaderOutOfRangeError
+from decoded_program_8086 import DecodedProgram, decode_to_program
+from instruction_decoder_8086 import decode_operation, DecodeError, MAX_INSTRUCTION_NUM_BYTES
+
+MIN_PARALLEL_CHUNK_NUM_BYTES: int = 256 * 1024
+
+
+def decode_chunk_speculatively(chunk_bytes: bytes, decode_end_index: int) -> DecodedProgram:
+    # The chunk start is only a candidate instruction boundary, so decoding stops quietly at the first invalid instruction
+    program: DecodedProgram = DecodedProgram()
+    byte_reader: ByteReader = ByteReader(chunk_bytes)
+    try:
+        while byte_reader.index < decode_end_index:
+            program.append(decode_operation(byte_reader))
+    except (DecodeError, ByteReaderOutOfRangeError):
+        pass
+    return program
+
+
+def get_instruction_start_offsets(program: DecodedProgram, start_offset: int) -> array:
+    return array('q', itertools.accumulate(program.num_bytes[:-1], initial=start_offset)) if len(program) > 0 else array('q')
+
+
+def stitch_chunk_programs(bytes_array: ByteBuffer, chunk_starts: list[int], chunk_num_bytes: int, chunk_programs: list[DecodedProgram]) -> DecodedProgram:
+    program: DecodedProgram = DecodedProgram()
+    byte_reader: ByteReader = ByteReader(bytes_array)
+
+    for chunk_start, chunk_program in zip(chunk_starts, chunk_programs):
+        chunk_end: int = min(chunk_start + chunk_num_bytes, byte_reader.num_bytes)
+        chunk_instruction_starts: array = get_instruction_start_offsets(chunk_program, chunk_start)
+        chunk_program_end: int = chunk_start + sum(chunk_program.num_bytes)
+
+        # decode sequentially from the real instruction boundary until it lines up with the speculative stream
+        while byte_reader.index < chunk_end:
+            resync_index: int = bisect.bisect_left(chunk_instruction_starts, byte_reader.index)
+            if resync_index < len(chunk_instruction_starts) and chunk_instruction_starts[resync_index] == byte_reader.index:
+                program.extend(chunk_program, resync_index)
+                byte_reader.seek(chunk_program_end)
+            else:
+                program.append(decode_operation(byte_reader))
+
+    return program
+
+
+def decode_parallel(bytes_array: ByteBuffer, max_workers: Optional[int] = None, chunk_num_bytes: Optional[int] = None) -> DecodedProgram:
+    num_bytes: int = len(bytes_array)
+    max_workers = max_workers if max_workers is not None else os.cpu_count() or 1
+    if chunk_num_bytes is None:
+        chunk_num_bytes = max(MIN_PARALLEL_CHUNK_NUM_BYTES, -(-num_bytes // max_workers))
+
+    if max_workers == 1 or num_bytes <= chunk_num_bytes:
+        return decode_to_program(ByteReader(bytes_array))
+
+    chunk_starts: list[int] = list(range(0, num_bytes, chunk_num_bytes))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            # include enough bytes past the chunk end to finish an instruction that starts inside the chunk
+            executor.submit(decode_chunk_speculatively, bytes(bytes_array[chunk_start:chunk_start + chunk_num_bytes + MAX_INSTRUCTION_NUM_BYTES - 1]),
+                            min(chunk_num_bytes, num_bytes - chunk_start))
+            for chunk_start in chunk_starts
+        ]
+        chunk_programs: list[DecodedProgram] = [future.result() for future in futures]
+
+    return stitch_chunk_programs(bytes_array, chunk_starts, chunk_num_bytes, chunk_programs)
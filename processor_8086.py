@@ -0,0 +1,863 @@
+import sys
+from array import array
+from typing import Callable, Optional, TextIO, Union
+
+from bit_manipulation_helpers import int_as_u16_hex_str
+from decoded_program_8086 import DecodedProgram, effective_address_calculations
+from instruction_decoder_8086 import decode_operation, DecodeError, Operation, Operand, InstructionType, RegisterMnemonic, OperandType, EffectiveAddress, \
+    EffectiveAddressCalculation, MAX_INSTRUCTION_NUM_BYTES, jmp_taken_clocks
+import enum
+
+from byte_reader import ByteReader, ByteReaderOutOfRangeError, ByteBuffer, u16_struct
+
+
+class SimulationError(Exception):
+    pass
+
+
+class RegisterType(enum.Enum):
+    NONE = 0
+    A = enum.auto()
+    B = enum.auto()
+    C = enum.auto()
+    D = enum.auto()
+    SP = enum.auto()
+    BP = enum.auto()
+    SI = enum.auto()
+    DI = enum.auto()
+    CS = enum.auto()
+    DS = enum.auto()
+    SS = enum.auto()
+    ES = enum.auto()
+
+    def can_do_hi_and_lo_byte(self) -> bool:
+        return self in [RegisterType.A, RegisterType.B, RegisterType.C, RegisterType.D]
+
+
+register_mnemonic_to_register_type_map: dict[RegisterMnemonic, RegisterType] = {
+    RegisterMnemonic.AL: RegisterType.A,
+    RegisterMnemonic.AH: RegisterType.A,
+    RegisterMnemonic.AX: RegisterType.A,
+    RegisterMnemonic.BL: RegisterType.B,
+    RegisterMnemonic.BH: RegisterType.B,
+    RegisterMnemonic.BX: RegisterType.B,
+    RegisterMnemonic.CL: RegisterType.C,
+    RegisterMnemonic.CH: RegisterType.C,
+    RegisterMnemonic.CX: RegisterType.C,
+    RegisterMnemonic.DL: RegisterType.D,
+    RegisterMnemonic.DH: RegisterType.D,
+    RegisterMnemonic.DX: RegisterType.D,
+    RegisterMnemonic.SP: RegisterType.SP,
+    RegisterMnemonic.BP: RegisterType.BP,
+    RegisterMnemonic.SI: RegisterType.SI,
+    RegisterMnemonic.DI: RegisterType.DI,
+    RegisterMnemonic.CS: RegisterType.CS,
+    RegisterMnemonic.DS: RegisterType.DS,
+    RegisterMnemonic.SS: RegisterType.SS,
+    RegisterMnemonic.ES: RegisterType.ES,
+}
+
+
+class RegisterPart(enum.Enum):
+    NONE = 0
+    LO = enum.auto()
+    HI = enum.auto()
+    FULL = enum.auto()
+
+    def is_half(self):
+        return self in [RegisterPart.HI, RegisterPart.LO]
+
+
+def get_register_part_from_mnemonic(register_mnemonic: RegisterMnemonic):
+    register_name: str = register_mnemonic.name
+    if register_name[1] == 'L':
+        return RegisterPart.LO
+    elif register_name[1] == 'H':
+        return RegisterPart.HI
+    return RegisterPart.FULL
+
+
+# order of the registers in the register file, which is also the order they are printed in
+register_file_register_types: tuple[RegisterType, ...] = (
+    RegisterType.A, RegisterType.B, RegisterType.C, RegisterType.D, RegisterType.SP, RegisterType.BP, RegisterType.SI, RegisterType.DI,
+    RegisterType.ES, RegisterType.SS, RegisterType.DS, RegisterType.CS,
+)
+
+register_type_to_register_index_map: dict[RegisterType, int] = {register_type: index for index, register_type in enumerate(register_file_register_types)}
+
+register_file_register_names: tuple[str, ...] = tuple(
+    f'{register_type.name}X' if register_type.can_do_hi_and_lo_byte() else register_type.name for register_type in register_file_register_types
+)
+
+register_part_to_shift_and_mask_map: dict[RegisterPart, tuple[int, int]] = {
+    RegisterPart.FULL: (0, 0xffff),
+    RegisterPart.LO: (0, 0xff),
+    RegisterPart.HI: (8, 0xff),
+}
+
+
+class RegisterField:
+    def __init__(self, index: int, shift: int, mask: int):
+        self.index = index
+        self.shift = shift
+        self.mask = mask
+        self.keep_mask: int = 0xffff ^ (mask << shift)  # bits of the register outside this field
+
+
+def create_register_field(register_mnemonic: RegisterMnemonic) -> RegisterField:
+    index: int = register_type_to_register_index_map[register_mnemonic_to_register_type_map[register_mnemonic]]
+    shift, mask = register_part_to_shift_and_mask_map[get_register_part_from_mnemonic(register_mnemonic)]
+    return RegisterField(index, shift, mask)
+
+
+register_mnemonic_to_register_field_map: dict[RegisterMnemonic, RegisterField] = {
+    register_mnemonic: create_register_field(register_mnemonic) for register_mnemonic in register_mnemonic_to_register_type_map
+}
+
+
+def create_register_field_reader(registers: array, register_field: RegisterField) -> Callable[[], int]:
+    index: int = register_field.index
+    shift: int = register_field.shift
+    mask: int = register_field.mask
+    if shift == 0 and mask == 0xffff:
+        return lambda: registers[index]
+    return lambda: (registers[index] >> shift) & mask
+
+
+def create_register_field_writer(registers: array, register_field: RegisterField) -> Callable[[int], None]:
+    index: int = register_field.index
+    shift: int = register_field.shift
+    mask: int = register_field.mask
+    keep_mask: int = register_field.keep_mask
+    if shift == 0 and mask == 0xffff:
+        def write_full(value: int):
+            registers[index] = value & 0xffff
+        return write_full
+
+    def write_part(value: int):
+        registers[index] = (registers[index] & keep_mask) | ((value & mask) << shift)
+    return write_part
+
+
+def get_changed_register_mask(registers_before: array, registers_after: array) -> int:
+    changed_register_mask: int = 0
+    for index, (value_before, value_after) in enumerate(zip(registers_before, registers_after)):
+        if value_before != value_after:
+            changed_register_mask |= 1 << index
+    return changed_register_mask
+
+
+MEMORY_NUM_BYTES: int = 1 << 20
+MEMORY_ADDRESS_MASK: int = MEMORY_NUM_BYTES - 1
+# writes are tracked per page so snapshots only copy the pages that changed
+MEMORY_PAGE_SHIFT: int = 12
+MEMORY_PAGE_NUM_BYTES: int = 1 << MEMORY_PAGE_SHIFT
+MEMORY_NUM_PAGES: int = MEMORY_NUM_BYTES >> MEMORY_PAGE_SHIFT
+
+ds_register_index: int = register_mnemonic_to_register_field_map[RegisterMnemonic.DS].index
+ss_register_index: int = register_mnemonic_to_register_field_map[RegisterMnemonic.SS].index
+cs_register_index: int = register_mnemonic_to_register_field_map[RegisterMnemonic.CS].index
+
+
+def get_physical_address(segment: int, offset: int) -> int:
+    return ((segment << 4) + offset) & MEMORY_ADDRESS_MASK
+
+
+def create_effective_address_generator_factory(effective_address_calculation: EffectiveAddressCalculation) -> Callable[[array, int], Callable[[], int]]:
+    # address generation for one calculation shape, specialised on how many registers it adds up
+    if effective_address_calculation.is_direct_address:
+        def create_direct_address_generator(registers: array, displacement: int) -> Callable[[], int]:
+            offset: int = displacement & 0xffff
+            return lambda: ((registers[ds_register_index] << 4) + offset) & MEMORY_ADDRESS_MASK
+        return create_direct_address_generator
+
+    # addresses based on BP default to the stack segment, everything else to the data segment
+    segment_index: int = ss_register_index if effective_address_calculation.register_one == RegisterMnemonic.BP else ds_register_index
+    register_one_index: int = register_mnemonic_to_register_field_map[effective_address_calculation.register_one].index
+    if effective_address_calculation.register_two == RegisterMnemonic.NONE:
+        def create_base_address_generator(registers: array, displacement: int) -> Callable[[], int]:
+            return lambda: ((registers[segment_index] << 4) + ((registers[register_one_index] + displacement) & 0xffff)) & MEMORY_ADDRESS_MASK
+        return create_base_address_generator
+
+    register_two_index: int = register_mnemonic_to_register_field_map[effective_address_calculation.register_two].index
+
+    def create_base_index_address_generator(registers: array, displacement: int) -> Callable[[], int]:
+        return lambda: ((registers[segment_index] << 4) + ((registers[register_one_index] + registers[register_two_index] + displacement) & 0xffff)) \
+            & MEMORY_ADDRESS_MASK
+    return create_base_index_address_generator
+
+
+effective_address_generator_factories: dict[EffectiveAddressCalculation, Callable[[array, int], Callable[[], int]]] = {
+    effective_address_calculation: create_effective_address_generator_factory(effective_address_calculation)
+    for effective_address_calculation in effective_address_calculations
+}
+
+
+def read_memory_word(memory: bytearray, address: int) -> int:
+    if address != MEMORY_ADDRESS_MASK:
+        return u16_struct.unpack_from(memory, address)[0]
+    return memory[address] | (memory[0] << 8)  # the high byte wraps around to the start of memory
+
+
+def write_memory_word(memory: bytearray, address: int, value: int):
+    if address != MEMORY_ADDRESS_MASK:
+        u16_struct.pack_into(memory, address, value & 0xffff)
+    else:
+        memory[address] = value & 0xff
+        memory[0] = (value >> 8) & 0xff
+
+
+def create_memory_reader(memory: bytearray, generate_address: Callable[[], int], width_mask: int) -> Callable[[], int]:
+    if width_mask == 0xff:
+        return lambda: memory[generate_address()]
+    return lambda: read_memory_word(memory, generate_address())
+
+
+def create_memory_writer(memory: bytearray, dirty_memory_pages: bytearray, code_byte_counts: bytearray, invalidate_code: Callable[[int, int], None],
+                         generate_address: Callable[[], int], width_mask: int) -> Callable[[int], None]:
+    # code_byte_counts is non zero for bytes of instructions in the decode on fetch cache, which a write has to invalidate
+    if width_mask == 0xff:
+        def write_byte(value: int):
+            address: int = generate_address()
+            memory[address] = value & 0xff
+            dirty_memory_pages[address >> MEMORY_PAGE_SHIFT] = 1
+            if code_byte_counts[address]:
+                invalidate_code(address, 1)
+        return write_byte
+
+    def write_word(value: int):
+        address: int = generate_address()
+        write_memory_word(memory, address, value)
+        dirty_memory_pages[address >> MEMORY_PAGE_SHIFT] = 1
+        dirty_memory_pages[((address + 1) & MEMORY_ADDRESS_MASK) >> MEMORY_PAGE_SHIFT] = 1
+        if code_byte_counts[address] or code_byte_counts[(address + 1) & MEMORY_ADDRESS_MASK]:
+            invalidate_code(address, 2)
+    return write_word
+
+
+def get_operation_width_mask(operation: Operation) -> int:
+    # a register operand sets the width, otherwise the immediate size does as in 'mov word [bx], 1'
+    for operand in (operation.operand_one, operation.operand_two):
+        if operand.operand_type == OperandType.REGISTER:
+            return register_mnemonic_to_register_field_map[operand.value].mask
+    return 0xff if operation.operand_two.operand_type == OperandType.LITERAL_VALUE_BYTE else 0xffff
+
+
+class CachedInstruction:
+    __slots__ = ('operation_index', 'num_bytes', 'clocks', 'execute')
+
+    def __init__(self, operation_index: int, num_bytes: int, clocks: int, execute: Callable[[], None]):
+        self.operation_index = operation_index  # index into the fetched operations, so trace sinks can look the operation up
+        self.num_bytes = num_bytes
+        self.clocks = clocks
+        self.execute = execute
+
+
+def get_immediate_value(operand: Operand, width_mask: int) -> int:
+    immediate_value: int = operand.value
+    if operand.operand_type == OperandType.LITERAL_VALUE_BYTE and width_mask == 0xffff:
+        immediate_value = ((immediate_value & 0xff) ^ 0x80) - 0x80  # byte immediates are sign extended into word destinations
+    return immediate_value & width_mask
+
+
+def get_operation_clocks(operation: Operation) -> int:
+    # estimated 8086 clocks, a taken jump adds the difference to jmp_taken_clocks when it runs
+    for operand in (operation.operand_one, operation.operand_two):
+        if operand.operand_type == OperandType.EFFECTIVE_ADDRESS:
+            return operation.base_clocks + operand.value.effective_address_calculation.clocks
+    return operation.base_clocks
+
+
+def create_unsupported_operation(message: str) -> Callable[[], None]:
+    # raised when the operation runs rather than when it is compiled so programs only fail if they reach it
+    def execute_unsupported():
+        raise SimulationError(message)
+    return execute_unsupported
+
+
+class ProcessorFlags(enum.Flag):
+    # values are the bit positions in the 8086 flags register
+    NONE = 0
+    CARRY = 1 << 0
+    PARITY = 1 << 2
+    AUXILIARY_CARRY = 1 << 4
+    ZERO = 1 << 6
+    SIGN = 1 << 7
+    OVERFLOW = 1 << 11
+
+
+# plain ints so flag checks in the hot path avoid enum.Flag arithmetic
+CARRY_FLAG: int = ProcessorFlags.CARRY.value
+PARITY_FLAG: int = ProcessorFlags.PARITY.value
+AUXILIARY_CARRY_FLAG: int = ProcessorFlags.AUXILIARY_CARRY.value
+ZERO_FLAG: int = ProcessorFlags.ZERO.value
+SIGN_FLAG: int = ProcessorFlags.SIGN.value
+OVERFLOW_FLAG: int = ProcessorFlags.OVERFLOW.value
+
+# printed in the order the flags sit in the flags register
+flag_letters: tuple[tuple[int, str], ...] = (
+    (CARRY_FLAG, 'C'), (PARITY_FLAG, 'P'), (AUXILIARY_CARRY_FLAG, 'A'), (ZERO_FLAG, 'Z'), (SIGN_FLAG, 'S'), (OVERFLOW_FLAG, 'O'),
+)
+
+# parity flag for every low result byte, set when the byte has an even number of 1 bits
+parity_flag_values: tuple[int, ...] = tuple(PARITY_FLAG if bin(value).count('1') % 2 == 0 else 0 for value in range(256))
+
+
+class AluOperationType(enum.Enum):
+    NONE = 0
+    ADD = enum.auto()
+    SUB = enum.auto()
+
+
+# (operation type, dst, src, unmasked result, width mask) of the last flag setting instruction
+AluOperation = tuple[AluOperationType, int, int, int, int]
+
+
+# each flag is worked out on its own so a conditional jump only pays for the flags it tests
+def is_carry_flag_set(alu_operation: Optional[AluOperation]) -> bool:
+    if alu_operation is None:
+        return False
+    alu_operation_type, _, _, result, width_mask = alu_operation
+    return result > width_mask if alu_operation_type == AluOperationType.ADD else result < 0
+
+
+def is_parity_flag_set(alu_operation: Optional[AluOperation]) -> bool:
+    return alu_operation is not None and parity_flag_values[alu_operation[3] & 0xff] != 0
+
+
+def is_auxiliary_carry_flag_set(alu_operation: Optional[AluOperation]) -> bool:
+    return alu_operation is not None and (alu_operation[1] ^ alu_operation[2] ^ alu_operation[3]) & 0x10 != 0
+
+
+def is_zero_flag_set(alu_operation: Optional[AluOperation]) -> bool:
+    return alu_operation is not None and alu_operation[3] & alu_operation[4] == 0
+
+
+def is_sign_flag_set(alu_operation: Optional[AluOperation]) -> bool:
+    return alu_operation is not None and alu_operation[3] & ((alu_operation[4] >> 1) + 1) != 0
+
+
+def is_overflow_flag_set(alu_operation: Optional[AluOperation]) -> bool:
+    if alu_operation is None:
+        return False
+    alu_operation_type, dst, src, result, width_mask = alu_operation
+    sign_bit: int = (width_mask >> 1) + 1
+    if alu_operation_type == AluOperationType.ADD:
+        return (dst ^ result) & (src ^ result) & sign_bit != 0
+    return (dst ^ src) & (dst ^ result) & sign_bit != 0
+
+
+flag_evaluators: tuple[tuple[int, Callable[[Optional[AluOperation]], bool]], ...] = (
+    (CARRY_FLAG, is_carry_flag_set), (PARITY_FLAG, is_parity_flag_set), (AUXILIARY_CARRY_FLAG, is_auxiliary_carry_flag_set),
+    (ZERO_FLAG, is_zero_flag_set), (SIGN_FLAG, is_sign_flag_set), (OVERFLOW_FLAG, is_overflow_flag_set),
+)
+
+
+def compute_flags_value(alu_operation: Optional[AluOperation]) -> int:
+    flags_value: int = 0
+    for flag, is_flag_set in flag_evaluators:
+        if is_flag_set(alu_operation):
+            flags_value |= flag
+    return flags_value
+
+
+def is_less(alu_operation: Optional[AluOperation]) -> bool:
+    return is_sign_flag_set(alu_operation) != is_overflow_flag_set(alu_operation)
+
+
+conditional_jump_conditions: dict[InstructionType, Callable[[Optional[AluOperation]], bool]] = {
+    InstructionType.JO: is_overflow_flag_set,
+    InstructionType.JNO: lambda alu_operation: not is_overflow_flag_set(alu_operation),
+    InstructionType.JB: is_carry_flag_set,
+    InstructionType.JAE: lambda alu_operation: not is_carry_flag_set(alu_operation),
+    InstructionType.JE: is_zero_flag_set,
+    InstructionType.JNE: lambda alu_operation: not is_zero_flag_set(alu_operation),
+    InstructionType.JBE: lambda alu_operation: is_carry_flag_set(alu_operation) or is_zero_flag_set(alu_operation),
+    InstructionType.JA: lambda alu_operation: not (is_carry_flag_set(alu_operation) or is_zero_flag_set(alu_operation)),
+    InstructionType.JS: is_sign_flag_set,
+    InstructionType.JNS: lambda alu_operation: not is_sign_flag_set(alu_operation),
+    InstructionType.JP: is_parity_flag_set,
+    InstructionType.JNP: lambda alu_operation: not is_parity_flag_set(alu_operation),
+    InstructionType.JL: is_less,
+    InstructionType.JGE: lambda alu_operation: not is_less(alu_operation),
+    InstructionType.JLE: lambda alu_operation: is_zero_flag_set(alu_operation) or is_less(alu_operation),
+    InstructionType.JG: lambda alu_operation: not (is_zero_flag_set(alu_operation) or is_less(alu_operation)),
+}
+
+cx_register_index: int = register_mnemonic_to_register_field_map[RegisterMnemonic.CX].index
+
+
+DEFAULT_TRACE_BATCH_NUM_LINES: int = 4096
+
+
+def format_register_and_flag_state(registers: array, flags_value: int) -> list[str]:
+    lines: list[str] = ['Register State:']
+    for name, value in zip(register_file_register_names, registers):
+        lines.append(f'\t{name}:  {int_as_u16_hex_str(value)}  {value}')
+    lines.append(f'Flags: {"".join(letter for flag, letter in flag_letters if flags_value & flag)}')
+    return lines
+
+
+class TraceSink:
+    # receives every executed step when tracing is turned on, after the operation has run
+    def on_step(self, processor: 'Processor8086', operation_index: int, instruction_ptr_before: int) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class TextTraceSink(TraceSink):
+    def __init__(self, output_file: TextIO, batch_num_lines: int = DEFAULT_TRACE_BATCH_NUM_LINES, show_clocks: bool = False):
+        self.output_file: TextIO = output_file
+        self.batch_num_lines: int = batch_num_lines
+        self.show_clocks: bool = show_clocks
+        self.previous_clock_count: int = 0
+        self.lines: list[str] = []
+
+    def on_step(self, processor: 'Processor8086', operation_index: int, instruction_ptr_before: int) -> None:
+        lines: list[str] = self.lines
+        lines.append(str(processor.operation_stream[operation_index]))
+        lines.append(f'IP pre-op: {int_as_u16_hex_str(instruction_ptr_before)} {instruction_ptr_before}')
+        lines.extend(format_register_and_flag_state(processor.registers, processor.get_flags_value()))
+        lines.append(f'IP post-op: {int_as_u16_hex_str(processor.instruction_ptr)} {processor.instruction_ptr}')
+        if self.show_clocks:
+            lines.append(f'Clocks: +{processor.clock_count - self.previous_clock_count} = {processor.clock_count}')
+            self.previous_clock_count = processor.clock_count
+        lines.append('')
+        if len(lines) >= self.batch_num_lines:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.lines:
+            self.lines.append('')
+            self.output_file.write('\n'.join(self.lines))
+            self.lines.clear()
+        self.output_file.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+
+class BasicBlock:
+    # a run of operations entered only at the first one and left only after the last one, which may be a jump
+    __slots__ = ('start_operation_index', 'end_operation_index', 'start_address', 'end_address', 'clocks', 'execute', 'execution_count')
+
+    def __init__(self, start_operation_index: int, end_operation_index: int, start_address: int, end_address: int, clocks: int, execute: Callable[[], None]):
+        self.start_operation_index = start_operation_index
+        self.end_operation_index = end_operation_index
+        self.start_address = start_address
+        self.end_address = end_address
+        self.clocks = clocks  # estimated clocks for one pass with a final jump not taken
+        self.execute = execute
+        self.execution_count: int = 0  # whole passes only, a pass cut short by the instruction budget or stop address is not counted
+
+    def __str__(self):
+        return (f'{int_as_u16_hex_str(self.start_address)}-{int_as_u16_hex_str(self.end_address)}  {self.get_num_instructions()} instructions  '
+                f'{self.clocks} clocks  executed {self.execution_count} times')
+
+    def get_num_instructions(self) -> int:
+        return self.end_operation_index - self.start_operation_index
+
+
+def find_basic_block_leaders(operation_num_bytes: array, jump_offsets: list[Optional[int]], address_to_operation_index: array) -> list[bool]:
+    # blocks start at the program start, at every jump target inside the program and right after every jump
+    is_leader: list[bool] = [False] * (len(operation_num_bytes) + 1)
+    is_leader[0] = True
+    address: int = 0
+    for operation_index, (num_bytes, jump_offset) in enumerate(zip(operation_num_bytes, jump_offsets)):
+        address += num_bytes
+        if jump_offset is None:
+            continue
+        is_leader[operation_index + 1] = True
+        target_address: int = address + jump_offset
+        if 0 <= target_address < len(address_to_operation_index) and address_to_operation_index[target_address] >= 0:
+            is_leader[address_to_operation_index[target_address]] = True
+    return is_leader
+
+
+class Processor8086:
+    def __init__(self):
+        self.registers: array = array('H', bytes(2 * len(register_file_register_types)))
+        # code and data share this address space, the program image is loaded at CS:0
+        self.memory: bytearray = bytearray(MEMORY_NUM_BYTES)
+        # non zero for pages written since the last snapshot was taken or restored, every page counts as written before the first one
+        self.dirty_memory_pages: bytearray = bytearray(b'\x01') * MEMORY_NUM_PAGES
+
+        # decode on fetch state, used instead of a pre-decoded operation stream after load_program_for_fetch
+        self.decode_on_fetch: bool = False
+        self.program_end_address: int = 0
+        self.memory_byte_reader: ByteReader = ByteReader(self.memory)
+        self.instruction_cache: dict[int, CachedInstruction] = {}
+        # operation_stream index of every address fetched from, a refetch after its bytes are written reuses the slot so the stream stays bounded
+        self.fetched_operation_indices: dict[int, int] = {}
+        self.code_byte_counts: bytearray = bytearray(MEMORY_NUM_BYTES)
+
+        # flags are worked out from the last ALU operation only when something reads them
+        self.last_alu_operation: Optional[AluOperation] = None
+        self.instruction_ptr = 0
+        self.clock_count: int = 0
+        self.operation_stream: Optional[Union[list[Operation], DecodedProgram]] = None
+        self.operation_stream_index: int = 0
+        # operation index for every byte offset, -1 for offsets inside an instruction, len(operation_stream) for the end of the program
+        self.address_to_operation_index: array = array('l')
+        self.operation_num_bytes: array = array('B')
+        self.operation_clocks: array = array('H')
+        self.compiled_operations: list[Callable[[], None]] = []
+        # the basic block starting at each operation index, None for operations inside a block
+        self.basic_blocks: list[Optional[BasicBlock]] = []
+
+    def load_operation_stream(self, operation_stream: Union[list[Operation], DecodedProgram]):
+        self.operation_stream = operation_stream
+        operation_num_bytes = operation_stream.num_bytes if isinstance(operation_stream, DecodedProgram) else [operation.num_bytes for operation in operation_stream]
+
+        self.address_to_operation_index = array('l', [-1]) * (sum(operation_num_bytes) + 1)
+        address: int = 0
+        for operation_index, num_bytes in enumerate(operation_num_bytes):
+            self.address_to_operation_index[address] = operation_index
+            address += num_bytes
+        self.address_to_operation_index[address] = len(operation_stream)
+
+        self.operation_num_bytes = array('B', operation_num_bytes)
+        self.compiled_operations = []
+        self.operation_clocks = array('H')
+        instruction_types: list[InstructionType] = []
+        jump_offsets: list[Optional[int]] = []
+        for operation in operation_stream:
+            self.compiled_operations.append(self.compile_operation(operation))
+            self.operation_clocks.append(get_operation_clocks(operation))
+            instruction_types.append(operation.instruction_type)
+            jump_offsets.append(operation.operand_one.value if operation.operand_one.operand_type == OperandType.LITERAL_VALUE_OFFSET else None)
+        self.basic_blocks = self.create_basic_blocks(instruction_types, jump_offsets)
+        self.instruction_ptr = 0
+        self.operation_stream_index = 0
+        self.clock_count = 0
+
+    def create_basic_blocks(self, instruction_types: list[InstructionType], jump_offsets: list[Optional[int]]) -> list[Optional[BasicBlock]]:
+        num_operations: int = len(self.compiled_operations)
+        is_leader: list[bool] = find_basic_block_leaders(self.operation_num_bytes, jump_offsets, self.address_to_operation_index)
+        basic_blocks: list[Optional[BasicBlock]] = [None] * num_operations
+
+        start_operation_index: int = 0
+        start_address: int = 0
+        address: int = 0
+        for operation_index in range(num_operations):
+            address += self.operation_num_bytes[operation_index]
+            if is_leader[operation_index + 1] or operation_index + 1 == num_operations:
+                execute: Callable[[], None] = self.compile_basic_block(start_operation_index, operation_index + 1, address, instruction_types[operation_index],
+                                                                       jump_offsets[operation_index])
+                clocks: int = sum(self.operation_clocks[start_operation_index:operation_index + 1])
+                basic_blocks[start_operation_index] = BasicBlock(start_operation_index, operation_index + 1, start_address, address, clocks, execute)
+                start_operation_index = operation_index + 1
+                start_address = address
+        return basic_blocks
+
+    def compile_basic_block(self, start_operation_index: int, end_operation_index: int, end_address: int, last_instruction_type: InstructionType,
+                            jump_offset: Optional[int]) -> Callable[[], None]:
+        # only the final jump reads the IP, so the body runs back to back and the IP is moved to the block end once
+        body_end_operation_index: int = end_operation_index - 1 if jump_offset is not None else end_operation_index
+        body: tuple[Callable[[], None], ...] = tuple(self.compiled_operations[start_operation_index:body_end_operation_index])
+
+        if jump_offset is None:
+            def execute_block():
+                for execute in body:
+                    execute()
+                self.instruction_ptr = end_address
+                self.operation_stream_index = end_operation_index
+            return execute_block
+
+        target_address: int = end_address + jump_offset
+        is_valid_target: bool = 0 <= target_address < len(self.address_to_operation_index) and self.address_to_operation_index[target_address] >= 0
+        if last_instruction_type in conditional_jump_conditions and is_valid_target:
+            # the target is known up front, so the conditional jump is folded into the block without going through jump_to
+            condition: Callable[[Optional[AluOperation]], bool] = conditional_jump_conditions[last_instruction_type]
+            target_operation_index: int = self.address_to_operation_index[target_address]
+            taken_extra_clocks: int = jmp_taken_clocks[last_instruction_type] - self.operation_clocks[end_operation_index - 1]
+
+            def execute_block_with_conditional_jump():
+                for execute in body:
+                    execute()
+                if condition(self.last_alu_operation):
+                    self.clock_count += taken_extra_clocks
+                    self.instruction_ptr = target_address
+                    self.operation_stream_index = target_operation_index
+                else:
+                    self.instruction_ptr = end_address
+                    self.operation_stream_index = end_operation_index
+            return execute_block_with_conditional_jump
+
+        execute_jump: Callable[[], None] = self.compiled_operations[end_operation_index - 1]
+
+        def execute_block_with_jump():
+            for execute in body:
+                execute()
+            self.instruction_ptr = end_address
+            self.operation_stream_index = end_operation_index
+            execute_jump()
+        return execute_block_with_jump
+
+    def get_basic_blocks(self) -> list[BasicBlock]:
+        return [basic_block for basic_block in self.basic_blocks if basic_block is not None]
+
+    def load_program_image(self, program_bytes: ByteBuffer):
+        start_address: int = get_physical_address(self.registers[cs_register_index], 0)
+        if start_address + len(program_bytes) > MEMORY_NUM_BYTES:
+            raise SimulationError(f'Program of {len(program_bytes)} bytes does not fit in memory at {start_address}')
+        self.memory[start_address:start_address + len(program_bytes)] = program_bytes
+        end_page: int = (start_address + len(program_bytes) + MEMORY_PAGE_NUM_BYTES - 1) >> MEMORY_PAGE_SHIFT
+        for page_index in range(start_address >> MEMORY_PAGE_SHIFT, end_page):
+            self.dirty_memory_pages[page_index] = 1
+
+    def load_program_for_fetch(self, program_bytes: ByteBuffer):
+        # instructions are decoded from memory at CS:IP as they are reached instead of ahead of time
+        self.load_program_image(program_bytes)
+        self.decode_on_fetch = True
+        self.program_end_address = len(program_bytes)
+        self.operation_stream = []
+        self.instruction_cache.clear()
+        self.fetched_operation_indices.clear()
+        self.code_byte_counts[:] = bytes(MEMORY_NUM_BYTES)
+        self.instruction_ptr = 0
+        self.operation_stream_index = 0
+        self.clock_count = 0
+
+    def fetch_instruction(self, address: int) -> CachedInstruction:
+        byte_reader: ByteReader = self.memory_byte_reader
+        byte_reader.seek(address)
+        try:
+            operation: Operation = decode_operation(byte_reader)
+        except (DecodeError, ByteReaderOutOfRangeError) as e:
+            raise SimulationError(f'Cannot decode the instruction at {address}: {e}') from e
+
+        operation_index: Optional[int] = self.fetched_operation_indices.get(address)
+        if operation_index is None:
+            operation_index = len(self.operation_stream)
+            self.fetched_operation_indices[address] = operation_index
+            self.operation_stream.append(operation)
+        else:
+            self.operation_stream[operation_index] = operation
+        cached_instruction: CachedInstruction = CachedInstruction(operation_index, operation.num_bytes, get_operation_clocks(operation),
+                                                                  self.compile_operation(operation))
+        self.instruction_cache[address] = cached_instruction
+        for code_address in range(address, address + operation.num_bytes):
+            self.code_byte_counts[code_address & MEMORY_ADDRESS_MASK] += 1
+        return cached_instruction
+
+    def invalidate_code(self, address: int, num_bytes: int):
+        # drop every cached instruction overlapping the written bytes, they start at most MAX_INSTRUCTION_NUM_BYTES - 1 bytes earlier
+        for start_address in range(address - MAX_INSTRUCTION_NUM_BYTES + 1, address + num_bytes):
+            cached_instruction: Optional[CachedInstruction] = self.instruction_cache.get(start_address & MEMORY_ADDRESS_MASK)
+            if cached_instruction is None or start_address + cached_instruction.num_bytes <= address:
+                continue
+            del self.instruction_cache[start_address & MEMORY_ADDRESS_MASK]
+            for code_address in range(start_address, start_address + cached_instruction.num_bytes):
+                self.code_byte_counts[code_address & MEMORY_ADDRESS_MASK] -= 1
+
+    def jump_to(self, address: int):
+        if self.decode_on_fetch:
+            self.instruction_ptr = address & 0xffff
+            return
+        if not 0 <= address < len(self.address_to_operation_index):
+            raise SimulationError(f'Jump target {address} is outside the program')
+        operation_index: int = self.address_to_operation_index[address]
+        if operation_index < 0:
+            raise SimulationError(f'Jump target {address} lands in the middle of an instruction')
+        self.instruction_ptr = address
+        self.operation_stream_index = operation_index
+
+    def get_register_value(self, register_mnemonic: RegisterMnemonic) -> int:
+        register_field: RegisterField = register_mnemonic_to_register_field_map[register_mnemonic]
+        return (self.registers[register_field.index] >> register_field.shift) & register_field.mask
+
+    def set_register_value(self, register_mnemonic: RegisterMnemonic, value: int):
+        register_field: RegisterField = register_mnemonic_to_register_field_map[register_mnemonic]
+        self.registers[register_field.index] = (self.registers[register_field.index] & register_field.keep_mask) | ((value & register_field.mask) << register_field.shift)
+
+    @property
+    def flags(self) -> ProcessorFlags:
+        return ProcessorFlags(self.get_flags_value())
+
+    def get_flags_value(self) -> int:
+        return compute_flags_value(self.last_alu_operation)
+
+    def get_register_snapshot(self) -> array:
+        return self.registers[:]
+
+    def compile_effective_address_generator(self, effective_address: EffectiveAddress) -> Callable[[], int]:
+        displacement: int = effective_address.displacement if effective_address.displacement is not None else 0
+        return effective_address_generator_factories[effective_address.effective_address_calculation](self.registers, displacement)
+
+    def compile_operand_reader(self, operand: Operand, width_mask: int = 0xffff) -> Callable[[], int]:
+        if operand.operand_type.is_immediate_value():
+            immediate_value: int = get_immediate_value(operand, width_mask)
+            return lambda: immediate_value
+        if operand.operand_type == OperandType.EFFECTIVE_ADDRESS:
+            return create_memory_reader(self.memory, self.compile_effective_address_generator(operand.value), width_mask)
+        return create_register_field_reader(self.registers, register_mnemonic_to_register_field_map[operand.value])
+
+    def compile_operand_writer(self, operand: Operand, width_mask: int) -> Callable[[int], None]:
+        if operand.operand_type == OperandType.EFFECTIVE_ADDRESS:
+            return create_memory_writer(self.memory, self.dirty_memory_pages, self.code_byte_counts, self.invalidate_code, self.compile_effective_address_generator(operand.value),
+                                        width_mask)
+        return create_register_field_writer(self.registers, register_mnemonic_to_register_field_map[operand.value])
+
+    def compile_operation(self, operation: Operation) -> Callable[[], None]:
+        if operation.instruction_type == InstructionType.MOV:
+            width_mask: int = get_operation_width_mask(operation)
+            write_dst: Callable[[int], None] = self.compile_operand_writer(operation.operand_one, width_mask)
+            read_src: Callable[[], int] = self.compile_operand_reader(operation.operand_two, width_mask)
+
+            def execute_mov():
+                write_dst(read_src())
+            return execute_mov
+
+        elif operation.instruction_type in [InstructionType.ADD, InstructionType.SUB, InstructionType.CMP]:
+            width_mask: int = get_operation_width_mask(operation)
+            read_dst: Callable[[], int] = self.compile_operand_reader(operation.operand_one, width_mask)
+            write_dst: Callable[[int], None] = self.compile_operand_writer(operation.operand_one, width_mask)
+            read_src: Callable[[], int] = self.compile_operand_reader(operation.operand_two, width_mask)
+
+            if operation.instruction_type == InstructionType.ADD:
+                def execute_add():
+                    dst: int = read_dst()
+                    src: int = read_src()
+                    result: int = dst + src
+                    self.last_alu_operation = (AluOperationType.ADD, dst, src, result, width_mask)
+                    write_dst(result)
+                return execute_add
+
+            writes_result: bool = operation.instruction_type == InstructionType.SUB
+
+            def execute_sub_cmp():
+                dst: int = read_dst()
+                src: int = read_src()
+                result: int = dst - src
+                self.last_alu_operation = (AluOperationType.SUB, dst, src, result, width_mask)
+                if writes_result:
+                    write_dst(result)
+            return execute_sub_cmp
+
+        elif operation.instruction_type in conditional_jump_conditions:
+            jmp_amount: int = operation.operand_one.value
+            condition: Callable[[Optional[AluOperation]], bool] = conditional_jump_conditions[operation.instruction_type]
+            taken_extra_clocks: int = jmp_taken_clocks[operation.instruction_type] - operation.base_clocks
+
+            def execute_conditional_jump():
+                if condition(self.last_alu_operation):
+                    self.clock_count += taken_extra_clocks
+                    self.jump_to(self.instruction_ptr + jmp_amount)
+            return execute_conditional_jump
+
+        elif operation.instruction_type in [InstructionType.LOOP, InstructionType.LOOPE, InstructionType.LOOPNE]:
+            jmp_amount: int = operation.operand_one.value
+            registers: array = self.registers
+            # LOOPE and LOOPNE also test ZF, which the CX decrement leaves alone
+            required_zero_flag: Optional[bool] = {InstructionType.LOOP: None, InstructionType.LOOPE: True, InstructionType.LOOPNE: False}[operation.instruction_type]
+            taken_extra_clocks: int = jmp_taken_clocks[operation.instruction_type] - operation.base_clocks
+
+            def execute_loop():
+                count: int = (registers[cx_register_index] - 1) & 0xffff
+                registers[cx_register_index] = count
+                if count != 0 and (required_zero_flag is None or is_zero_flag_set(self.last_alu_operation) == required_zero_flag):
+                    self.clock_count += taken_extra_clocks
+                    self.jump_to(self.instruction_ptr + jmp_amount)
+            return execute_loop
+
+        elif operation.instruction_type == InstructionType.JCXZ:
+            jmp_amount: int = operation.operand_one.value
+            registers: array = self.registers
+
+            taken_extra_clocks: int = jmp_taken_clocks[operation.instruction_type] - operation.base_clocks
+
+            def execute_jcxz():
+                if registers[cx_register_index] == 0:
+                    self.clock_count += taken_extra_clocks
+                    self.jump_to(self.instruction_ptr + jmp_amount)
+            return execute_jcxz
+
+        return create_unsupported_operation(f'Have not implemented {operation.instruction_type} yet')
+
+    def simulate_operation(self):
+        operation_index: int = self.operation_stream_index
+        self.instruction_ptr += self.operation_num_bytes[operation_index]
+        self.operation_stream_index = operation_index + 1
+        self.clock_count += self.operation_clocks[operation_index]
+        self.compiled_operations[operation_index]()
+
+    def simulate(self, max_instructions: Optional[int] = None, stop_address: Optional[int] = None, trace_sink: Optional[TraceSink] = None) -> int:
+        # runs until the program ends, max_instructions have run or the IP reaches stop_address, returning the number of instructions run
+        if self.decode_on_fetch:
+            return self._simulate_fetched(max_instructions, stop_address, trace_sink)
+        if trace_sink is not None:
+            return self._simulate_traced(max_instructions, stop_address, trace_sink)
+
+        num_operations: int = len(self.operation_stream)
+        compiled_operations: list[Callable[[], None]] = self.compiled_operations
+        operation_num_bytes: array = self.operation_num_bytes
+        operation_clocks: array = self.operation_clocks
+        max_instructions = max_instructions if max_instructions is not None else sys.maxsize
+        stop_address = stop_address if stop_address is not None else -1
+
+        basic_blocks: list[Optional[BasicBlock]] = self.basic_blocks
+
+        num_instructions: int = 0
+        while num_instructions < max_instructions and self.operation_stream_index < num_operations and self.instruction_ptr != stop_address:
+            operation_index: int = self.operation_stream_index
+            basic_block: Optional[BasicBlock] = basic_blocks[operation_index]
+            if basic_block is not None:
+                block_num_instructions: int = basic_block.end_operation_index - operation_index
+                # run the whole block unless the budget or the stop address ends the run partway through it
+                if num_instructions + block_num_instructions <= max_instructions and not basic_block.start_address < stop_address < basic_block.end_address:
+                    basic_block.execution_count += 1
+                    self.clock_count += basic_block.clocks
+                    basic_block.execute()
+                    num_instructions += block_num_instructions
+                    continue
+
+            self.instruction_ptr += operation_num_bytes[operation_index]
+            self.operation_stream_index = operation_index + 1
+            self.clock_count += operation_clocks[operation_index]
+            compiled_operations[operation_index]()
+            num_instructions += 1
+        return num_instructions
+
+    def _simulate_fetched(self, max_instructions: Optional[int], stop_address: Optional[int], trace_sink: Optional[TraceSink]) -> int:
+        registers: array = self.registers
+        instruction_cache: dict[int, CachedInstruction] = self.instruction_cache
+        end_address: int = self.program_end_address
+        max_instructions = max_instructions if max_instructions is not None else sys.maxsize
+        stop_address = stop_address if stop_address is not None else -1
+
+        num_instructions: int = 0
+        # a jump past the image or a last instruction rewritten to run over its end leaves the IP beyond the end rather than on it
+        while num_instructions < max_instructions and self.instruction_ptr < end_address and self.instruction_ptr != stop_address:
+            instruction_ptr_before: int = self.instruction_ptr
+            address: int = ((registers[cs_register_index] << 4) + instruction_ptr_before) & MEMORY_ADDRESS_MASK
+            cached_instruction: Optional[CachedInstruction] = instruction_cache.get(address)
+            if cached_instruction is None:
+                cached_instruction = self.fetch_instruction(address)
+            self.instruction_ptr = (instruction_ptr_before + cached_instruction.num_bytes) & 0xffff
+            self.clock_count += cached_instruction.clocks
+            cached_instruction.execute()
+            num_instructions += 1
+            if trace_sink is not None:
+                trace_sink.on_step(self, cached_instruction.operation_index, instruction_ptr_before)
+        return num_instructions
+
+    def _simulate_traced(self, max_instructions: Optional[int], stop_address: Optional[int], trace_sink: TraceSink) -> int:
+        num_operations: int = len(self.operation_stream)
+        max_instructions = max_instructions if max_instructions is not None else sys.maxsize
+        stop_address = stop_address if stop_address is not None else -1
+
+        num_instructions: int = 0
+        while num_instructions < max_instructions and self.operation_stream_index < num_operations and self.instruction_ptr != stop_address:
+            operation_index: int = self.operation_stream_index
+            instruction_ptr_before: int = self.instruction_ptr
+            self.simulate_operation()
+            trace_sink.on_step(self, operation_index, instruction_ptr_before)
+            num_instructions += 1
+        return num_instructions
+
+    def print_register_and_flag_state(self):
+        print('\n'.join(format_register_and_flag_state(self.registers, self.get_flags_value())))
+
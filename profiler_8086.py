@@ -0,0 +1,146 @@
+import json
+import random
+import sys
+from typing import Optional, TextIO
+
+from bit_manipulation_helpers import int_as_u16_hex_str
+from instruction_decoder_8086 import InstructionType, Operation
+from processor_8086 import Processor8086, TraceSink, conditional_jump_conditions
+
+PROFILE_FORMAT_VERSION: int = 2
+DEFAULT_REPORT_NUM_INSTRUCTIONS: int = 20
+
+conditional_jump_instruction_types: frozenset[InstructionType] = frozenset(conditional_jump_conditions) | {
+    InstructionType.LOOP, InstructionType.LOOPE, InstructionType.LOOPNE, InstructionType.JCXZ,
+}
+
+
+class InstructionProfile:
+    __slots__ = ('operation_index', 'address', 'operation', 'is_conditional_jump', 'count', 'clocks', 'num_taken', 'num_not_taken')
+
+    def __init__(self, operation_index: int, address: int, operation: Operation):
+        self.operation_index = operation_index
+        self.address = address
+        self.operation = operation
+        self.is_conditional_jump = operation.instruction_type in conditional_jump_instruction_types
+        self.count = 0
+        self.clocks = 0
+        self.num_taken = 0
+        self.num_not_taken = 0
+
+
+class ExecutionProfile(TraceSink):
+    # Counts the steps it is given per instruction. When only sampled steps are given the counts, clocks and jump directions are
+    # scaled up by num_instructions / num_samples to estimate the whole run.
+    def __init__(self, sample_interval: int = 1):
+        self.sample_interval: int = sample_interval
+        self.num_instructions: int = 0
+        self.num_samples: int = 0
+        self.instruction_profiles: dict[int, InstructionProfile] = {}  # by operation index
+        self.previous_clock_count: int = 0
+
+    def on_step(self, processor: Processor8086, operation_index: int, instruction_ptr_before: int) -> None:
+        instruction_profile: Optional[InstructionProfile] = self.instruction_profiles.get(operation_index)
+        if instruction_profile is None:
+            instruction_profile = InstructionProfile(operation_index, instruction_ptr_before, processor.operation_stream[operation_index])
+            self.instruction_profiles[operation_index] = instruction_profile
+        instruction_profile.count += 1
+        instruction_profile.clocks += processor.clock_count - self.previous_clock_count
+        self.previous_clock_count = processor.clock_count
+        if instruction_profile.is_conditional_jump:
+            # a jump to the very next instruction counts as not taken
+            if processor.instruction_ptr == (instruction_ptr_before + instruction_profile.operation.num_bytes) & 0xffff:
+                instruction_profile.num_not_taken += 1
+            else:
+                instruction_profile.num_taken += 1
+        self.num_samples += 1
+
+    def get_scale(self) -> float:
+        return self.num_instructions / self.num_samples if self.num_samples else 0.0
+
+    def get_ranked_instruction_profiles(self) -> list[InstructionProfile]:
+        return sorted(self.instruction_profiles.values(), key=lambda instruction_profile: (-instruction_profile.count, instruction_profile.address))
+
+    def get_instruction_type_counts(self) -> dict[InstructionType, int]:
+        instruction_type_counts: dict[InstructionType, int] = {}
+        for instruction_profile in self.instruction_profiles.values():
+            instruction_type: InstructionType = instruction_profile.operation.instruction_type
+            instruction_type_counts[instruction_type] = instruction_type_counts.get(instruction_type, 0) + instruction_profile.count
+        return dict(sorted(instruction_type_counts.items(), key=lambda item: -item[1]))
+
+    def to_json_dict(self) -> dict:
+        scale: float = self.get_scale()
+        return {
+            'version': PROFILE_FORMAT_VERSION,
+            'sample_interval': self.sample_interval,
+            'num_instructions': self.num_instructions,
+            'num_samples': self.num_samples,
+            'instructions': [
+                {
+                    'address': instruction_profile.address,
+                    'operation_index': instruction_profile.operation_index,
+                    'instruction': instruction_profile.operation.get_decode_str(),
+                    'instruction_type': str(instruction_profile.operation.instruction_type),
+                    'samples': instruction_profile.count,
+                    'estimated_count': round(instruction_profile.count * scale),
+                    'estimated_clocks': round(instruction_profile.clocks * scale),
+                    **({'estimated_taken': round(instruction_profile.num_taken * scale), 'estimated_not_taken': round(instruction_profile.num_not_taken * scale)}
+                       if instruction_profile.is_conditional_jump else {}),
+                }
+                for instruction_profile in self.get_ranked_instruction_profiles()
+            ],
+            'instruction_types': {str(instruction_type): round(count * scale) for instruction_type, count in self.get_instruction_type_counts().items()},
+        }
+
+
+def run_profiled(processor: Processor8086, sample_interval: int = 1, max_instructions: Optional[int] = None, stop_address: Optional[int] = None,
+                 seed: int = 0) -> ExecutionProfile:
+    # a sample interval of 1 traces every step, larger intervals run at full speed between single traced steps
+    if sample_interval < 1:
+        raise ValueError('The sample interval has to be at least 1')
+    profile: ExecutionProfile = ExecutionProfile(sample_interval)
+    profile.previous_clock_count = processor.clock_count
+    if sample_interval == 1:
+        profile.num_instructions = processor.simulate(max_instructions, stop_address, profile)
+        return profile
+
+    # the gaps between samples are random around the interval so a loop whose length divides the interval is not always sampled at the same place
+    random_generator: random.Random = random.Random(seed)
+    max_instructions = max_instructions if max_instructions is not None else sys.maxsize
+    while profile.num_instructions < max_instructions:
+        num_skipped_instructions: int = min(random_generator.randrange(2 * sample_interval - 1), max_instructions - profile.num_instructions - 1)
+        num_run_instructions: int = processor.simulate(num_skipped_instructions, stop_address)
+        profile.num_instructions += num_run_instructions
+        if num_run_instructions < num_skipped_instructions:
+            break
+        profile.previous_clock_count = processor.clock_count
+        num_run_instructions = processor.simulate(1, stop_address, profile)
+        profile.num_instructions += num_run_instructions
+        if not num_run_instructions:
+            break
+    return profile
+
+
+def write_profile_report(profile: ExecutionProfile, output_file: TextIO, num_instructions: int = DEFAULT_REPORT_NUM_INSTRUCTIONS) -> None:
+    scale: float = profile.get_scale()
+    total_clocks: int = sum(instruction_profile.clocks for instruction_profile in profile.instruction_profiles.values())
+    num_samples: int = max(profile.num_samples, 1)
+    mode: str = 'every instruction' if profile.sample_interval == 1 else f'sampled about 1 in {profile.sample_interval}'
+    lines: list[str] = [f'Profile: {profile.num_instructions} instructions, {profile.num_samples} samples ({mode})', 'Hot Instructions:']
+    for rank, instruction_profile in enumerate(profile.get_ranked_instruction_profiles()[:num_instructions], 1):
+        line: str = f'\t{rank:>3}. {int_as_u16_hex_str(instruction_profile.address)}  {round(instruction_profile.count * scale):>10}  ' \
+                    f'{100 * instruction_profile.count / num_samples:5.1f}%  clocks {100 * instruction_profile.clocks / max(total_clocks, 1):5.1f}%  ' \
+                    f'{instruction_profile.operation.get_decode_str()}'
+        if instruction_profile.is_conditional_jump:
+            line += f'  (taken {round(instruction_profile.num_taken * scale)}, not taken {round(instruction_profile.num_not_taken * scale)})'
+        lines.append(line)
+    lines.append('Instruction Types:')
+    for instruction_type, count in profile.get_instruction_type_counts().items():
+        lines.append(f'\t{str(instruction_type):<8}{round(count * scale):>10}  {100 * count / num_samples:5.1f}%')
+    lines.append('')
+    output_file.write('\n'.join(lines))
+
+
+def write_profile_json(profile: ExecutionProfile, output_file: TextIO) -> None:
+    json.dump(profile.to_json_dict(), output_file, indent=2)
+    output_file.write('\n')
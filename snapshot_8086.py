@@ -0,0 +1,247 @@
+import argparse
+import bisect
+import struct
+import time
+from array import array
+from typing import Optional
+
+from bit_manipulation_helpers import int_as_u16_hex_str
+from byte_reader import open_mapped_file
+from decoded_program_8086 import DecodedProgram
+from instruction_decoder_8086 import iter_decode
+from processor_8086 import Processor8086, SimulationError, AluOperation, AluOperationType, format_register_and_flag_state, register_file_register_types, \
+    MEMORY_NUM_BYTES, MEMORY_NUM_PAGES, MEMORY_PAGE_NUM_BYTES, MEMORY_PAGE_SHIFT
+
+SNAPSHOT_FORMAT_VERSION: int = 1
+DEFAULT_CHECKPOINT_INTERVAL: int = 100_000
+NUM_REGISTERS: int = len(register_file_register_types)
+
+zero_memory_page: bytes = bytes(MEMORY_PAGE_NUM_BYTES)
+alu_operation_types: tuple[AluOperationType, ...] = tuple(AluOperationType)
+
+snapshot_file_magic: bytes = b'D86S'
+# magic, format version, register count, page size, unique page count, snapshot count
+snapshot_file_header_struct: struct.Struct = struct.Struct('<4sHHIII')
+# instruction count, clock count, IP, operation stream index, registers, then the last ALU operation as type, dst, src, unmasked result, width mask
+processor_state_struct: struct.Struct = struct.Struct(f'<QQII{NUM_REGISTERS}HBHHiH')
+# index into the unique pages for every page of memory
+memory_page_indices_struct: struct.Struct = struct.Struct(f'<{MEMORY_NUM_PAGES}I')
+
+
+class ProcessorSnapshot:
+    __slots__ = ('instruction_count', 'registers', 'last_alu_operation', 'instruction_ptr', 'operation_stream_index', 'clock_count', 'memory_pages')
+
+    def __init__(self, instruction_count: int, registers: array, last_alu_operation: Optional[AluOperation], instruction_ptr: int, operation_stream_index: int,
+                 clock_count: int, memory_pages: tuple[bytes, ...]):
+        self.instruction_count = instruction_count
+        self.registers = registers
+        self.last_alu_operation = last_alu_operation
+        self.instruction_ptr = instruction_ptr
+        self.operation_stream_index = operation_stream_index
+        self.clock_count = clock_count
+        # pages a snapshot did not write are the same bytes objects as in the snapshot before it, so each one only costs the pages it changed
+        self.memory_pages = memory_pages
+
+    def __str__(self) -> str:
+        return f'instruction {self.instruction_count}, IP {int_as_u16_hex_str(self.instruction_ptr)}, {self.clock_count} clocks'
+
+
+def snapshots_to_bytes(snapshots: list[ProcessorSnapshot]) -> bytes:
+    # pages with the same contents are written once and shared by index, which keeps the deltas between snapshots
+    page_indices: dict[bytes, int] = {}
+    state_parts: list[bytes] = []
+    for snapshot in snapshots:
+        alu_operation: AluOperation = snapshot.last_alu_operation if snapshot.last_alu_operation is not None else (AluOperationType.NONE, 0, 0, 0, 0)
+        alu_operation_type, dst, src, result, width_mask = alu_operation
+        state_parts.append(processor_state_struct.pack(snapshot.instruction_count, snapshot.clock_count, snapshot.instruction_ptr,
+                                                       snapshot.operation_stream_index, *snapshot.registers, alu_operation_type.value, dst, src, result,
+                                                       width_mask))
+        state_parts.append(memory_page_indices_struct.pack(*(page_indices.setdefault(page, len(page_indices)) for page in snapshot.memory_pages)))
+
+    header: bytes = snapshot_file_header_struct.pack(snapshot_file_magic, SNAPSHOT_FORMAT_VERSION, NUM_REGISTERS, MEMORY_PAGE_NUM_BYTES, len(page_indices),
+                                                     len(snapshots))
+    return b''.join([header, *page_indices, *state_parts])
+
+
+def snapshots_from_bytes(serialized_bytes: bytes) -> list[ProcessorSnapshot]:
+    magic, version, num_registers, page_num_bytes, num_unique_pages, num_snapshots = snapshot_file_header_struct.unpack_from(serialized_bytes, 0)
+    if magic != snapshot_file_magic:
+        raise ValueError('Not a serialized 8086 snapshot')
+    if version != SNAPSHOT_FORMAT_VERSION or num_registers != NUM_REGISTERS or page_num_bytes != MEMORY_PAGE_NUM_BYTES:
+        raise ValueError(f'Unsupported snapshot format version {version} with {num_registers} registers and {page_num_bytes} byte pages')
+
+    offset: int = snapshot_file_header_struct.size
+    expected_num_bytes: int = offset + num_unique_pages * page_num_bytes + num_snapshots * (processor_state_struct.size + memory_page_indices_struct.size)
+    if len(serialized_bytes) != expected_num_bytes:
+        raise ValueError('Serialized snapshot is truncated')
+
+    unique_pages: list[bytes] = []
+    for _ in range(num_unique_pages):
+        unique_pages.append(bytes(serialized_bytes[offset:offset + page_num_bytes]))
+        offset += page_num_bytes
+
+    snapshots: list[ProcessorSnapshot] = []
+    for _ in range(num_snapshots):
+        instruction_count, clock_count, instruction_ptr, operation_stream_index, *state = processor_state_struct.unpack_from(serialized_bytes, offset)
+        offset += processor_state_struct.size
+        alu_operation_type_value, dst, src, result, width_mask = state[NUM_REGISTERS:]
+        last_alu_operation: Optional[AluOperation] = None
+        if alu_operation_type_value != AluOperationType.NONE.value:
+            last_alu_operation = (alu_operation_types[alu_operation_type_value], dst, src, result, width_mask)
+        memory_pages: tuple[bytes, ...] = tuple(unique_pages[page_index] for page_index in memory_page_indices_struct.unpack_from(serialized_bytes, offset))
+        offset += memory_page_indices_struct.size
+        snapshots.append(ProcessorSnapshot(instruction_count, array('H', state[:NUM_REGISTERS]), last_alu_operation, instruction_ptr, operation_stream_index,
+                                           clock_count, memory_pages))
+    return snapshots
+
+
+class Checkpoints:
+    # Runs a processor while snapshotting it every interval instructions, any earlier instruction count is reached again by restoring the
+    # nearest snapshot before it and running forward from there
+    def __init__(self, processor: Processor8086, interval: int = DEFAULT_CHECKPOINT_INTERVAL):
+        if interval <= 0:
+            raise ValueError('The checkpoint interval has to be positive')
+        self.processor: Processor8086 = processor
+        self.interval: int = interval
+        self.instruction_count: int = 0
+        self.snapshots: dict[int, ProcessorSnapshot] = {}
+        self.snapshot_instruction_counts: list[int] = []  # sorted
+        # the page objects memory matches apart from its dirty pages, nothing is known about memory until the first snapshot
+        self.memory_pages: list[bytes] = [zero_memory_page] * MEMORY_NUM_PAGES
+        processor.dirty_memory_pages[:] = b'\x01' * MEMORY_NUM_PAGES
+        self.take_snapshot()
+
+    def take_snapshot(self) -> ProcessorSnapshot:
+        processor: Processor8086 = self.processor
+        memory: memoryview = memoryview(processor.memory)
+        dirty_memory_pages: bytearray = processor.dirty_memory_pages
+        memory_pages: list[bytes] = self.memory_pages
+
+        page_index: int = dirty_memory_pages.find(1)
+        while page_index >= 0:
+            start_address: int = page_index << MEMORY_PAGE_SHIFT
+            page: bytes = bytes(memory[start_address:start_address + MEMORY_PAGE_NUM_BYTES])
+            if page != memory_pages[page_index]:  # a page written back with the same contents stays shared
+                memory_pages[page_index] = page
+            dirty_memory_pages[page_index] = 0
+            page_index = dirty_memory_pages.find(1, page_index + 1)
+        memory.release()
+
+        snapshot: ProcessorSnapshot = ProcessorSnapshot(self.instruction_count, processor.get_register_snapshot(), processor.last_alu_operation,
+                                                        processor.instruction_ptr, processor.operation_stream_index, processor.clock_count, tuple(memory_pages))
+        self.add_snapshot(snapshot)
+        return snapshot
+
+    def add_snapshot(self, snapshot: ProcessorSnapshot):
+        if snapshot.instruction_count not in self.snapshots:
+            bisect.insort(self.snapshot_instruction_counts, snapshot.instruction_count)
+        self.snapshots[snapshot.instruction_count] = snapshot
+
+    def get_nearest_snapshot(self, instruction_count: int) -> ProcessorSnapshot:
+        # the latest snapshot at or before instruction_count
+        index: int = bisect.bisect_right(self.snapshot_instruction_counts, instruction_count) - 1
+        if index < 0:
+            raise SimulationError(f'No snapshot at or before instruction {instruction_count}')
+        return self.snapshots[self.snapshot_instruction_counts[index]]
+
+    def restore(self, snapshot: ProcessorSnapshot):
+        processor: Processor8086 = self.processor
+        # registers and memory are updated in place, compiled operations hold references to both
+        processor.registers[:] = snapshot.registers
+        processor.last_alu_operation = snapshot.last_alu_operation
+        processor.instruction_ptr = snapshot.instruction_ptr
+        processor.operation_stream_index = snapshot.operation_stream_index
+        processor.clock_count = snapshot.clock_count
+
+        memory: bytearray = processor.memory
+        dirty_memory_pages: bytearray = processor.dirty_memory_pages
+        memory_pages: list[bytes] = self.memory_pages
+        for page_index, page in enumerate(snapshot.memory_pages):
+            if page is not memory_pages[page_index] or dirty_memory_pages[page_index]:
+                start_address: int = page_index << MEMORY_PAGE_SHIFT
+                memory[start_address:start_address + MEMORY_PAGE_NUM_BYTES] = page
+                memory_pages[page_index] = page
+        dirty_memory_pages[:] = bytes(MEMORY_NUM_PAGES)
+
+        if processor.decode_on_fetch:
+            # restored code bytes may differ from what was decoded, so instructions are fetched again
+            processor.instruction_cache.clear()
+            processor.code_byte_counts[:] = bytes(MEMORY_NUM_BYTES)
+        self.instruction_count = snapshot.instruction_count
+
+    def run(self, max_instructions: Optional[int] = None, stop_address: Optional[int] = None) -> int:
+        # simulate in steps that end on interval boundaries, snapshotting at each one, returns the number of instructions run
+        num_instructions: int = 0
+        while max_instructions is None or num_instructions < max_instructions:
+            num_step_instructions: int = self.interval - self.instruction_count % self.interval
+            if max_instructions is not None:
+                num_step_instructions = min(num_step_instructions, max_instructions - num_instructions)
+            num_run_instructions: int = self.processor.simulate(num_step_instructions, stop_address)
+            self.instruction_count += num_run_instructions
+            num_instructions += num_run_instructions
+            if self.instruction_count % self.interval == 0 and num_run_instructions:
+                self.take_snapshot()
+            if num_run_instructions < num_step_instructions:
+                break  # the program ended or reached the stop address
+        return num_instructions
+
+    def run_to_instruction_count(self, instruction_count: int) -> int:
+        # returns the instruction count reached, which is lower than asked for when the program ends first
+        snapshot: ProcessorSnapshot = self.get_nearest_snapshot(instruction_count)
+        if not snapshot.instruction_count <= self.instruction_count <= instruction_count:
+            self.restore(snapshot)
+        self.run(instruction_count - self.instruction_count)
+        return self.instruction_count
+
+    def to_bytes(self) -> bytes:
+        return snapshots_to_bytes([self.snapshots[instruction_count] for instruction_count in self.snapshot_instruction_counts])
+
+    def load_snapshots(self, serialized_bytes: bytes):
+        for snapshot in snapshots_from_bytes(serialized_bytes):
+            self.add_snapshot(snapshot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate an 8086 binary with periodic snapshots, then rewind to an earlier instruction count')
+    parser.add_argument('file_name')
+    parser.add_argument('--interval', type=int, default=DEFAULT_CHECKPOINT_INTERVAL, help='take a snapshot every this many instructions')
+    parser.add_argument('--max-instructions', type=int, default=None, help='stop the first run after this many instructions')
+    parser.add_argument('--to', type=int, action='append', default=[], help='rewind to this instruction count and print the state, may be repeated')
+    parser.add_argument('--save', default=None, help='write the snapshots to this file')
+    parser.add_argument('--load', default=None, help='start from the snapshots in this file instead of running the program first')
+    args = parser.parse_args()
+
+    processor: Processor8086 = Processor8086()
+    with open_mapped_file(args.file_name) as file_bytes:
+        processor.load_program_image(file_bytes)
+        processor.load_operation_stream(DecodedProgram.from_operations(iter_decode(file_bytes)))
+    checkpoints: Checkpoints = Checkpoints(processor, args.interval)
+
+    if args.load is not None:
+        with open(args.load, 'rb') as snapshot_file:
+            checkpoints.load_snapshots(snapshot_file.read())
+        print(f'Loaded {len(checkpoints.snapshots)} snapshots')
+    else:
+        start: float = time.perf_counter()
+        num_instructions: int = checkpoints.run(args.max_instructions)
+        seconds: float = time.perf_counter() - start
+        num_unique_pages: int = len({id(page) for snapshot in checkpoints.snapshots.values() for page in snapshot.memory_pages})
+        print(f'Executed {num_instructions} instructions in {seconds:.3f}s with {len(checkpoints.snapshots)} snapshots sharing {num_unique_pages} memory pages')
+
+    if args.save is not None:
+        with open(args.save, 'wb') as snapshot_file:
+            snapshot_file.write(checkpoints.to_bytes())
+
+    for instruction_count in args.to:
+        nearest_snapshot: ProcessorSnapshot = checkpoints.get_nearest_snapshot(instruction_count)
+        start: float = time.perf_counter()
+        reached_instruction_count: int = checkpoints.run_to_instruction_count(instruction_count)
+        seconds: float = time.perf_counter() - start
+        print(f'Instruction {reached_instruction_count} reached in {seconds:.3f}s from the snapshot at {nearest_snapshot}')
+        print('\n'.join(format_register_and_flag_state(processor.registers, processor.get_flags_value())))
+        print(f'IP: {int_as_u16_hex_str(processor.instruction_ptr)} {processor.instruction_ptr}')
+        print(f'Clocks: {processor.clock_count}')
+
+
+if __name__ == '__main__':
+    main()
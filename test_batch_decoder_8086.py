@@ -0,0 +1,25 @@
+import os
+from pathlib import Path
+
+from batch_decoder_8086 import DisassemblyResult, disassemble_file_timed
+
+
+def test_disassembly_is_written_in_place_on_success(tmp_path: Path):
+    binary_path: Path = tmp_path / 'program'
+    binary_path.write_bytes(bytes([0xb9, 0x03, 0x00, 0x89, 0xcb]))  # mov cx, 3; mov bx, cx
+    result: DisassemblyResult = disassemble_file_timed(str(binary_path))
+    assert result.error is None
+    assert result.output_file_name == f'{binary_path}_my.asm'
+    assert 'mov cx, 3\nmov bx, cx' in Path(result.output_file_name).read_text()
+    assert sorted(os.listdir(tmp_path)) == ['program', 'program_my.asm']
+
+
+def test_failed_disassembly_keeps_the_earlier_output(tmp_path: Path):
+    binary_path: Path = tmp_path / 'program'
+    binary_path.write_bytes(bytes([0xb9, 0x03, 0x00, 0x0f]))  # mov cx, 3 then an unknown opcode
+    output_path: Path = tmp_path / 'program_my.asm'
+    output_path.write_text('earlier disassembly\n')
+    result: DisassemblyResult = disassemble_file_timed(str(binary_path))
+    assert result.error is not None and result.error.startswith('DecodeError')
+    assert output_path.read_text() == 'earlier disassembly\n'
+    assert sorted(os.listdir(tmp_path)) == ['program', 'program_my.asm']
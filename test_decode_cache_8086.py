@@ -0,0 +1,66 @@
+import os
+
+from decode_cache_8086 import CACHE_FILE_EXTENSION, DecodeCache
+
+# mov cx, bx
+PROGRAM_BYTES: bytes = bytes([0x89, 0xd9])
+
+
+def list_cache_files(cache_directory: str) -> list[str]:
+    return [os.path.join(directory_path, file_name) for directory_path, _, file_names in os.walk(cache_directory)
+            for file_name in file_names if file_name.endswith(CACHE_FILE_EXTENSION)]
+
+
+def test_disk_hit_after_memory_is_cleared(tmp_path):
+    decode_cache: DecodeCache = DecodeCache(str(tmp_path))
+    decode_cache.get_or_decode(PROGRAM_BYTES)
+    decode_cache.clear_memory()
+    assert [str(operation) for operation in decode_cache.get_or_decode(PROGRAM_BYTES)] == ['mov cx, bx']
+    assert (decode_cache.hits, decode_cache.misses) == (1, 1)
+
+
+def test_disk_is_only_scanned_when_over_the_limit(tmp_path, monkeypatch):
+    decode_cache: DecodeCache = DecodeCache(str(tmp_path))
+    decode_cache.get_or_decode(PROGRAM_BYTES)
+    num_walks: list[int] = [0]
+    walk = os.walk
+
+    def count_walk(*args, **kwargs):
+        num_walks[0] += 1
+        return walk(*args, **kwargs)
+
+    monkeypatch.setattr(os, 'walk', count_walk)
+    for value in range(20):
+        decode_cache.get_or_decode(PROGRAM_BYTES + bytes([0xb1, value]))
+    assert num_walks[0] == 0
+
+    decode_cache.max_disk_bytes = decode_cache.disk_bytes
+    decode_cache.get_or_decode(PROGRAM_BYTES + bytes([0xb1, 0xff]))
+    assert num_walks[0] == 1
+    assert sum(os.path.getsize(path) for path in list_cache_files(str(tmp_path))) <= decode_cache.max_disk_bytes
+
+
+def test_entries_removed_by_another_process(tmp_path):
+    decode_cache: DecodeCache = DecodeCache(str(tmp_path))
+    decode_cache.get_or_decode(PROGRAM_BYTES)
+    for path in list_cache_files(str(tmp_path)):
+        os.remove(path)
+    decode_cache.clear_memory()
+    decode_cache.disk_bytes = decode_cache.max_disk_bytes
+    decode_cache.get_or_decode(PROGRAM_BYTES)
+    assert len(list_cache_files(str(tmp_path))) == 1
+
+
+def test_read_only_cache_directory(tmp_path, monkeypatch):
+    DecodeCache(str(tmp_path)).get_or_decode(PROGRAM_BYTES)
+
+    def raise_permission_error(*args, **kwargs):
+        raise PermissionError(13, 'Permission denied')
+
+    # patched rather than chmod since the tests may run as root, which ignores directory permissions
+    for function_name in ('utime', 'remove', 'open', 'makedirs'):
+        monkeypatch.setattr(os, function_name, raise_permission_error)
+    decode_cache: DecodeCache = DecodeCache(str(tmp_path))
+    decode_cache.get_or_decode(PROGRAM_BYTES)
+    decode_cache.get_or_decode(PROGRAM_BYTES + PROGRAM_BYTES)
+    assert (decode_cache.hits, decode_cache.misses) == (1, 1)
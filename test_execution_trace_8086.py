@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import execution_trace_8086
+from execution_trace_8086 import BinaryTraceSink, TraceReader, open_trace_file_for_reading, open_trace_file_for_writing, trace_record_header_struct
+from instruction_decoder_8086 import iter_decode
+from processor_8086 import Processor8086, TraceSink
+
+# mov cx, 3; loop_start: add ax, cx; mov bx, ax; cmp ax, 0; sub cx, 1; jne loop_start
+PROGRAM_BYTES: bytes = bytes([0xb9, 0x03, 0x00, 0x01, 0xc8, 0x89, 0xc3, 0x83, 0xf8, 0x00, 0x83, 0xe9, 0x01, 0x75, 0xf4])
+
+
+class RecordingTraceSink(TraceSink):
+    def __init__(self):
+        self.steps: list[tuple[int, int, int, tuple[int, ...], int]] = []
+
+    def on_step(self, processor: Processor8086, operation_index: int, instruction_ptr_before: int) -> None:
+        self.steps.append((instruction_ptr_before, processor.instruction_ptr, operation_index, tuple(processor.registers), processor.get_flags_value()))
+
+
+class TeeTraceSink(TraceSink):
+    def __init__(self, trace_sinks: list[TraceSink]):
+        self.trace_sinks: list[TraceSink] = trace_sinks
+
+    def on_step(self, processor: Processor8086, operation_index: int, instruction_ptr_before: int) -> None:
+        for trace_sink in self.trace_sinks:
+            trace_sink.on_step(processor, operation_index, instruction_ptr_before)
+
+    def close(self) -> None:
+        for trace_sink in self.trace_sinks:
+            trace_sink.close()
+
+
+def write_trace(file_name: str, compress: bool) -> RecordingTraceSink:
+    processor: Processor8086 = Processor8086()
+    processor.load_operation_stream(list(iter_decode(PROGRAM_BYTES)))
+    recording_trace_sink: RecordingTraceSink = RecordingTraceSink()
+    trace_sink: TeeTraceSink = TeeTraceSink([recording_trace_sink, BinaryTraceSink(open_trace_file_for_writing(file_name, compress), processor)])
+    processor.simulate(trace_sink=trace_sink)
+    trace_sink.close()
+    return recording_trace_sink
+
+
+@pytest.mark.parametrize('compress', [False, True])
+@pytest.mark.parametrize('read_num_bytes', [7, execution_trace_8086.TRACE_BUFFER_NUM_BYTES])
+def test_records_rebuild_every_step(tmp_path, monkeypatch, compress: bool, read_num_bytes: int):
+    # small reads split records across chunks
+    monkeypatch.setattr(execution_trace_8086, 'TRACE_BUFFER_NUM_BYTES', read_num_bytes)
+    file_name: str = os.path.join(tmp_path, 'trace')
+    recording_trace_sink: RecordingTraceSink = write_trace(file_name, compress)
+    with open_trace_file_for_reading(file_name) as trace_file:
+        records = [(record.instruction_ptr_before, record.instruction_ptr_after, record.operation_index, record.registers, record.flags_value)
+                   for record in TraceReader(trace_file).iter_records()]
+    assert records == recording_trace_sink.steps
+
+
+def test_records_only_store_changed_registers(tmp_path):
+    file_name: str = os.path.join(tmp_path, 'trace')
+    recording_trace_sink: RecordingTraceSink = write_trace(file_name, False)
+    with open(file_name, 'rb') as trace_file:
+        trace_reader: TraceReader = TraceReader(trace_file)
+        header_num_bytes: int = trace_file.tell()
+    num_changed_registers: int = 0
+    previous_registers: tuple[int, ...] = trace_reader.initial_registers
+    for _, _, _, registers, _ in recording_trace_sink.steps:
+        num_changed_registers += sum(value != previous_value for value, previous_value in zip(registers, previous_registers))
+        previous_registers = registers
+    expected_num_bytes: int = header_num_bytes + len(recording_trace_sink.steps) * trace_record_header_struct.size + 2 * num_changed_registers
+    assert os.path.getsize(file_name) == expected_num_bytes
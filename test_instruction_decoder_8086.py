@@ -0,0 +1,135 @@
+import io
+import random
+
+import pytest
+
+from byte_reader import ByteReader
+from instruction_decoder_8086 import MAX_INSTRUCTION_NUM_BYTES, DecodeError, decode, decode_operation, get_instruction_num_bytes, iter_decode, \
+    opcode_decode_table
+from processor_8086 import get_operation_clocks
+
+supported_opcodes: list[int] = [opcode for opcode, opcode_decode_entry in enumerate(opcode_decode_table) if opcode_decode_entry is not None]
+
+
+def generate_program(num_instructions: int, seed: int) -> bytes:
+    # every supported opcode at least once, each followed by random mod reg r/m, displacement and immediate bytes that decode
+    random_generator: random.Random = random.Random(seed)
+    opcodes: list[int] = supported_opcodes + [random_generator.choice(supported_opcodes) for _ in range(num_instructions - len(supported_opcodes))]
+    random_generator.shuffle(opcodes)
+    instructions: list[bytes] = []
+    for opcode in opcodes:
+        while True:
+            instruction_bytes: bytes = bytes([opcode]) + random_generator.randbytes(MAX_INSTRUCTION_NUM_BYTES - 1)
+            try:
+                num_bytes: int = decode_operation(ByteReader(instruction_bytes)).num_bytes
+            except DecodeError:  # a reg field the opcode does not use
+                continue
+            instructions.append(instruction_bytes[:num_bytes])
+            break
+    return b''.join(instructions)
+
+
+PROGRAM_BYTES: bytes = generate_program(2048, seed=1)
+
+
+def get_decode_strs(operations) -> list[str]:
+    return [f'{operation} {operation.num_bytes}' for operation in operations]
+
+
+expected_decode_strs: list[str] = get_decode_strs(decode(ByteReader(PROGRAM_BYTES)))
+
+
+
+def test_program_covers_every_supported_opcode():
+    operations = decode(ByteReader(PROGRAM_BYTES))
+    assert len(operations) == 2048
+    opcodes: set[int] = set()
+    start: int = 0
+    for operation in operations:
+        # the size worked out up front for the bounds check has to agree with what the handlers read
+        assert get_instruction_num_bytes(ByteReader(PROGRAM_BYTES[start:start + MAX_INSTRUCTION_NUM_BYTES])) == operation.num_bytes
+        opcodes.add(PROGRAM_BYTES[start])
+        start += operation.num_bytes
+    assert opcodes == set(supported_opcodes)
+    assert opcodes >= {*range(0xb0, 0xc0), *range(0xa0, 0xa4), 0x8c, 0x8e, *range(0xe0, 0xe4)}
+
+@pytest.mark.parametrize('chunk_num_bytes', range(1, MAX_INSTRUCTION_NUM_BYTES + 2))
+def test_iter_decode_of_a_file_matches_decode(chunk_num_bytes: int):
+    assert get_decode_strs(iter_decode(io.BytesIO(PROGRAM_BYTES), chunk_num_bytes)) == expected_decode_strs
+
+
+@pytest.mark.parametrize('chunk_num_bytes', range(1, MAX_INSTRUCTION_NUM_BYTES + 2))
+def test_iter_decode_of_chunks_matches_decode(chunk_num_bytes: int):
+    chunks: list[bytes] = [PROGRAM_BYTES[start:start + chunk_num_bytes] for start in range(0, len(PROGRAM_BYTES), chunk_num_bytes)]
+    assert get_decode_strs(iter_decode(chunks)) == expected_decode_strs
+
+
+def test_iter_decode_of_uneven_chunks_matches_decode():
+    chunk_num_bytes_cycle: list[int] = [1, 5, 2, 7, 3, 6, 4]
+    chunks: list[bytes] = []
+    start: int = 0
+    while start < len(PROGRAM_BYTES):
+        chunk_num_bytes: int = chunk_num_bytes_cycle[len(chunks) % len(chunk_num_bytes_cycle)]
+        chunks.append(PROGRAM_BYTES[start:start + chunk_num_bytes])
+        start += chunk_num_bytes
+    assert get_decode_strs(iter_decode(chunks)) == expected_decode_strs
+
+
+def test_iter_decode_of_a_buffer_matches_decode():
+    assert get_decode_strs(iter_decode(PROGRAM_BYTES)) == expected_decode_strs
+    assert get_decode_strs(iter_decode(memoryview(PROGRAM_BYTES))) == expected_decode_strs
+
+
+
+@pytest.mark.parametrize('program_bytes, expected_decode_str', [
+    (bytes([0x83, 0x07, 0xff]), 'add [bx], word  -1'),
+    (bytes([0x83, 0xe8, 0xff]), 'sub ax, -1'),
+    (bytes([0x83, 0xf8, 0x80]), 'cmp ax, -128'),
+    (bytes([0x83, 0x07, 0x7f]), 'add [bx], word  127'),
+    (bytes([0x80, 0x07, 0xff]), 'add [bx], byte  255'),
+    (bytes([0x81, 0x07, 0xff, 0xff]), 'add [bx], word  65535'),
+])
+def test_immediate_group_operands(program_bytes: bytes, expected_decode_str: str):
+    assert [str(operation) for operation in decode(ByteReader(program_bytes))] == [expected_decode_str]
+
+
+# the accumulator forms always carry a 16 bit address, the w bit only picks al or ax
+@pytest.mark.parametrize('program_bytes, expected_decode_str', [
+    (bytes([0xa0, 0x34, 0x12]), 'mov al, [4660] 3'),
+    (bytes([0xa1, 0x34, 0x12]), 'mov ax, [4660] 3'),
+    (bytes([0xa2, 0x34, 0x12]), 'mov [4660], al 3'),
+    (bytes([0xa3, 0x34, 0x12]), 'mov [4660], ax 3'),
+])
+def test_accumulator_memory_movs(program_bytes: bytes, expected_decode_str: str):
+    assert get_decode_strs(decode(ByteReader(program_bytes))) == [expected_decode_str]
+    assert get_instruction_num_bytes(ByteReader(program_bytes)) == 3
+    assert get_operation_clocks(decode(ByteReader(program_bytes))[0]) == 10
+
+
+
+# the segment register movs are 16 bit with the segment register in reg, whatever their w bit says
+@pytest.mark.parametrize('program_bytes, expected_decode_str', [
+    (bytes([0x8c, 0xc0]), 'mov ax, es 2'),
+    (bytes([0x8e, 0xd8]), 'mov ds, ax 2'),
+    (bytes([0x8c, 0x0f]), 'mov [bx], cs 2'),
+    (bytes([0x8e, 0x17]), 'mov ss, [bx] 2'),
+    (bytes([0x8c, 0x46, 0x02]), 'mov [bp + 2], es 3'),
+    (bytes([0x8e, 0x06, 0x34, 0x12]), 'mov es, [4660] 4'),
+])
+def test_segment_register_movs(program_bytes: bytes, expected_decode_str: str):
+    assert get_decode_strs(decode(ByteReader(program_bytes))) == [expected_decode_str]
+    assert get_instruction_num_bytes(ByteReader(program_bytes)) == len(program_bytes)
+
+
+@pytest.mark.parametrize('opcode', [0x8c, 0x8e])
+def test_segment_register_movs_reject_reg_fields_past_ds(opcode: int):
+    for reg in range(4, 8):
+        with pytest.raises(DecodeError, match=f'Unknown segment register {reg}'):
+            decode(ByteReader(bytes([opcode, 0xc0 | reg << 3])))
+
+def test_decoder_script_still_exports_the_decoder():
+    import decoder_8086
+    import instruction_decoder_8086
+    assert decoder_8086.decode is instruction_decoder_8086.decode
+    assert decoder_8086.Operation is instruction_decoder_8086.Operation
+    assert decoder_8086.RegisterMnemonic is instruction_decoder_8086.RegisterMnemonic
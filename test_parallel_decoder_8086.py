@@ -0,0 +1,69 @@
+import pytest
+
+from byte_reader import ByteReader
+from decoded_program_8086 import DecodedProgram, decode_to_program
+from instruction_decoder_8086 import MAX_INSTRUCTION_NUM_BYTES
+from parallel_decoder_8086 import decode_chunk_speculatively, decode_parallel, stitch_chunk_programs
+from test_instruction_decoder_8086 import generate_program
+
+# random instructions of every supported opcode, so most chunk starts land inside an instruction
+PROGRAM_BYTES: bytes = generate_program(4096, seed=2)
+
+
+def get_columns(program: DecodedProgram) -> dict[str, list[int]]:
+    return {column_name: getattr(program, column_name).tolist() for column_name in DecodedProgram.column_names}
+
+
+expected_columns: dict[str, list[int]] = get_columns(decode_to_program(ByteReader(PROGRAM_BYTES)))
+
+
+def stitch_speculative_chunks(program_bytes: bytes, chunk_num_bytes: int) -> DecodedProgram:
+    # the same speculative decode and stitch as decode_parallel without the worker processes
+    chunk_starts: list[int] = list(range(0, len(program_bytes), chunk_num_bytes))
+    chunk_programs: list[DecodedProgram] = [
+        decode_chunk_speculatively(program_bytes[chunk_start:chunk_start + chunk_num_bytes + MAX_INSTRUCTION_NUM_BYTES - 1],
+                                   min(chunk_num_bytes, len(program_bytes) - chunk_start))
+        for chunk_start in chunk_starts
+    ]
+    return stitch_chunk_programs(program_bytes, chunk_starts, chunk_num_bytes, chunk_programs)
+
+
+@pytest.mark.parametrize('chunk_num_bytes', [1, 2, 3, 5, 6, 7, 64, 1000, len(PROGRAM_BYTES) - 1])
+def test_stitched_chunks_match_serial_decode(chunk_num_bytes: int):
+    assert get_columns(stitch_speculative_chunks(PROGRAM_BYTES, chunk_num_bytes)) == expected_columns
+
+
+RESYNC_CHUNK_NUM_BYTES: int = 64
+
+
+def create_program_with_a_jump_across_a_chunk_start(jump_opcode: int, jump_offset: int) -> bytes:
+    # mov ax, imm16 and 30 mov al, imm8 fill the first chunk up to its last byte, where the jump starts so its offset byte begins the next chunk
+    prefix_bytes: bytes = bytes([0xb8, 0x34, 0x12]) + bytes([0xb0, 0x01]) * 30
+    assert len(prefix_bytes) == RESYNC_CHUNK_NUM_BYTES - 1
+    return prefix_bytes + bytes([jump_opcode, jump_offset]) + generate_program(300, seed=jump_opcode)
+
+
+# loopne, loope, loop and jcxz, with offset bytes that read as the start of long instructions, a jump or an unknown opcode
+@pytest.mark.parametrize('jump_opcode', [0xe0, 0xe1, 0xe2, 0xe3])
+@pytest.mark.parametrize('jump_offset', [0x81, 0xc7, 0xb8, 0xa1, 0x8c, 0xe2, 0x0f, 0x00])
+def test_stitched_chunks_resync_after_a_chunk_starting_inside_a_loop_or_jcxz(jump_opcode: int, jump_offset: int):
+    program_bytes: bytes = create_program_with_a_jump_across_a_chunk_start(jump_opcode, jump_offset)
+    assert get_columns(stitch_speculative_chunks(program_bytes, RESYNC_CHUNK_NUM_BYTES)) == get_columns(decode_to_program(ByteReader(program_bytes)))
+
+
+@pytest.mark.parametrize('chunk_num_bytes', [7, 509])
+def test_decode_parallel_matches_serial_decode(chunk_num_bytes: int):
+    assert get_columns(decode_parallel(PROGRAM_BYTES, max_workers=2, chunk_num_bytes=chunk_num_bytes)) == expected_columns
+
+
+def test_decode_parallel_of_a_program_ending_mid_chunk():
+    program_bytes: bytes = PROGRAM_BYTES[:sum(expected_columns['num_bytes'][:400])]
+    assert len(program_bytes) % 256
+    assert get_columns(decode_parallel(program_bytes, max_workers=2, chunk_num_bytes=256)) == \
+        get_columns(decode_to_program(ByteReader(program_bytes)))
+
+
+def test_decode_parallel_resyncs_after_a_chunk_starting_inside_a_loop():
+    program_bytes: bytes = create_program_with_a_jump_across_a_chunk_start(0xe2, 0x81)
+    assert get_columns(decode_parallel(program_bytes, max_workers=2, chunk_num_bytes=RESYNC_CHUNK_NUM_BYTES)) == \
+        get_columns(decode_to_program(ByteReader(program_bytes)))
@@ -0,0 +1,360 @@
+import io
+from array import array
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from bit_manipulation_helpers import int_as_u16_hex_str
+from instruction_decoder_8086 import RegisterMnemonic, iter_decode
+from processor_8086 import DEFAULT_TRACE_BATCH_NUM_LINES, Processor8086, SimulationError, TextTraceSink, TraceSink, flag_letters, read_memory_word
+
+
+def run_program(program_bytes: bytes, decode_on_fetch: bool = False) -> Processor8086:
+    processor: Processor8086 = Processor8086()
+    if decode_on_fetch:
+        processor.load_program_for_fetch(program_bytes)
+    else:
+        processor.load_program_image(program_bytes)
+        processor.load_operation_stream(list(iter_decode(program_bytes)))
+    processor.simulate()
+    return processor
+
+
+def get_flag_letters(processor: Processor8086) -> str:
+    flags_value: int = processor.get_flags_value()
+    return ''.join(letter for flag, letter in flag_letters if flags_value & flag)
+
+
+# mov bx, 256; mov word [bx], 5; <operation> word [bx], imm8 with the 0x83 sign extended form
+@pytest.mark.parametrize('reg, immediate_byte, expected_value, expected_flags', [
+    (0b000, 0xff, 0x0004, 'CA'),  # add word [bx], -1
+    (0b000, 0x80, 0xff85, 'S'),  # add word [bx], -128
+    (0b101, 0xff, 0x0006, 'CPA'),  # sub word [bx], -1
+    (0b111, 0xfb, 0x0005, 'CPA'),  # cmp word [bx], -5
+    (0b000, 0x7f, 0x0084, 'PA'),  # add word [bx], 127
+])
+@pytest.mark.parametrize('decode_on_fetch', [False, True])
+def test_sign_extended_byte_immediate_to_memory_word(reg: int, immediate_byte: int, expected_value: int, expected_flags: str, decode_on_fetch: bool):
+    program_bytes: bytes = bytes([0xbb, 0x00, 0x01, 0xc7, 0x07, 0x05, 0x00, 0x83, 0x07 | reg << 3, immediate_byte])
+    processor: Processor8086 = run_program(program_bytes, decode_on_fetch)
+    assert read_memory_word(processor.memory, 256) == expected_value
+    assert get_flag_letters(processor) == expected_flags
+
+
+# mov ax, 5; <operation> ax, imm8 with the 0x83 sign extended form
+@pytest.mark.parametrize('reg, immediate_byte, expected_value, expected_flags', [
+    (0b000, 0xff, 0x0004, 'CA'),  # add ax, -1
+    (0b000, 0x80, 0xff85, 'S'),  # add ax, -128
+    (0b101, 0xff, 0x0006, 'CPA'),  # sub ax, -1
+    (0b111, 0xfb, 0x0005, 'CPA'),  # cmp ax, -5
+])
+@pytest.mark.parametrize('decode_on_fetch', [False, True])
+def test_sign_extended_byte_immediate_to_register_word(reg: int, immediate_byte: int, expected_value: int, expected_flags: str, decode_on_fetch: bool):
+    program_bytes: bytes = bytes([0xb8, 0x05, 0x00, 0x83, 0xc0 | reg << 3, immediate_byte])
+    processor: Processor8086 = run_program(program_bytes, decode_on_fetch)
+    assert processor.get_register_value(RegisterMnemonic.AX) == expected_value
+    assert get_flag_letters(processor) == expected_flags
+
+
+# mov ax, 0x1234; mov [0x200], ax; mov al, [0x201]; mov [0x300], al; mov bx, ax; mov ax, [0x200]
+@pytest.mark.parametrize('decode_on_fetch', [False, True])
+def test_accumulator_memory_movs(decode_on_fetch: bool):
+    program_bytes: bytes = bytes([0xb8, 0x34, 0x12, 0xa3, 0x00, 0x02, 0xa0, 0x01, 0x02, 0xa2, 0x00, 0x03, 0x89, 0xc3, 0xa1, 0x00, 0x02])
+    processor: Processor8086 = run_program(program_bytes, decode_on_fetch)
+    assert read_memory_word(processor.memory, 0x200) == 0x1234
+    assert read_memory_word(processor.memory, 0x300) == 0x0012
+    assert processor.get_register_value(RegisterMnemonic.BX) == 0x1212
+    assert processor.get_register_value(RegisterMnemonic.AX) == 0x1234
+    assert processor.clock_count == 4 + 10 + 10 + 10 + 2 + 10
+
+
+# mov bx, 256; mov word [bx], 0x1234; mov es, [bx]; mov [bx + 2], es; mov cx, es
+@pytest.mark.parametrize('decode_on_fetch', [False, True])
+def test_segment_register_movs(decode_on_fetch: bool):
+    program_bytes: bytes = bytes([0xbb, 0x00, 0x01, 0xc7, 0x07, 0x34, 0x12, 0x8e, 0x07, 0x8c, 0x47, 0x02, 0x8c, 0xc1])
+    processor: Processor8086 = run_program(program_bytes, decode_on_fetch)
+    assert processor.get_register_value(RegisterMnemonic.ES) == 0x1234
+    assert read_memory_word(processor.memory, 0x102) == 0x1234
+    assert processor.get_register_value(RegisterMnemonic.CX) == 0x1234
+    assert processor.clock_count == 4 + 10 + 5 + 8 + 5 + 9 + 9 + 2
+
+
+# mov cx, 2; loop_start: sub cx, 1; mov ax, cx; jne loop_start
+BLOCK_LOOP_PROGRAM_BYTES: bytes = bytes([0xb9, 0x02, 0x00, 0x83, 0xe9, 0x01, 0x89, 0xc8, 0x75, 0xf9])
+
+
+@pytest.mark.parametrize('max_instructions, expected_execution_counts', [
+    (None, [1, 2]),
+    (4, [1, 1]),
+    (5, [1, 1]),
+    (3, [1, 0]),
+])
+def test_basic_block_execution_counts(max_instructions, expected_execution_counts: list[int]):
+    processor: Processor8086 = Processor8086()
+    processor.load_operation_stream(list(iter_decode(BLOCK_LOOP_PROGRAM_BYTES)))
+    processor.simulate(max_instructions)
+    assert [basic_block.execution_count for basic_block in processor.get_basic_blocks()] == expected_execution_counts
+
+
+def test_basic_block_cut_short_by_stop_address_is_not_counted():
+    processor: Processor8086 = Processor8086()
+    processor.load_operation_stream(list(iter_decode(BLOCK_LOOP_PROGRAM_BYTES)))
+    processor.simulate(stop_address=6)
+    assert [basic_block.execution_count for basic_block in processor.get_basic_blocks()] == [1, 0]
+
+
+# the IP and CX after each instruction of the block loop program, which runs 7 instructions
+block_loop_instruction_ptrs: list[int] = [0, 3, 6, 8, 3, 6, 8, 10]
+block_loop_cx_values: list[int] = [0, 2, 1, 1, 1, 0, 0, 0]
+
+
+def load_block_loop_program(simulation_mode: str) -> Processor8086:
+    processor: Processor8086 = Processor8086()
+    if simulation_mode == 'fetched':
+        processor.load_program_for_fetch(BLOCK_LOOP_PROGRAM_BYTES)
+    else:
+        processor.load_program_image(BLOCK_LOOP_PROGRAM_BYTES)
+        processor.load_operation_stream(list(iter_decode(BLOCK_LOOP_PROGRAM_BYTES)))
+    return processor
+
+
+@pytest.mark.parametrize('max_instructions', range(9))
+@pytest.mark.parametrize('simulation_mode', ['blocks', 'traced', 'fetched'])
+def test_max_instructions_stops_the_run(max_instructions: int, simulation_mode: str):
+    processor: Processor8086 = load_block_loop_program(simulation_mode)
+    trace_sink: CountingTraceSink = CountingTraceSink()
+    num_instructions: int = processor.simulate(max_instructions, trace_sink=trace_sink if simulation_mode == 'traced' else None)
+    assert num_instructions == min(max_instructions, 7)
+    assert processor.instruction_ptr == block_loop_instruction_ptrs[num_instructions]
+    assert processor.get_register_value(RegisterMnemonic.CX) == block_loop_cx_values[num_instructions]
+    if simulation_mode == 'traced':
+        assert trace_sink.num_steps == num_instructions
+
+    # a later call carries on from where the budget ran out
+    assert processor.simulate() == 7 - num_instructions
+    assert processor.instruction_ptr == 10
+
+
+@pytest.mark.parametrize('stop_address, expected_num_instructions', [
+    (0, 0),
+    (6, 2),
+    (8, 3),
+    (10, 7),
+    (5, 7),  # never reached, it is inside the sub
+])
+@pytest.mark.parametrize('simulation_mode', ['blocks', 'traced', 'fetched'])
+def test_stop_address_stops_the_run(stop_address: int, expected_num_instructions: int, simulation_mode: str):
+    processor: Processor8086 = load_block_loop_program(simulation_mode)
+    num_instructions: int = processor.simulate(stop_address=stop_address, trace_sink=CountingTraceSink() if simulation_mode == 'traced' else None)
+    assert num_instructions == expected_num_instructions
+    assert processor.instruction_ptr == block_loop_instruction_ptrs[num_instructions]
+    assert processor.get_register_value(RegisterMnemonic.CX) == block_loop_cx_values[num_instructions]
+
+
+@pytest.mark.parametrize('batch_num_lines', [1, 7, DEFAULT_TRACE_BATCH_NUM_LINES])
+def test_text_trace_sink_writes_every_step_and_quiet_runs_print_nothing(batch_num_lines: int, capsys):
+    load_block_loop_program('blocks').simulate()
+    assert capsys.readouterr().out == ''
+
+    output_file: io.StringIO = io.StringIO()
+    trace_sink: TextTraceSink = TextTraceSink(output_file, batch_num_lines)
+    load_block_loop_program('traced').simulate(5, trace_sink=trace_sink)
+    trace_sink.close()
+    post_op_lines: list[str] = [line for line in output_file.getvalue().splitlines() if line.startswith('IP post-op')]
+    assert post_op_lines == [f'IP post-op: {int_as_u16_hex_str(instruction_ptr)} {instruction_ptr}' for instruction_ptr in block_loop_instruction_ptrs[1:6]]
+    assert capsys.readouterr().out == ''
+
+
+def test_self_modifying_loop_keeps_the_fetched_operations_bounded():
+    # mov bx, 10; mov cx, 100; loop_start: add byte [bx], 1; mov al, 0; sub cx, 1; jne loop_start
+    # where the add rewrites the immediate of the mov at address 9 on every pass
+    program_bytes: bytes = bytes([0xbb, 0x0a, 0x00, 0xb9, 0x64, 0x00, 0x80, 0x07, 0x01, 0xb0, 0x00, 0x83, 0xe9, 0x01, 0x75, 0xf6])
+    processor: Processor8086 = run_program(program_bytes, decode_on_fetch=True)
+    assert processor.get_register_value(RegisterMnemonic.AL) == 100
+    assert len(processor.operation_stream) == 6
+    assert str(processor.operation_stream[processor.instruction_cache[9].operation_index]) == 'mov al, 100'
+
+
+
+@pytest.mark.parametrize('program_bytes, expected_num_instructions, expected_instruction_ptr', [
+    # mov ax, 1; cmp ax, 0; jne $+7, which jumps 5 bytes past the end of the image
+    (bytes([0xb8, 0x01, 0x00, 0x83, 0xf8, 0x00, 0x75, 0x05]), 3, 13),
+    # mov byte [5], 0xb8; mov al, 9, where the rewrite turns the last instruction into a 3 byte mov ax, 9 that runs over the end
+    (bytes([0xc6, 0x06, 0x05, 0x00, 0xb8, 0xb0, 0x09]), 2, 8),
+], ids=['jump_past_the_end', 'rewritten_last_instruction'])
+def test_fetching_stops_once_the_ip_is_past_the_end_of_the_image(program_bytes: bytes, expected_num_instructions: int, expected_instruction_ptr: int):
+    processor: Processor8086 = Processor8086()
+    processor.load_program_for_fetch(program_bytes)
+    assert processor.simulate(max_instructions=100) == expected_num_instructions
+    assert processor.instruction_ptr == expected_instruction_ptr
+
+
+# mov ax, 1; cmp ax, 0; jne with the offset under test, from address 8
+@pytest.mark.parametrize('jump_offset, expected_message', [
+    (-7, 'Jump target 1 lands in the middle of an instruction'),
+    (-4, 'Jump target 4 lands in the middle of an instruction'),
+    (5, 'Jump target 13 is outside the program'),
+    (-9, 'Jump target -1 is outside the program'),
+])
+@pytest.mark.parametrize('traced', [False, True])
+def test_jumps_must_land_on_an_instruction(jump_offset: int, expected_message: str, traced: bool):
+    program_bytes: bytes = bytes([0xb8, 0x01, 0x00, 0x83, 0xf8, 0x00, 0x75, jump_offset & 0xff])
+    processor: Processor8086 = Processor8086()
+    processor.load_operation_stream(list(iter_decode(program_bytes)))
+    assert [processor.address_to_operation_index[address] for address in range(len(program_bytes) + 1)] == [0, -1, -1, 1, -1, -1, 2, -1, 3]
+    with pytest.raises(SimulationError, match=expected_message):
+        processor.simulate(trace_sink=CountingTraceSink() if traced else None)
+
+# the conditional jumps in opcode order 0x70 to 0x7f, each with its condition on the carry, parity, zero, sign and overflow flags
+conditional_jump_reference_conditions: tuple[tuple[str, Callable[[dict[str, bool]], bool]], ...] = (
+    ('jo', lambda flags: flags['O']),
+    ('jno', lambda flags: not flags['O']),
+    ('jb', lambda flags: flags['C']),
+    ('jae', lambda flags: not flags['C']),
+    ('je', lambda flags: flags['Z']),
+    ('jne', lambda flags: not flags['Z']),
+    ('jbe', lambda flags: flags['C'] or flags['Z']),
+    ('ja', lambda flags: not flags['C'] and not flags['Z']),
+    ('js', lambda flags: flags['S']),
+    ('jns', lambda flags: not flags['S']),
+    ('jp', lambda flags: flags['P']),
+    ('jnp', lambda flags: not flags['P']),
+    ('jl', lambda flags: flags['S'] != flags['O']),
+    ('jge', lambda flags: flags['S'] == flags['O']),
+    ('jle', lambda flags: flags['Z'] or flags['S'] != flags['O']),
+    ('jg', lambda flags: not flags['Z'] and flags['S'] == flags['O']),
+)
+JUMP_RESULTS_ADDRESS: int = 0x1000
+
+
+def get_reference_flags(instruction_name: str, dst: int, src: int, num_bits: int) -> dict[str, bool]:
+    # worked out from the signed and unsigned results rather than bit tricks, so it does not share the simulator's formulas
+    width_mask: int = (1 << num_bits) - 1
+    sign_bit: int = 1 << (num_bits - 1)
+    signed_dst: int = dst - (dst & sign_bit) * 2
+    signed_src: int = src - (src & sign_bit) * 2
+    if instruction_name == 'add':
+        unsigned_result, signed_result, nibble_result = dst + src, signed_dst + signed_src, (dst & 0xf) + (src & 0xf)
+    else:
+        unsigned_result, signed_result, nibble_result = dst - src, signed_dst - signed_src, (dst & 0xf) - (src & 0xf)
+    result: int = unsigned_result & width_mask
+    return {
+        'C': not 0 <= unsigned_result <= width_mask,
+        'P': bin(result & 0xff).count('1') % 2 == 0,
+        'A': not 0 <= nibble_result <= 0xf,
+        'Z': result == 0,
+        'S': result & sign_bit != 0,
+        'O': not -sign_bit <= signed_result < sign_bit,
+    }
+
+
+def create_conditional_jump_program(instruction_name: str, dst: int, src: int, num_bits: int) -> bytes:
+    # mov ax, dst; mov bx, src; <instruction> ax, bx or al, bl, then for every conditional jump
+    # j<condition> $+7; mov byte [JUMP_RESULTS_ADDRESS + index], 1 so the byte is only set when the jump is not taken
+    alu_opcode: int = {'add': 0x00, 'sub': 0x28, 'cmp': 0x38}[instruction_name] | (num_bits == 16)
+    program_bytes: bytearray = bytearray([0xb8, dst & 0xff, dst >> 8, 0xbb, src & 0xff, src >> 8, alu_opcode, 0xd8])
+    for index in range(len(conditional_jump_reference_conditions)):
+        address: int = JUMP_RESULTS_ADDRESS + index
+        program_bytes += bytes([0x70 + index, 0x05, 0xc6, 0x06, address & 0xff, address >> 8, 0x01])
+    return bytes(program_bytes)
+
+
+class CountingTraceSink(TraceSink):
+    def __init__(self):
+        self.num_steps: int = 0
+
+    def on_step(self, processor: Processor8086, operation_index: int, instruction_ptr_before: int) -> None:
+        self.num_steps += 1
+
+
+word_operand_values: tuple[int, ...] = (0x0000, 0x0001, 0x0010, 0x7fff, 0x8000, 0x8001, 0xfffe, 0xffff, 0x1234)
+byte_operand_values: tuple[int, ...] = (0x00, 0x01, 0x0f, 0x7f, 0x80, 0x81, 0xff)
+conditional_jump_cases: list[tuple[str, int, int, int]] = \
+    [(instruction_name, dst, src, 16) for instruction_name in ('add', 'sub', 'cmp') for dst in word_operand_values for src in word_operand_values] + \
+    [(instruction_name, dst, src, 8) for instruction_name in ('add', 'cmp') for dst in byte_operand_values for src in byte_operand_values]
+
+
+# fused basic blocks, one operation at a time through a trace sink, and decode on fetch each take their own jump code path
+@pytest.mark.parametrize('simulation_mode', ['blocks', 'traced', 'fetched'])
+def test_conditional_jumps_follow_the_flags(simulation_mode: str):
+    processor: Processor8086 = Processor8086()
+    for instruction_name, dst, src, num_bits in conditional_jump_cases:
+        program_bytes: bytes = create_conditional_jump_program(instruction_name, dst, src, num_bits)
+        processor.memory[JUMP_RESULTS_ADDRESS:JUMP_RESULTS_ADDRESS + len(conditional_jump_reference_conditions)] = bytes(len(conditional_jump_reference_conditions))
+        processor.registers[:] = array('H', bytes(len(processor.registers) * 2))
+        if simulation_mode == 'fetched':
+            processor.load_program_for_fetch(program_bytes)
+        else:
+            processor.load_program_image(program_bytes)
+            processor.load_operation_stream(list(iter_decode(program_bytes)))
+        processor.simulate(trace_sink=CountingTraceSink() if simulation_mode == 'traced' else None)
+
+        reference_flags: dict[str, bool] = get_reference_flags(instruction_name, dst, src, num_bits)
+        case_name: str = f'{instruction_name} {dst:#x}, {src:#x} ({num_bits} bit)'
+        assert get_flag_letters(processor) == ''.join(letter for letter in 'CPAZSO' if reference_flags[letter]), case_name
+        for index, (jump_name, reference_condition) in enumerate(conditional_jump_reference_conditions):
+            is_taken: bool = processor.memory[JUMP_RESULTS_ADDRESS + index] == 0
+            assert is_taken == reference_condition(reference_flags), f'{jump_name} after {case_name}'
+
+
+
+class ClockRecordingTraceSink(TraceSink):
+    def __init__(self):
+        self.step_clocks: list[int] = []
+        self.previous_clock_count: int = 0
+
+    def on_step(self, processor: Processor8086, operation_index: int, instruction_ptr_before: int) -> None:
+        self.step_clocks.append(processor.clock_count - self.previous_clock_count)
+        self.previous_clock_count = processor.clock_count
+
+
+# the clocks of every step from the 8086 manual's instruction timing tables, base clocks plus the effective address clocks
+clock_estimate_programs: dict[str, tuple[bytes, list[int]]] = {
+    'listing_0048_ip_register': (Path(__file__).with_name('listing_0048_ip_register').read_bytes(), [4, 2, 4, 4, 3]),
+    # jnz taken 16 clocks, not taken 4
+    'listing_0049_conditional_jumps': (Path(__file__).with_name('listing_0049_conditional_jumps').read_bytes(), [4, 4] + [4, 4, 16] * 2 + [4, 4, 4]),
+    # the course's estimating cycles listing: mov bx, 1000; mov bp, 2000; mov si, 3000; mov di, 4000; mov cx, bx; mov dx, 12; mov dx, [1000];
+    # mov cx, [bx]; mov cx, [bp]; mov [si], cx; mov [di], cx; mov cx, [bx + 1000]; mov cx, [bp + 1000]; mov [si + 1000], cx; mov [di + 1000], cx;
+    # add cx, dx; add [di + 1000], cx; add dx, 50
+    'estimating_cycles': (bytes([0xbb, 0xe8, 0x03, 0xbd, 0xd0, 0x07, 0xbe, 0xb8, 0x0b, 0xbf, 0xa0, 0x0f, 0x89, 0xd9, 0xba, 0x0c, 0x00,
+                                 0x8b, 0x16, 0xe8, 0x03, 0x8b, 0x0f, 0x8b, 0x4e, 0x00, 0x89, 0x0c, 0x89, 0x0d, 0x8b, 0x8f, 0xe8, 0x03,
+                                 0x8b, 0x8e, 0xe8, 0x03, 0x89, 0x8c, 0xe8, 0x03, 0x89, 0x8d, 0xe8, 0x03, 0x01, 0xd1, 0x01, 0x8d, 0xe8, 0x03,
+                                 0x83, 0xc2, 0x32]),
+                          [4, 4, 4, 4, 2, 4, 8 + 6, 8 + 5, 8 + 9, 9 + 5, 9 + 5, 8 + 9, 8 + 9, 9 + 9, 9 + 9, 3, 16 + 9, 4]),
+    # mov bx, 1000; mov bp, 2000; mov si, 30; mov di, 40; mov cx, [bp + di]; mov cx, [bx + si]; mov cx, [bp + si]; mov cx, [bx + di];
+    # mov cx, [bp + di + 1000]; mov cx, [bx + di + 10]; add [bx + si], cx; cmp cx, [bx]; cmp word [bx], 5; add word [bx], 5; mov ax, [1000]; mov [1002], al
+    'base_index_and_immediate_forms': (bytes([0xbb, 0xe8, 0x03, 0xbd, 0xd0, 0x07, 0xbe, 0x1e, 0x00, 0xbf, 0x28, 0x00, 0x8b, 0x0b, 0x8b, 0x08, 0x8b, 0x0a,
+                                              0x8b, 0x09, 0x8b, 0x8b, 0xe8, 0x03, 0x8b, 0x49, 0x0a, 0x01, 0x08, 0x3b, 0x0f, 0x83, 0x3f, 0x05, 0x83, 0x07, 0x05,
+                                              0xa1, 0xe8, 0x03, 0xa2, 0xea, 0x03]),
+                                       [4, 4, 4, 4, 8 + 7, 8 + 7, 8 + 8, 8 + 8, 8 + 11, 8 + 12, 16 + 7, 9 + 5, 10 + 5, 17 + 5, 10, 10]),
+    # mov cx, 3; loop_start: loop loop_start, taken 17 clocks, not taken 5
+    'loop': (bytes([0xb9, 0x03, 0x00, 0xe2, 0xfe]), [4, 17, 17, 5]),
+    # mov cx, 3; loop_start: cmp ax, ax; loope loop_start, taken 18 clocks, not taken 6
+    'loope': (bytes([0xb9, 0x03, 0x00, 0x39, 0xc0, 0xe1, 0xfc]), [4] + [3, 18] * 2 + [3, 6]),
+    # mov cx, 3; mov ax, 1; loop_start: cmp ax, bx; loopne loop_start, taken 19 clocks, not taken 5
+    'loopne': (bytes([0xb9, 0x03, 0x00, 0xb8, 0x01, 0x00, 0x39, 0xd8, 0xe0, 0xfc]), [4, 4] + [3, 19] * 2 + [3, 5]),
+    # mov cx, 1; jcxz end; sub cx, 1; jcxz end; mov cx, 5; end:, taken 18 clocks, not taken 6
+    'jcxz': (bytes([0xb9, 0x01, 0x00, 0xe3, 0x08, 0x83, 0xe9, 0x01, 0xe3, 0x03, 0xb9, 0x05, 0x00]), [4, 6, 4, 18]),
+}
+
+
+@pytest.mark.parametrize('program_name', clock_estimate_programs)
+def test_estimated_clocks(program_name: str):
+    program_bytes, expected_step_clocks = clock_estimate_programs[program_name]
+    trace_sink: ClockRecordingTraceSink = ClockRecordingTraceSink()
+    processor: Processor8086 = Processor8086()
+    processor.load_program_image(program_bytes)
+    processor.load_operation_stream(list(iter_decode(program_bytes)))
+    processor.simulate(trace_sink=trace_sink)
+    assert trace_sink.step_clocks == expected_step_clocks
+
+    # the fused basic blocks and decode on fetch add up their clocks on their own paths
+    for decode_on_fetch in (False, True):
+        assert run_program(program_bytes, decode_on_fetch).clock_count == sum(expected_step_clocks)
+
+def test_simulator_script_still_exports_the_processor():
+    import simulator_8086
+    assert simulator_8086.Processor8086 is Processor8086
+    assert simulator_8086.RegisterMnemonic is RegisterMnemonic
+    assert simulator_8086.read_memory_word is read_memory_word
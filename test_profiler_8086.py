@@ -0,0 +1,78 @@
+import io
+import json
+
+import pytest
+
+from instruction_decoder_8086 import InstructionType, iter_decode
+from processor_8086 import Processor8086
+from profiler_8086 import ExecutionProfile, InstructionProfile, run_profiled, write_profile_json, write_profile_report
+
+# mov cx, 20000; loop_start: add ax, 1; cmp cx, 5000; jb skip; add bx, 1; skip: sub cx, 1; jne loop_start
+BRANCHING_LOOP_PROGRAM_BYTES: bytes = bytes([0xb9, 0x20, 0x4e, 0x83, 0xc0, 0x01, 0x81, 0xf9, 0x88, 0x13, 0x72, 0x03, 0x83, 0xc3, 0x01, 0x83, 0xe9, 0x01, 0x75, 0xef])
+
+# count, taken and not taken per address, the jb is taken for the last 4999 passes
+expected_instruction_counts: dict[int, tuple[int, int, int]] = {
+    0: (1, 0, 0),
+    3: (20000, 0, 0),
+    6: (20000, 0, 0),
+    10: (20000, 4999, 15001),
+    12: (15001, 0, 0),
+    15: (20000, 0, 0),
+    18: (20000, 19999, 1),
+}
+EXPECTED_NUM_INSTRUCTIONS: int = sum(count for count, _, _ in expected_instruction_counts.values())
+
+
+def profile_program(sample_interval: int) -> tuple[Processor8086, ExecutionProfile]:
+    processor: Processor8086 = Processor8086()
+    processor.load_program_image(BRANCHING_LOOP_PROGRAM_BYTES)
+    processor.load_operation_stream(list(iter_decode(BRANCHING_LOOP_PROGRAM_BYTES)))
+    return processor, run_profiled(processor, sample_interval)
+
+
+def get_instruction_profiles_by_address(profile: ExecutionProfile) -> dict[int, InstructionProfile]:
+    return {instruction_profile.address: instruction_profile for instruction_profile in profile.instruction_profiles.values()}
+
+
+def io_to_str(write, profile: ExecutionProfile) -> str:
+    output_file: io.StringIO = io.StringIO()
+    write(profile, output_file)
+    return output_file.getvalue()
+
+
+def test_every_instruction_profile_is_exact():
+    processor, profile = profile_program(1)
+    assert profile.num_instructions == profile.num_samples == EXPECTED_NUM_INSTRUCTIONS
+    assert {address: (instruction_profile.count, instruction_profile.num_taken, instruction_profile.num_not_taken)
+            for address, instruction_profile in get_instruction_profiles_by_address(profile).items()} == expected_instruction_counts
+    assert sum(instruction_profile.clocks for instruction_profile in profile.instruction_profiles.values()) == processor.clock_count
+    assert profile.get_instruction_type_counts() == {InstructionType.ADD: 35001, InstructionType.CMP: 20000, InstructionType.SUB: 20000,
+                                                     InstructionType.JB: 20000, InstructionType.JNE: 20000, InstructionType.MOV: 1}
+
+    profile_json: dict = json.loads(io_to_str(write_profile_json, profile))
+    for instruction_json in profile_json['instructions']:
+        count, num_taken, num_not_taken = expected_instruction_counts[instruction_json['address']]
+        assert instruction_json['samples'] == instruction_json['estimated_count'] == count
+        if 'estimated_taken' in instruction_json:
+            assert (instruction_json['estimated_taken'], instruction_json['estimated_not_taken']) == (num_taken, num_not_taken)
+
+
+@pytest.mark.parametrize('sample_interval', [4, 16])
+def test_sampled_profile_estimates_the_exact_counts(sample_interval: int):
+    _, profile = profile_program(sample_interval)
+    assert profile.num_instructions == EXPECTED_NUM_INSTRUCTIONS
+    assert profile.num_samples < EXPECTED_NUM_INSTRUCTIONS / (sample_interval / 2)
+
+    # the jump directions are scaled the same way as the counts, so taken and not taken add up to the estimated count
+    profile_json: dict = json.loads(io_to_str(write_profile_json, profile))
+    for instruction_json in profile_json['instructions']:
+        count, num_taken, num_not_taken = expected_instruction_counts[instruction_json['address']]
+        assert instruction_json['estimated_count'] == pytest.approx(count, rel=0.1, abs=sample_interval)
+        if 'estimated_taken' in instruction_json:
+            assert instruction_json['estimated_taken'] == pytest.approx(num_taken, rel=0.1, abs=sample_interval)
+            assert instruction_json['estimated_not_taken'] == pytest.approx(num_not_taken, rel=0.1, abs=sample_interval)
+            assert abs(instruction_json['estimated_taken'] + instruction_json['estimated_not_taken'] - instruction_json['estimated_count']) <= 1
+
+    jb_profile: InstructionProfile = get_instruction_profiles_by_address(profile)[10]
+    scale: float = profile.get_scale()
+    assert f'(taken {round(jb_profile.num_taken * scale)}, not taken {round(jb_profile.num_not_taken * scale)})' in io_to_str(write_profile_report, profile)
@@ -0,0 +1,71 @@
+import pytest
+
+from instruction_decoder_8086 import iter_decode
+from processor_8086 import MEMORY_PAGE_SHIFT, Processor8086
+from snapshot_8086 import Checkpoints, ProcessorSnapshot
+
+# mov cx, 50; mov bx, 0x1000; loop_start: add word [bx], cx; add bx, 0x200; sub cx, 1; jne loop_start
+# every pass writes memory, eight passes to each 4 KB page from 0x1000 up
+PAGE_WRITING_PROGRAM_BYTES: bytes = bytes([0xb9, 0x32, 0x00, 0xbb, 0x00, 0x10, 0x01, 0x0f, 0x81, 0xc3, 0x00, 0x02, 0x83, 0xe9, 0x01, 0x75, 0xf5])
+PAGE_WRITING_PROGRAM_NUM_INSTRUCTIONS: int = 2 + 50 * 4
+
+
+def create_processor() -> Processor8086:
+    processor: Processor8086 = Processor8086()
+    processor.load_program_image(PAGE_WRITING_PROGRAM_BYTES)
+    processor.load_operation_stream(list(iter_decode(PAGE_WRITING_PROGRAM_BYTES)))
+    return processor
+
+
+def run_uninterrupted(max_instructions: int) -> Processor8086:
+    processor: Processor8086 = create_processor()
+    processor.simulate(max_instructions)
+    return processor
+
+
+def get_processor_state(processor: Processor8086) -> tuple:
+    return list(processor.registers), processor.get_flags_value(), processor.instruction_ptr, processor.clock_count, bytes(processor.memory)
+
+
+@pytest.mark.parametrize('interval', [1, 7, 64])
+def test_restored_snapshots_match_an_uninterrupted_run(interval: int):
+    checkpoints: Checkpoints = Checkpoints(create_processor(), interval)
+    assert checkpoints.run() == PAGE_WRITING_PROGRAM_NUM_INSTRUCTIONS
+    assert get_processor_state(checkpoints.processor) == get_processor_state(run_uninterrupted(PAGE_WRITING_PROGRAM_NUM_INSTRUCTIONS))
+
+    # rewinding in both directions, landing on and between snapshots
+    for instruction_count in (0, 13, 150, 64, 1, 128, PAGE_WRITING_PROGRAM_NUM_INSTRUCTIONS, 7):
+        assert checkpoints.run_to_instruction_count(instruction_count) == instruction_count
+        assert get_processor_state(checkpoints.processor) == get_processor_state(run_uninterrupted(instruction_count))
+
+
+def test_writes_after_a_snapshot_do_not_leak_into_it():
+    checkpoints: Checkpoints = Checkpoints(create_processor(), 10)
+    checkpoints.run(20)
+    snapshot: ProcessorSnapshot = checkpoints.get_nearest_snapshot(20)
+    assert snapshot.instruction_count == 20
+    expected_state: tuple = get_processor_state(run_uninterrupted(20))
+
+    checkpoints.run()
+    assert b''.join(snapshot.memory_pages) == expected_state[-1]
+    assert list(snapshot.registers) == expected_state[0]
+
+    # only the page written between the two snapshots is a new copy, the others stay shared
+    earlier_snapshot: ProcessorSnapshot = checkpoints.get_nearest_snapshot(19)
+    changed_page_indices: list[int] = [page_index for page_index, page in enumerate(snapshot.memory_pages) if page is not earlier_snapshot.memory_pages[page_index]]
+    assert changed_page_indices == [0x1000 >> MEMORY_PAGE_SHIFT]
+
+    checkpoints.restore(snapshot)
+    assert get_processor_state(checkpoints.processor) == expected_state
+
+
+def test_serialized_snapshots_restore_the_same_state():
+    checkpoints: Checkpoints = Checkpoints(create_processor(), 25)
+    checkpoints.run()
+
+    loaded_checkpoints: Checkpoints = Checkpoints(create_processor(), 25)
+    loaded_checkpoints.load_snapshots(checkpoints.to_bytes())
+    assert loaded_checkpoints.snapshot_instruction_counts == checkpoints.snapshot_instruction_counts
+    for instruction_count in (175, 50, 110):
+        assert loaded_checkpoints.run_to_instruction_count(instruction_count) == instruction_count
+        assert get_processor_state(loaded_checkpoints.processor) == get_processor_state(run_uninterrupted(instruction_count))
@@ -0,0 +1,60 @@
+from array import array
+from typing import Optional
+
+import pytest
+
+from instruction_decoder_8086 import RegisterMnemonic, iter_decode
+from processor_8086 import Processor8086, SimulationError
+
+np = pytest.importorskip('numpy')
+from vectorized_simulator_8086 import VectorizedProcessor8086  # noqa: E402 only importable with numpy installed
+
+NUM_LANES: int = 64
+
+# jcxz end; loop_start: add ax, bx; cmp ax, dx; jl less; sub dx, 7; less: add bl, cl; jp even; sub bx, 3; even: loop loop_start; end:
+# the lanes split on the jl, jp and jcxz and run the loop a different number of times
+BRANCHING_LOOP_PROGRAM_BYTES: bytes = bytes([0xe3, 0x12, 0x01, 0xd8, 0x39, 0xd0, 0x7c, 0x03, 0x83, 0xea, 0x07, 0x00, 0xcb, 0x7a, 0x03, 0x83, 0xeb, 0x03,
+                                             0xe2, 0xee])
+
+
+def create_vectorized_processor(program_bytes: bytes, seed: int) -> VectorizedProcessor8086:
+    processor: VectorizedProcessor8086 = VectorizedProcessor8086(NUM_LANES)
+    random_generator = np.random.default_rng(seed)
+    for register_mnemonic in (RegisterMnemonic.AX, RegisterMnemonic.BX, RegisterMnemonic.DX):
+        processor.set_register_values(register_mnemonic, random_generator.integers(0, 0x10000, NUM_LANES))
+    processor.set_register_values(RegisterMnemonic.CX, random_generator.integers(0, 0x100, NUM_LANES))  # short loops keep the scalar runs quick
+    processor.load_operation_stream(list(iter_decode(program_bytes)))
+    return processor
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('max_steps', [None, 40])
+def test_lanes_match_the_scalar_simulator(seed: int, max_steps: Optional[int]):
+    processor: VectorizedProcessor8086 = create_vectorized_processor(BRANCHING_LOOP_PROGRAM_BYTES, seed)
+    initial_registers = processor.registers.copy()
+    processor.simulate(max_steps)
+    assert len(set(processor.instruction_counts.tolist())) > 1
+
+    for lane in range(NUM_LANES):
+        scalar_processor: Processor8086 = Processor8086()
+        scalar_processor.registers = array('H', initial_registers[:, lane].tolist())
+        scalar_processor.load_operation_stream(list(iter_decode(BRANCHING_LOOP_PROGRAM_BYTES)))
+        assert scalar_processor.simulate(int(processor.instruction_counts[lane])) == processor.instruction_counts[lane]
+        assert scalar_processor.registers == processor.get_lane_registers(lane)
+        assert scalar_processor.get_flags_value() == processor.flags[lane]
+        assert scalar_processor.instruction_ptr == processor.instruction_ptrs[lane]
+
+
+# cmp ax, 0x8000; jb end; mov [bx], ax; end:
+MEMORY_OPERAND_PROGRAM_BYTES: bytes = bytes([0x3d, 0x00, 0x80, 0x72, 0x02, 0x89, 0x07])
+
+
+def test_memory_operands_only_fail_the_lanes_that_reach_them():
+    processor: VectorizedProcessor8086 = create_vectorized_processor(MEMORY_OPERAND_PROGRAM_BYTES, 0)
+    processor.set_register_values(RegisterMnemonic.AX, 0x1234)
+    processor.simulate()
+    assert processor.instruction_counts.tolist() == [2] * NUM_LANES
+
+    processor = create_vectorized_processor(MEMORY_OPERAND_PROGRAM_BYTES, 0)
+    with pytest.raises(SimulationError, match='Only register destinations are vectorized'):
+        processor.simulate()
@@ -0,0 +1,86 @@
+import argparse
+import sys
+from typing import Iterator, Optional, TextIO
+
+from bit_manipulation_helpers import int_as_u16_hex_str
+from execution_trace_8086 import TraceReader, TraceRecord, open_trace_file_for_reading
+from processor_8086 import DEFAULT_TRACE_BATCH_NUM_LINES, format_register_and_flag_state, register_file_register_names
+
+
+class TraceFilter:
+    def __init__(self, start: int = 0, count: Optional[int] = None, instruction_ptr: Optional[int] = None, instruction_text: Optional[str] = None,
+                 changed_register_mask: int = 0):
+        self.start = start
+        self.count = count
+        self.instruction_ptr = instruction_ptr
+        self.instruction_text = instruction_text
+        self.changed_register_mask = changed_register_mask  # 0 matches every step
+
+    def is_unfiltered(self) -> bool:
+        return self.start == 0 and self.count is None and self.instruction_ptr is None and self.instruction_text is None and self.changed_register_mask == 0
+
+    def iter_matching_records(self, trace_reader: TraceReader) -> Iterator[TraceRecord]:
+        num_matched: int = 0
+        for record_index, record in enumerate(trace_reader.iter_records()):
+            if record_index < self.start:
+                continue
+            if self.count is not None and num_matched >= self.count:
+                break
+            if self.instruction_ptr is not None and record.instruction_ptr_before != self.instruction_ptr:
+                continue
+            if self.instruction_text is not None and self.instruction_text not in trace_reader.instruction_texts[record.operation_index]:
+                continue
+            if self.changed_register_mask and not record.changed_register_mask & self.changed_register_mask:
+                continue
+            num_matched += 1
+            yield record
+
+
+def get_register_mask_from_names(register_names: list[str]) -> int:
+    register_mask: int = 0
+    for register_name in register_names:
+        if register_name.upper() not in register_file_register_names:
+            raise ValueError(f'Unknown register {register_name}, expected one of {", ".join(register_file_register_names)}')
+        register_mask |= 1 << register_file_register_names.index(register_name.upper())
+    return register_mask
+
+
+def render_trace(trace_reader: TraceReader, trace_filter: TraceFilter, output_file: TextIO, batch_num_lines: int = DEFAULT_TRACE_BATCH_NUM_LINES) -> None:
+    # an unfiltered trace renders exactly like simulator_8086.py --trace
+    lines: list[str] = []
+    if trace_filter.is_unfiltered():
+        lines.extend(format_register_and_flag_state(trace_reader.initial_registers, trace_reader.initial_flags_value))
+
+    for record in trace_filter.iter_matching_records(trace_reader):
+        lines.append(trace_reader.instruction_texts[record.operation_index])
+        lines.append(f'IP pre-op: {int_as_u16_hex_str(record.instruction_ptr_before)} {record.instruction_ptr_before}')
+        lines.extend(format_register_and_flag_state(record.registers, record.flags_value))
+        lines.append(f'IP post-op: {int_as_u16_hex_str(record.instruction_ptr_after)} {record.instruction_ptr_after}')
+        lines.append('')
+        if len(lines) >= batch_num_lines:
+            lines.append('')
+            output_file.write('\n'.join(lines))
+            lines.clear()
+
+    if lines:
+        lines.append('')
+        output_file.write('\n'.join(lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a binary 8086 execution trace as text')
+    parser.add_argument('trace_file_name')
+    parser.add_argument('--start', type=int, default=0, help='skip this many steps')
+    parser.add_argument('--count', type=int, default=None, help='show at most this many matching steps')
+    parser.add_argument('--ip', type=lambda value: int(value, 0), default=None, help='only show steps starting at this address')
+    parser.add_argument('--instruction', default=None, help='only show steps whose instruction text contains this string')
+    parser.add_argument('--changed', action='append', default=[], help='only show steps that changed this register, may be repeated')
+    args = parser.parse_args()
+
+    trace_filter: TraceFilter = TraceFilter(args.start, args.count, args.ip, args.instruction, get_register_mask_from_names(args.changed))
+    with open_trace_file_for_reading(args.trace_file_name) as trace_file:
+        render_trace(TraceReader(trace_file), trace_filter, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+from __future__ import annotations
+import argparse
+import time
+from array import array
+from typing import Callable, Optional, Union
+
+from byte_reader import open_mapped_file
+from decoded_program_8086 import DecodedProgram
+from instruction_decoder_8086 import iter_decode, Operation, InstructionType, OperandType, RegisterMnemonic
+from processor_8086 import SimulationError, Processor8086, RegisterField, register_mnemonic_to_register_field_map, register_file_register_names, \
+    get_operation_width_mask, get_immediate_value, parity_flag_values, cx_register_index, create_unsupported_operation, CARRY_FLAG, PARITY_FLAG, \
+    AUXILIARY_CARRY_FLAG, ZERO_FLAG, SIGN_FLAG, OVERFLOW_FLAG
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the vectorized simulator needs it
+    np = None
+
+# a boolean array selecting the lanes an operation applies to, None when every lane runs it
+LaneMask = Optional['np.ndarray']
+
+
+def create_vectorized_conditional_jump_conditions() -> dict[InstructionType, Callable[[np.ndarray], np.ndarray]]:
+    def is_set(flags: np.ndarray, flag: int) -> np.ndarray:
+        return (flags & flag) != 0
+
+    def is_less(flags: np.ndarray) -> np.ndarray:
+        return is_set(flags, SIGN_FLAG) != is_set(flags, OVERFLOW_FLAG)
+
+    return {
+        InstructionType.JO: lambda flags: is_set(flags, OVERFLOW_FLAG),
+        InstructionType.JNO: lambda flags: ~is_set(flags, OVERFLOW_FLAG),
+        InstructionType.JB: lambda flags: is_set(flags, CARRY_FLAG),
+        InstructionType.JAE: lambda flags: ~is_set(flags, CARRY_FLAG),
+        InstructionType.JE: lambda flags: is_set(flags, ZERO_FLAG),
+        InstructionType.JNE: lambda flags: ~is_set(flags, ZERO_FLAG),
+        InstructionType.JBE: lambda flags: is_set(flags, CARRY_FLAG | ZERO_FLAG),
+        InstructionType.JA: lambda flags: ~is_set(flags, CARRY_FLAG | ZERO_FLAG),
+        InstructionType.JS: lambda flags: is_set(flags, SIGN_FLAG),
+        InstructionType.JNS: lambda flags: ~is_set(flags, SIGN_FLAG),
+        InstructionType.JP: lambda flags: is_set(flags, PARITY_FLAG),
+        InstructionType.JNP: lambda flags: ~is_set(flags, PARITY_FLAG),
+        InstructionType.JL: is_less,
+        InstructionType.JGE: lambda flags: ~is_less(flags),
+        InstructionType.JLE: lambda flags: is_set(flags, ZERO_FLAG) | is_less(flags),
+        InstructionType.JG: lambda flags: ~(is_set(flags, ZERO_FLAG) | is_less(flags)),
+    }
+
+
+def create_unsupported_vectorized_operation(message: str) -> Callable[[LaneMask], None]:
+    execute_unsupported: Callable[[], None] = create_unsupported_operation(message)
+    return lambda lane_mask: execute_unsupported()
+
+
+class VectorizedProcessor8086:
+    # Runs one program on many register files at once, lane i of every array is one independent 8086.
+    # Lanes that branch differently are kept apart by running the lowest pending IP each step with the other lanes masked off.
+    def __init__(self, num_lanes: int):
+        if np is None:
+            raise ImportError('VectorizedProcessor8086 needs numpy, install it with pip install numpy')
+        self.num_lanes: int = num_lanes
+        self.registers: np.ndarray = np.zeros((len(register_file_register_names), num_lanes), dtype=np.uint16)
+        self.flags: np.ndarray = np.zeros(num_lanes, dtype=np.uint16)
+        self.instruction_ptrs: np.ndarray = np.zeros(num_lanes, dtype=np.int64)
+        self.instruction_counts: np.ndarray = np.zeros(num_lanes, dtype=np.int64)
+        self.parity_flags: np.ndarray = np.array(parity_flag_values, dtype=np.uint16)
+        self.conditional_jump_conditions: dict[InstructionType, Callable[[np.ndarray], np.ndarray]] = create_vectorized_conditional_jump_conditions()
+
+        self.operation_stream: Optional[Union[list[Operation], DecodedProgram]] = None
+        self.program_end_address: int = 0
+        self.address_to_operation_index: array = array('l')
+        self.operation_num_bytes: array = array('B')
+        self.compiled_operations: list[Callable[[LaneMask], None]] = []
+
+    def load_operation_stream(self, operation_stream: Union[list[Operation], DecodedProgram]):
+        self.operation_stream = operation_stream
+        self.operation_num_bytes = array('B', (operation.num_bytes for operation in operation_stream))
+        self.program_end_address = sum(self.operation_num_bytes)
+
+        self.address_to_operation_index = array('l', [-1]) * (self.program_end_address + 1)
+        address: int = 0
+        for operation_index, num_bytes in enumerate(self.operation_num_bytes):
+            self.address_to_operation_index[address] = operation_index
+            address += num_bytes
+        self.address_to_operation_index[address] = len(operation_stream)
+
+        self.compiled_operations = []
+        address = 0
+        for operation in operation_stream:
+            address += operation.num_bytes
+            try:
+                compiled_operation: Callable[[LaneMask], None] = self.compile_operation(operation, address)
+            except SimulationError as error:
+                # like the scalar simulator only lanes that reach an unsupported operation fail, not every program containing one
+                compiled_operation = create_unsupported_vectorized_operation(str(error))
+            self.compiled_operations.append(compiled_operation)
+        self.instruction_ptrs[:] = 0
+        self.instruction_counts[:] = 0
+
+    def get_register_values(self, register_mnemonic: RegisterMnemonic) -> np.ndarray:
+        register_field: RegisterField = register_mnemonic_to_register_field_map[register_mnemonic]
+        return (self.registers[register_field.index] >> register_field.shift) & register_field.mask
+
+    def set_register_values(self, register_mnemonic: RegisterMnemonic, values: Union[np.ndarray, int]):
+        register_field: RegisterField = register_mnemonic_to_register_field_map[register_mnemonic]
+        values = (np.asarray(values, dtype=np.int64) & register_field.mask) << register_field.shift
+        self.registers[register_field.index] = (self.registers[register_field.index] & register_field.keep_mask) | values
+
+    def compile_operand_reader(self, operation: Operation, operand_index: int, width_mask: int) -> Callable[[LaneMask], Union[np.ndarray, int]]:
+        operand = operation.operand_one if operand_index == 0 else operation.operand_two
+        if operand.operand_type.is_immediate_value():
+            immediate_value: int = get_immediate_value(operand, width_mask)
+            return lambda lane_mask: immediate_value
+        if operand.operand_type != OperandType.REGISTER:
+            raise SimulationError(f'Only register and immediate operands are vectorized: {operation}')
+        register_field: RegisterField = register_mnemonic_to_register_field_map[operand.value]
+        index: int = register_field.index
+        shift: int = register_field.shift
+        mask: int = register_field.mask
+
+        def read_register(lane_mask: LaneMask) -> np.ndarray:
+            values: np.ndarray = self.registers[index].astype(np.int32) if lane_mask is None else self.registers[index, lane_mask].astype(np.int32)
+            return (values >> shift) & mask if shift or mask != 0xffff else values
+        return read_register
+
+    def compile_register_writer(self, operation: Operation) -> Callable[[LaneMask, np.ndarray], None]:
+        if operation.operand_one.operand_type != OperandType.REGISTER:
+            raise SimulationError(f'Only register destinations are vectorized: {operation}')
+        register_field: RegisterField = register_mnemonic_to_register_field_map[operation.operand_one.value]
+        index: int = register_field.index
+        shift: int = register_field.shift
+        mask: int = register_field.mask
+        keep_mask: int = register_field.keep_mask
+
+        def write_register(lane_mask: LaneMask, values: np.ndarray):
+            lanes = slice(None) if lane_mask is None else lane_mask
+            new_values: np.ndarray = (values & mask) << shift
+            if keep_mask:
+                new_values |= self.registers[index, lanes] & keep_mask
+            self.registers[index, lanes] = new_values
+        return write_register
+
+    def compute_flags(self, is_add: bool, dst: np.ndarray, src: Union[np.ndarray, int], result: np.ndarray, width_mask: int) -> np.ndarray:
+        # the same flag rules as the scalar simulator's lazy flags, worked out for every lane at once
+        sign_bit: int = (width_mask >> 1) + 1
+        masked_result: np.ndarray = result & width_mask
+        flags: np.ndarray = self.parity_flags[masked_result & 0xff]
+        flags = flags | np.where(masked_result == 0, ZERO_FLAG, 0) | np.where(masked_result & sign_bit, SIGN_FLAG, 0)
+        flags |= np.where((dst ^ src ^ result) & 0x10, AUXILIARY_CARRY_FLAG, 0).astype(np.uint16)
+        if is_add:
+            flags |= np.where(result > width_mask, CARRY_FLAG, 0).astype(np.uint16)
+            flags |= np.where((dst ^ result) & (src ^ result) & sign_bit, OVERFLOW_FLAG, 0).astype(np.uint16)
+        else:
+            flags |= np.where(result < 0, CARRY_FLAG, 0).astype(np.uint16)
+            flags |= np.where((dst ^ src) & (dst ^ result) & sign_bit, OVERFLOW_FLAG, 0).astype(np.uint16)
+        return flags.astype(np.uint16)
+
+    def create_jump(self, target_address: int, operation: Operation) -> Callable[[LaneMask, np.ndarray], None]:
+        is_valid_target: bool = 0 <= target_address < len(self.address_to_operation_index) and self.address_to_operation_index[target_address] >= 0
+
+        def jump(lane_mask: LaneMask, taken: np.ndarray):
+            if not taken.any():
+                return
+            if not is_valid_target:
+                raise SimulationError(f'Jump target {target_address} of {operation} is not an instruction in the program')
+            if lane_mask is None:
+                self.instruction_ptrs[taken] = target_address
+            else:
+                lanes: np.ndarray = np.flatnonzero(lane_mask)
+                self.instruction_ptrs[lanes[taken]] = target_address
+        return jump
+
+    def compile_operation(self, operation: Operation, next_address: int) -> Callable[[LaneMask], None]:
+        if operation.instruction_type == InstructionType.MOV:
+            width_mask: int = get_operation_width_mask(operation)
+            write_dst: Callable[[LaneMask, np.ndarray], None] = self.compile_register_writer(operation)
+            read_src: Callable[[LaneMask], Union[np.ndarray, int]] = self.compile_operand_reader(operation, 1, width_mask)
+
+            def execute_mov(lane_mask: LaneMask):
+                src = read_src(lane_mask)
+                write_dst(lane_mask, np.full(self.num_lanes if lane_mask is None else int(lane_mask.sum()), src, dtype=np.int32) if isinstance(src, int) else src)
+            return execute_mov
+
+        elif operation.instruction_type in [InstructionType.ADD, InstructionType.SUB, InstructionType.CMP]:
+            width_mask: int = get_operation_width_mask(operation)
+            read_dst: Callable[[LaneMask], np.ndarray] = self.compile_operand_reader(operation, 0, width_mask)
+            write_dst: Callable[[LaneMask, np.ndarray], None] = self.compile_register_writer(operation)
+            read_src: Callable[[LaneMask], Union[np.ndarray, int]] = self.compile_operand_reader(operation, 1, width_mask)
+            is_add: bool = operation.instruction_type == InstructionType.ADD
+            writes_result: bool = operation.instruction_type != InstructionType.CMP
+
+            def execute_add_sub_cmp(lane_mask: LaneMask):
+                dst: np.ndarray = read_dst(lane_mask)
+                src: Union[np.ndarray, int] = read_src(lane_mask)
+                result: np.ndarray = dst + src if is_add else dst - src
+                flags: np.ndarray = self.compute_flags(is_add, dst, src, result, width_mask)
+                if lane_mask is None:
+                    self.flags[:] = flags
+                else:
+                    self.flags[lane_mask] = flags
+                if writes_result:
+                    write_dst(lane_mask, result)
+            return execute_add_sub_cmp
+
+        elif operation.instruction_type in self.conditional_jump_conditions:
+            condition: Callable[[np.ndarray], np.ndarray] = self.conditional_jump_conditions[operation.instruction_type]
+            jump: Callable[[LaneMask, np.ndarray], None] = self.create_jump(next_address + operation.operand_one.value, operation)
+
+            def execute_conditional_jump(lane_mask: LaneMask):
+                jump(lane_mask, condition(self.flags if lane_mask is None else self.flags[lane_mask]))
+            return execute_conditional_jump
+
+        elif operation.instruction_type in [InstructionType.LOOP, InstructionType.LOOPE, InstructionType.LOOPNE, InstructionType.JCXZ]:
+            instruction_type: InstructionType = operation.instruction_type
+            jump: Callable[[LaneMask, np.ndarray], None] = self.create_jump(next_address + operation.operand_one.value, operation)
+
+            def execute_loop_or_jcxz(lane_mask: LaneMask):
+                lanes = slice(None) if lane_mask is None else lane_mask
+                count: np.ndarray = self.registers[cx_register_index, lanes]
+                if instruction_type == InstructionType.JCXZ:
+                    jump(lane_mask, count == 0)
+                    return
+                count = count - np.uint16(1)
+                self.registers[cx_register_index, lanes] = count
+                taken: np.ndarray = count != 0
+                if instruction_type != InstructionType.LOOP:
+                    is_zero: np.ndarray = (self.flags[lanes] & ZERO_FLAG) != 0
+                    taken &= is_zero if instruction_type == InstructionType.LOOPE else ~is_zero
+                jump(lane_mask, taken)
+            return execute_loop_or_jcxz
+
+        raise SimulationError(f'Have not vectorized {operation.instruction_type} yet')
+
+    def simulate(self, max_steps: Optional[int] = None) -> int:
+        # each step runs one operation for every lane sitting at the lowest unfinished IP, returns the number of steps
+        num_steps: int = 0
+        end_address: int = self.program_end_address
+        while max_steps is None or num_steps < max_steps:
+            running: np.ndarray = self.instruction_ptrs != end_address
+            if not running.any():
+                break
+            address: int = int(self.instruction_ptrs[running].min())
+            operation_index: int = self.address_to_operation_index[address] if address < len(self.address_to_operation_index) else -1
+            if operation_index < 0:
+                raise SimulationError(f'Lanes reached address {address}, which is not the start of an instruction')
+
+            lane_mask: np.ndarray = self.instruction_ptrs == address
+            all_lanes: bool = bool(lane_mask.all())
+            if all_lanes:
+                self.instruction_ptrs += self.operation_num_bytes[operation_index]
+                self.instruction_counts += 1
+            else:
+                self.instruction_ptrs[lane_mask] += self.operation_num_bytes[operation_index]
+                self.instruction_counts[lane_mask] += 1
+            self.compiled_operations[operation_index](None if all_lanes else lane_mask)
+            num_steps += 1
+        return num_steps
+
+    def get_lane_registers(self, lane: int) -> array:
+        return array('H', self.registers[:, lane].tolist())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate one 8086 binary from many random starting register states at once')
+    parser.add_argument('file_name')
+    parser.add_argument('--lanes', type=int, default=4096)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--randomize', action='append', default=[], help='register to start with random values in every lane, may be repeated')
+    parser.add_argument('--max-steps', type=int, default=None)
+    parser.add_argument('--verify-lanes', type=int, default=0, help='check this many lanes against the scalar simulator')
+    args = parser.parse_args()
+
+    with open_mapped_file(args.file_name) as file_bytes:
+        program: DecodedProgram = DecodedProgram.from_operations(iter_decode(file_bytes))
+
+    processor: VectorizedProcessor8086 = VectorizedProcessor8086(args.lanes)
+    random_generator = np.random.default_rng(args.seed)
+    for register_name in args.randomize:
+        register_mnemonic: RegisterMnemonic = RegisterMnemonic[register_name.upper()]
+        processor.set_register_values(register_mnemonic, random_generator.integers(0, register_mnemonic_to_register_field_map[register_mnemonic].mask + 1,
+                                                                                   args.lanes))
+    initial_registers: np.ndarray = processor.registers.copy()
+    processor.load_operation_stream(program)
+
+    start: float = time.perf_counter()
+    num_steps: int = processor.simulate(args.max_steps)
+    seconds: float = time.perf_counter() - start
+    num_instructions: int = int(processor.instruction_counts.sum())
+    num_distinct_states: int = len(np.unique(processor.registers, axis=1).T)
+    print(f'{args.lanes} lanes, {num_steps} steps, {num_instructions} instructions in {seconds:.3f}s, {num_instructions / seconds:.0f} instructions/s')
+    print(f'{num_distinct_states} distinct final register states')
+
+    for lane in range(min(args.verify_lanes, args.lanes)):
+        scalar_processor: Processor8086 = Processor8086()
+        scalar_processor.registers = array('H', initial_registers[:, lane].tolist())
+        scalar_processor.load_operation_stream(program)
+        # a step only runs the lanes at the lowest IP, so with --max-steps lanes stop after different instruction counts and each is checked at its own
+        scalar_processor.simulate(int(processor.instruction_counts[lane]))
+        if scalar_processor.registers != processor.get_lane_registers(lane) or scalar_processor.get_flags_value() != int(processor.flags[lane]) or \
+                scalar_processor.instruction_ptr != int(processor.instruction_ptrs[lane]):
+            raise SimulationError(f'Lane {lane} does not match the scalar simulator')
+    if args.verify_lanes:
+        print(f'{min(args.verify_lanes, args.lanes)} lanes match the scalar simulator')
+
+
+if __name__ == '__main__':
+    main()